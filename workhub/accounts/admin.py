@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Profile, FreelancerProfile, ClientProfile
+from .models import Profile, FreelancerProfile, ClientProfile, UserStats
 
 admin.site.register(Profile)
 admin.site.register(FreelancerProfile)
 admin.site.register(ClientProfile)
+admin.site.register(UserStats)
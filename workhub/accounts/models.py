@@ -36,4 +36,44 @@ class ClientProfile(models.Model):
     profile_picture = models.ImageField(upload_to="profile_pics/")
 
     def __str__(self):
-        return f"Client: {self.first_name} {self.last_name} - {self.company_name} ({self.profile.user.username})"
\ No newline at end of file
+        return f"Client: {self.first_name} {self.last_name} - {self.company_name} ({self.profile.user.username})"
+
+class UserStats(models.Model):
+    """Denormalized dashboard counters, refreshed from the job, application and payment write paths"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    
+    # as a client
+    posted_jobs = models.PositiveIntegerField(default=0)
+    posted_completed = models.PositiveIntegerField(default=0)
+    posted_in_progress = models.PositiveIntegerField(default=0)
+    applications_received = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_payments = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    # as a freelancer
+    applications_sent = models.PositiveIntegerField(default=0)
+    assigned_completed = models.PositiveIntegerField(default=0)
+    assigned_in_progress = models.PositiveIntegerField(default=0)
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    STAT_FIELDS = [
+        'posted_jobs', 'posted_completed', 'posted_in_progress', 'applications_received',
+        'total_spent', 'pending_payments', 'applications_sent', 'assigned_completed',
+        'assigned_in_progress', 'total_earnings', 'pending_earnings',
+    ]
+    
+    def __str__(self):
+        return f"Stats for {self.user.username}"
+    
+    def update_stats(self):
+        """Recompute all counters for this user"""
+        from .stats import compute_user_stats
+        for field, value in compute_user_stats(self.user).items():
+            setattr(self, field, value)
+        self.save()
+    
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.STAT_FIELDS}
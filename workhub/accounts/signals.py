@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from jobs.models import Job, Application
+from payments.models import Payment
+from payments import outbox
+from payments.signals import payments_changed
+from .models import UserStats
+
+
+def refresh_user_stats(*user_ids):
+    """Recompute the UserStats rows of the given users inside the current transaction"""
+    if not getattr(settings, 'DASHBOARD_USE_USER_STATS', False):
+        return
+    
+    for user_id in {user_id for user_id in user_ids if user_id}:
+        user_stats, created = UserStats.objects.get_or_create(user_id=user_id)
+        user_stats.update_stats()
+
+
+def queue_stats_refresh(*user_ids):
+    """Have the outbox worker recompute these users' stats after the transaction commits"""
+    if not getattr(settings, 'DASHBOARD_USE_USER_STATS', False):
+        return
+    
+    user_ids = sorted({user_id for user_id in user_ids if user_id})
+    if user_ids:
+        outbox.emit('user_stats.refresh', user_ids=user_ids)
+
+
+@outbox.handler('user_stats.refresh')
+def refresh_queued_stats(payloads):
+    """Recompute each user once however many events in the batch name them"""
+    refresh_user_stats(*{user_id for payload in payloads for user_id in payload['user_ids']})
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def job_changed(sender, instance, **kwargs):
+    """Job counters change for the client and the assigned freelancer"""
+    queue_stats_refresh(instance.client_id, instance.freelancer_id)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def application_changed(sender, instance, **kwargs):
+    """Application counters change for the freelancer and the job's client"""
+    if not getattr(settings, 'DASHBOARD_USE_USER_STATS', False):
+        return
+    
+    # The views that write applications have loaded the job already
+    if Application.job.is_cached(instance):
+        client_id = instance.job.client_id
+    else:
+        client_id = Job.objects.filter(pk=instance.job_id).values_list('client_id', flat=True).first()
+    queue_stats_refresh(instance.freelancer_id, client_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    """Payment totals change for both sides of the payment"""
+    if instance.payment_type == 'job_payment':
+        queue_stats_refresh(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(payments_changed)
+def payments_bulk_changed(sender, payments, **kwargs):
+    """Same as payment_changed, for payments changed without save()"""
+    user_ids = []
+    for payment in payments:
+        if payment.payment_type == 'job_payment':
+            user_ids += [payment.from_user_id, payment.to_user_id]
+    queue_stats_refresh(*user_ids)
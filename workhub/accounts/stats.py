@@ -0,0 +1,66 @@
+"""Dashboard statistics computed with conditional aggregates"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F, Func, OuterRef, Q, Subquery, Sum
+from jobs.models import Job, Application
+from payments import fx, ledger
+from payments.models import Payment
+
+TOTAL_FIELDS = ['total_spent', 'pending_payments', 'total_earnings', 'pending_earnings']
+
+
+def _count_of(queryset):
+    """Scalar subquery counting the rows of a queryset"""
+    counted = queryset.order_by().annotate(total=Func(F('id'), function='COUNT')).values('total')
+    return Subquery(counted)
+
+
+def compute_user_stats(user):
+    """Compute every dashboard counter for a user in two queries.
+    
+    The first query counts jobs and applications, the second sums the user's
+    job payments per currency. Each currency's sums are converted once into
+    the user's wallet currency. Counters for both roles are returned.
+    """
+    user_ref = OuterRef('pk')
+    counters = {
+        'posted_jobs': Job.objects.filter(client=user_ref),
+        'posted_completed': Job.objects.filter(client=user_ref, status='completed'),
+        'posted_in_progress': Job.objects.filter(client=user_ref, status='in_progress'),
+        'applications_received': Application.objects.filter(job__client=user_ref),
+        'applications_sent': Application.objects.filter(freelancer=user_ref),
+        'assigned_completed': Job.objects.filter(freelancer=user_ref, status='completed'),
+        'assigned_in_progress': Job.objects.filter(freelancer=user_ref, status='in_progress'),
+    }
+    # Prefixed so the aliases don't clash with reverse relations on User
+    counts = User.objects.filter(pk=user.pk).annotate(**{
+        f'stat_{name}': _count_of(queryset) for name, queryset in counters.items()
+    }).values(*[f'stat_{name}' for name in counters]).get()
+    
+    groups = Payment.objects.filter(
+        Q(from_user=user) | Q(to_user=user),
+        payment_type='job_payment',
+    ).values('currency').annotate(
+        total_spent=Sum('amount', filter=Q(from_user=user, status='completed')),
+        pending_payments=Sum('amount', filter=Q(from_user=user, status='on_hold')),
+        total_earnings=Sum('amount', filter=Q(to_user=user, status='completed')),
+        pending_earnings=Sum('amount', filter=Q(to_user=user, status='on_hold')),
+    ).order_by()
+    
+    stats = {name: counts[f'stat_{name}'] or 0 for name in counters}
+    currency = ledger.wallet_currency(user)
+    for key in TOTAL_FIELDS:
+        stats[key] = fx.convert_totals({group['currency']: group[key] for group in groups}, currency)
+    return stats
+
+
+def get_dashboard_stats(user):
+    """Return dashboard counters, from the UserStats row when it is enabled"""
+    if not getattr(settings, 'DASHBOARD_USE_USER_STATS', False):
+        return compute_user_stats(user)
+    
+    from .models import UserStats
+    user_stats, created = UserStats.objects.get_or_create(user=user)
+    if created:
+        user_stats.update_stats()
+    return user_stats.as_dict()
@@ -1,3 +1,82 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from jobs.models import Application, Job
+from payments import escrow, ledger, outbox
+from payments.models import OutboxEvent
+from .models import UserStats
+from .stats import compute_user_stats, get_dashboard_stats
 
-# Create your tests here.
+
+def make_job(client, title, **fields):
+    return Job.objects.create(
+        title=title, description=title, category='web_dev', budget=Decimal('100.00'),
+        deadline=date.today() + timedelta(days=30), client=client, **fields,
+    )
+
+
+@override_settings(DASHBOARD_USE_USER_STATS=True)
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        ledger.adjust_balance(self.client_user, '1000.00')
+
+    def test_stats_follow_the_outbox(self):
+        # Created before any activity, so every counter below comes from the outbox
+        get_dashboard_stats(self.client_user)
+        get_dashboard_stats(self.freelancer)
+
+        open_job = make_job(self.client_user, 'Open')
+        Application.objects.create(
+            job=open_job, freelancer=self.freelancer, cover_letter='Hi',
+            proposed_budget=Decimal('90.00'), estimated_duration='1 week',
+        )
+        paid_job = make_job(self.client_user, 'Paid', freelancer=self.freelancer, status='completed')
+        escrow.release(escrow.hold(paid_job, self.client_user, self.freelancer, Decimal('250.00')))
+        held_job = make_job(self.client_user, 'Held', freelancer=self.freelancer, status='in_progress')
+        escrow.hold(held_job, self.client_user, self.freelancer, Decimal('80.00'))
+
+        while outbox.drain():
+            pass
+
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+        for user in (self.client_user, self.freelancer):
+            self.assertEqual(UserStats.objects.get(user=user).as_dict(), compute_user_stats(user))
+
+        stats = get_dashboard_stats(self.client_user)
+        self.assertEqual((stats['posted_jobs'], stats['applications_received']), (3, 1))
+        self.assertEqual((stats['total_spent'], stats['pending_payments']), (Decimal('250.00'), Decimal('80.00')))
+        stats = get_dashboard_stats(self.freelancer)
+        self.assertEqual((stats['assigned_completed'], stats['assigned_in_progress']), (1, 1))
+        self.assertEqual((stats['total_earnings'], stats['pending_earnings']), (Decimal('250.00'), Decimal('80.00')))
+
+
+class ApplicationSignalTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        self.job = make_job(self.client_user, 'Open')
+
+    def apply(self, job):
+        return Application.objects.create(
+            job=job, freelancer=self.freelancer, cover_letter='Hi',
+            proposed_budget=Decimal('90.00'), estimated_duration='1 week',
+        )
+
+    @override_settings(DASHBOARD_USE_USER_STATS=False)
+    def test_no_queries_when_stats_are_off(self):
+        with self.assertNumQueries(1):
+            self.apply(self.job)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @override_settings(DASHBOARD_USE_USER_STATS=True)
+    def test_loaded_job_is_not_read_again(self):
+        with self.assertNumQueries(2):  # the application and its outbox event
+            self.apply(self.job)
+
+        self.assertEqual(
+            OutboxEvent.objects.get().payload['user_ids'],
+            sorted([self.client_user.id, self.freelancer.id]),
+        )
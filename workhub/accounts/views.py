@@ -5,11 +5,11 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.middleware.csrf import get_token
 from .models import Profile, FreelancerProfile, ClientProfile
+from .stats import get_dashboard_stats
 from jobs.models import Application, Job
 from django.http import JsonResponse
 from django.urls import reverse
 from payments.models import Wallet
-from django.db import models
 
 def register(request):
     if request.user.is_authenticated:
@@ -140,23 +140,7 @@ def dashboard(request):
             return redirect("setup_profile")
         
         # Calculate freelancer statistics
-        total_applications = request.user.application_set.count()
-        completed_jobs = request.user.assigned_jobs.filter(status='completed').count()
-        in_progress_jobs = request.user.assigned_jobs.filter(status='in_progress').count()
-        
-        # Get earnings (completed payments)
-        from payments.models import Payment
-        total_earnings = Payment.objects.filter(
-            to_user=request.user,
-            status='completed',
-            payment_type='job_payment'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
-        
-        pending_earnings = Payment.objects.filter(
-            to_user=request.user,
-            status='on_hold',
-            payment_type='job_payment'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
+        stats = get_dashboard_stats(request.user)
         
         # Split skills into a list
         skills_list = []
@@ -167,12 +151,12 @@ def dashboard(request):
             'profile': profile,
             'freelancer_profile': freelancer_profile,
             'skills_list': skills_list,
-            'total_applications': total_applications,
-            'completed_jobs': completed_jobs,
-            'in_progress_jobs': in_progress_jobs,
+            'total_applications': stats['applications_sent'],
+            'completed_jobs': stats['assigned_completed'],
+            'in_progress_jobs': stats['assigned_in_progress'],
             'wallet': wallet,
-            'total_earnings': total_earnings,
-            'pending_earnings': pending_earnings,
+            'total_earnings': stats['total_earnings'],
+            'pending_earnings': stats['pending_earnings'],
         }
         
         return render(request, "accounts/freelancer_dashboard.html", context)
@@ -183,39 +167,18 @@ def dashboard(request):
             return redirect("setup_profile")
         
         # Calculate client statistics
-        posted_jobs_count = request.user.posted_jobs.count()
-        completed_jobs_count = request.user.posted_jobs.filter(status='completed').count()
-        in_progress_jobs_count = request.user.posted_jobs.filter(status='in_progress').count()
-        
-        # Calculate total applications received on user's jobs
-        total_applications = 0
-        for job in request.user.posted_jobs.all():
-            total_applications += job.applications.count()
-        
-        # Calculate total spent and pending payments
-        from payments.models import Payment
-        total_spent = Payment.objects.filter(
-            from_user=request.user,
-            status='completed',
-            payment_type='job_payment'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
-        
-        pending_payments = Payment.objects.filter(
-            from_user=request.user,
-            status='on_hold',
-            payment_type='job_payment'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
+        stats = get_dashboard_stats(request.user)
         
         context = {
             'profile': profile,
             'client_profile': client_profile,
-            'posted_jobs_count': posted_jobs_count,
-            'completed_jobs_count': completed_jobs_count,
-            'in_progress_jobs_count': in_progress_jobs_count,
-            'total_applications': total_applications,
+            'posted_jobs_count': stats['posted_jobs'],
+            'completed_jobs_count': stats['posted_completed'],
+            'in_progress_jobs_count': stats['posted_in_progress'],
+            'total_applications': stats['applications_received'],
             'wallet': wallet,
-            'total_spent': total_spent,
-            'pending_payments': pending_payments,
+            'total_spent': stats['total_spent'],
+            'pending_payments': stats['pending_payments'],
         }
         
         return render(request, "accounts/client_dashboard.html", context)
@@ -46,10 +46,11 @@ class ApplicationAdmin(admin.ModelAdmin):
 
 @admin.register(WorkSubmission)
 class WorkSubmissionAdmin(admin.ModelAdmin):
-    list_display = ['job', 'freelancer', 'status', 'submitted_at', 'reviewed_at', 'get_files_count']
+    list_display = ['job', 'freelancer', 'status', 'submitted_at', 'reviewed_at', 'files_count']
     list_filter = ['status', 'submitted_at', 'reviewed_at']
+    list_select_related = ['job', 'freelancer']
     search_fields = ['job__title', 'freelancer__username', 'description']
-    readonly_fields = ['submitted_at', 'get_files_count', 'get_total_files_size']
+    readonly_fields = ['submitted_at', 'files_count', 'get_total_files_size']
     date_hierarchy = 'submitted_at'
     
     fieldsets = (
@@ -60,7 +61,7 @@ class WorkSubmissionAdmin(admin.ModelAdmin):
             'fields': ('status', 'client_feedback', 'reviewed_at')
         }),
         ('File Information', {
-            'fields': ('get_files_count', 'get_total_files_size'),
+            'fields': ('files_count', 'get_total_files_size'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -69,12 +70,8 @@ class WorkSubmissionAdmin(admin.ModelAdmin):
         }),
     )
     
-    def get_files_count(self, obj):
-        return obj.get_files_count()
-    get_files_count.short_description = 'Files Count'
-    
     def get_total_files_size(self, obj):
-        return f"{obj.get_total_files_size() / (1024*1024):.2f} MB"
+        return f"{obj.total_size / (1024*1024):.2f} MB"
     get_total_files_size.short_description = 'Total Files Size'
 
 
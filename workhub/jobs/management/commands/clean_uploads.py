@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from jobs.models import UploadSession
+from jobs.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = 'Delete upload sessions that were abandoned or already attached'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age after which an unattached upload is abandoned')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+        
+        count = 0
+        for upload in stale.iterator(chunk_size=500):
+            discard_upload(upload)
+            count += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} upload sessions'))
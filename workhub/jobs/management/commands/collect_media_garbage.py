@@ -0,0 +1,42 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from workhub.storage import CAS_PREFIX, content_storage, reference_counts
+
+
+class Command(BaseCommand):
+    help = 'Delete stored files that no work file or message attachment references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        storage = content_storage()
+        counts = reference_counts()
+        grace = getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24) * 3600
+        cutoff = time.time() - grace
+        
+        root = storage.path(CAS_PREFIX)
+        stored = removed = freed = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                stored += 1
+                
+                # Recent files may belong to a row that is not committed yet
+                if name in counts or os.path.getmtime(path) > cutoff:
+                    continue
+                
+                removed += 1
+                freed += os.path.getsize(path)
+                if not options['dry_run']:
+                    os.remove(path)
+        
+        references = sum(count for name, count in counts.items() if name.startswith(f'{CAS_PREFIX}/'))
+        shared = sum(1 for name, count in counts.items() if name.startswith(f'{CAS_PREFIX}/') and count > 1)
+        self.stdout.write(f'{stored} stored files, {references} references, {shared} shared by more than one row')
+        
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} unreferenced files ({freed} bytes)'))
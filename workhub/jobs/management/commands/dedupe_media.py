@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from workhub.storage import CAS_PREFIX, content_fields, content_storage
+
+
+class Command(BaseCommand):
+    help = 'Move files saved before content-addressed storage into it, one copy per content'
+
+    def handle(self, *args, **options):
+        storage = content_storage()
+        moved = 0
+        legacy_names = set()
+        
+        for model, field in content_fields():
+            rows = (
+                model._default_manager
+                .exclude(Q(**{field.name: ''}) | Q(**{f'{field.name}__isnull': True}))
+                .exclude(**{f'{field.name}__startswith': f'{CAS_PREFIX}/'})
+                .values_list('pk', field.name)
+            )
+            for pk, name in rows.iterator(chunk_size=500):
+                if not storage.exists(name):
+                    self.stdout.write(self.style.WARNING(f'{model._meta.label} {pk}: {name} is missing'))
+                    continue
+                
+                with storage.open(name) as content:
+                    new_name = storage.save(name, content)
+                
+                # update() so auto_now fields and signals are left alone
+                model._default_manager.filter(pk=pk).update(**{field.name: new_name})
+                legacy_names.add(name)
+                moved += 1
+        
+        # Only remove the old copies once every row points at the new ones
+        for name in legacy_names:
+            storage.delete(name)
+        
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} files, removed {len(legacy_names)} old copies'))
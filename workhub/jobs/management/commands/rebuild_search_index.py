@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from jobs.models import Job, JobSearchTerm
+from jobs.search import index_job
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the job board search index from scratch'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            JobSearchTerm.objects.all().delete()
+            count = 0
+            for job in Job.objects.filter(status='open').iterator(chunk_size=500):
+                index_job(job)
+                count += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} open jobs'))
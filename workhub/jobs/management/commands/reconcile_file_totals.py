@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from jobs.models import WorkSubmission, WorkFile
+
+
+class Command(BaseCommand):
+    help = 'Recompute files_count and total_size on work submissions from their files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report submissions whose totals are wrong')
+
+    def handle(self, *args, **options):
+        files = WorkFile.objects.filter(work_submission=OuterRef('pk')).order_by().values('work_submission')
+        actual_count = Coalesce(Subquery(files.annotate(c=Count('id')).values('c'), output_field=IntegerField()), 0)
+        actual_size = Coalesce(Subquery(files.annotate(s=Sum('file_size')).values('s'), output_field=IntegerField()), 0)
+        
+        drifted = (
+            WorkSubmission.objects
+            .annotate(actual_count=actual_count, actual_size=actual_size)
+            .filter(~Q(files_count=F('actual_count')) | ~Q(total_size=F('actual_size')))
+        )
+        
+        if options['dry_run']:
+            for submission in drifted.values('id', 'files_count', 'actual_count', 'total_size', 'actual_size'):
+                self.stdout.write(
+                    f"Submission {submission['id']}: {submission['files_count']} files / {submission['total_size']} bytes, "
+                    f"expected {submission['actual_count']} / {submission['actual_size']}"
+                )
+            return
+        
+        # One UPDATE for every drifted row
+        fixed = WorkSubmission.objects.filter(
+            id__in=drifted.values('id')
+        ).update(files_count=actual_count, total_size=actual_size)
+        
+        self.stdout.write(self.style.SUCCESS(f'Fixed totals on {fixed} work submissions'))
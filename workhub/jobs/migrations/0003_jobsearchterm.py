@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_alter_job_status_worksubmission_workfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='jobs.job')),
+            ],
+            options={
+                'unique_together': {('term', 'job')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0003_jobsearchterm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['-created_at', '-id'], name='job_open_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['client', 'status'], name='job_client_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['freelancer', 'status'], name='job_freelancer_status_idx'),
+        ),
+    ]
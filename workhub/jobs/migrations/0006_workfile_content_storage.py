@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:51
+
+import workhub.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0005_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workfile',
+            name='file',
+            field=models.FileField(storage=workhub.storage.content_storage, upload_to='work_submissions/%Y/%m/%d/'),
+        ),
+    ]
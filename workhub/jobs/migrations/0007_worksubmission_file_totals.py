@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:52
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_file_totals(apps, schema_editor):
+    WorkSubmission = apps.get_model('jobs', 'WorkSubmission')
+    WorkFile = apps.get_model('jobs', 'WorkFile')
+    
+    files = WorkFile.objects.filter(work_submission=OuterRef('pk')).order_by().values('work_submission')
+    WorkSubmission.objects.update(
+        files_count=Coalesce(Subquery(files.annotate(c=Count('id')).values('c'), output_field=IntegerField()), 0),
+        total_size=Coalesce(Subquery(files.annotate(s=Sum('file_size')).values('s'), output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0006_workfile_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worksubmission',
+            name='files_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worksubmission',
+            name='total_size',
+            field=models.PositiveBigIntegerField(default=0, help_text='Total size of all files in bytes'),
+        ),
+        migrations.RunPython(backfill_file_totals, migrations.RunPython.noop),
+    ]
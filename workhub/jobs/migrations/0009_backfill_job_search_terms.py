@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:40
+
+from django.db import migrations
+
+
+def backfill_search_terms(apps, schema_editor):
+    from jobs.search import term_weights
+    
+    Job = apps.get_model('jobs', 'Job')
+    JobSearchTerm = apps.get_model('jobs', 'JobSearchTerm')
+    
+    # Jobs created before the index existed were never indexed
+    JobSearchTerm.objects.all().delete()
+    rows = []
+    for job in Job.objects.filter(status='open').iterator():
+        rows.extend(
+            JobSearchTerm(term=term, job_id=job.id, weight=weight)
+            for term, weight in term_weights(job).items()
+        )
+    JobSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0008_job_currency'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
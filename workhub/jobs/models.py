@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
+from payments.currency import CURRENCY_CHOICES, DEFAULT_CURRENCY
+from django.conf import settings
 import os
+import uuid
+from workhub.storage import content_storage
 
 class Job(models.Model):
     CATEGORY_CHOICES = [
@@ -25,6 +29,8 @@ class Job(models.Model):
     description = models.TextField()
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     budget = models.DecimalField(max_digits=10, decimal_places=2)
+    # Budget and proposed budgets are in this currency
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
     deadline = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posted_jobs')
@@ -37,6 +43,16 @@ class Job(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Job board: open jobs, newest first
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(status='open'), name='job_open_created_idx'),
+            models.Index(fields=['client', 'status'], name='job_client_status_idx'),
+            models.Index(fields=['freelancer', 'status'], name='job_freelancer_status_idx'),
+        ]
+
+def job_detail_cache_key(job_id):
+    """Cache key for the public job detail payload served to the job board"""
+    return f'job_detail:{job_id}'
 
 class Application(models.Model):
     STATUS_CHOICES = [
@@ -76,25 +92,27 @@ class WorkSubmission(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     reviewed_at = models.DateTimeField(null=True, blank=True)
     client_feedback = models.TextField(blank=True, help_text="Client's feedback on the submission")
+    # Kept up to date by jobs.signals when work files are added or removed
+    files_count = models.PositiveIntegerField(default=0)
+    total_size = models.PositiveBigIntegerField(default=0, help_text="Total size of all files in bytes")
     
     def __str__(self):
         return f"Work submission for {self.job.title} by {self.freelancer.username}"
     
     def get_total_files_size(self):
-        """Calculate total size of all uploaded files"""
-        total_size = sum(file.file_size for file in self.work_files.all())
-        return total_size
+        """Total size of all uploaded files"""
+        return self.total_size
     
     def get_files_count(self):
-        """Get count of uploaded files"""
-        return self.work_files.count()
+        """Number of uploaded files"""
+        return self.files_count
     
     class Meta:
         ordering = ['-submitted_at']
 
 class WorkFile(models.Model):
     work_submission = models.ForeignKey(WorkSubmission, on_delete=models.CASCADE, related_name='work_files')
-    file = models.FileField(upload_to='work_submissions/%Y/%m/%d/')
+    file = models.FileField(upload_to='work_submissions/%Y/%m/%d/', storage=content_storage)
     original_name = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(help_text="File size in bytes")
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -155,4 +173,45 @@ class WorkFile(models.Model):
             return 'fa-file text-muted'
     
     class Meta:
-        ordering = ['-uploaded_at']
\ No newline at end of file
+        ordering = ['-uploaded_at']
+
+class JobSearchTerm(models.Model):
+    """Inverted index row: one per (term, job) for every open job"""
+    term = models.CharField(max_length=50)
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.term} -> {self.job_id} ({self.weight})"
+    
+    class Meta:
+        unique_together = ['term', 'job']
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload, streamed to a temporary file until it is attached to a submission"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    original_name = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField(help_text="Declared file size in bytes")
+    received_size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.id}: {self.original_name} ({self.received_size}/{self.total_size})"
+    
+    def get_temp_path(self):
+        """Where the partial file lives while chunks arrive"""
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{self.id}.part')
+    
+    class Meta:
+        ordering = ['-created_at']
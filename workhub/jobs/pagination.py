@@ -0,0 +1,54 @@
+"""Keyset (cursor) pagination helpers.
+
+Pages are addressed by the (timestamp, id) of the last row seen instead of an
+offset, so fetching page N costs the same as fetching the first page.
+"""
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(timestamp, pk):
+    """Encode a (timestamp, id) pair as an opaque url-safe token"""
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor token, returning None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def paginate_keyset(queryset, cursor, page_size, field='created_at', descending=True):
+    """Return (rows, next_cursor) for one page of a queryset ordered by (field, id).
+    
+    next_cursor is None on the last page.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, pk = position
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk}))
+    
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+    
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.id)
+    
+    return rows, next_cursor
@@ -0,0 +1,256 @@
+"""Server-side search and faceting for the job board"""
+import base64
+import hashlib
+import re
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from payments import fx
+from payments.currency import CURRENCY_CODES, DEFAULT_CURRENCY, format_money
+from .models import Job, JobSearchTerm
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with',
+}
+
+# Matches in the title count more than matches in the description
+FIELD_WEIGHTS = {
+    'title': 3,
+    'category': 2,
+    'description': 1,
+}
+
+INDEXED_FIELDS = {'title', 'description', 'category', 'status'}
+
+# (key, min budget inclusive, max budget exclusive) in DEFAULT_CURRENCY. Budgets
+# in other currencies are converted at today's rate before they are compared.
+BUDGET_RANGES = [
+    ('under_100', None, 100),
+    ('100_500', 100, 500),
+    ('500_1000', 500, 1000),
+    ('over_1000', 1000, None),
+]
+
+# (key, label, days from today exclusive, days from today inclusive)
+DEADLINE_WINDOWS = [
+    ('week', 'Due within a week', None, 7),
+    ('month', 'Due within a month', 7, 30),
+    ('later', 'Due later', 30, None),
+]
+
+
+def tokenize(text):
+    """Split text into lowercase index terms"""
+    return [
+        token[:50] for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def term_weights(job):
+    """Return {term: weight} for the words of a job"""
+    weights = Counter()
+    for term in tokenize(job.title):
+        weights[term] += FIELD_WEIGHTS['title']
+    for term in set(tokenize(f"{job.category} {job.get_category_display()}")):
+        weights[term] += FIELD_WEIGHTS['category']
+    for term in tokenize(job.description):
+        weights[term] += FIELD_WEIGHTS['description']
+    return weights
+
+
+def index_job(job):
+    """Rebuild the index rows for a single job. Only open jobs are indexed."""
+    JobSearchTerm.objects.filter(job=job).delete()
+    if job.status != 'open':
+        return
+    
+    JobSearchTerm.objects.bulk_create([
+        JobSearchTerm(term=term, job=job, weight=weight)
+        for term, weight in term_weights(job).items()
+    ])
+
+
+def _encode_rank(matched, score, job_id):
+    raw = f"{matched}|{score}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_rank(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        matched, score, job_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return int(matched), int(score), int(job_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def matching_jobs(query):
+    """Return open jobs containing any of the query terms, unranked"""
+    terms = set(tokenize(query))
+    if not terms:
+        return Job.objects.none()
+    return Job.objects.filter(
+        status='open',
+        id__in=JobSearchTerm.objects.filter(term__in=terms).values('job_id'),
+    )
+
+
+def search_job_ids(query, jobs=None, limit=None, cursor=None):
+    """Return (job_ids, next_cursor) for one page of jobs matching the query.
+    
+    Jobs matching more of the query terms rank first, ties are broken by
+    the summed field weights and then by recency. Only jobs in the jobs
+    queryset are ranked, so filters apply before the page is cut.
+    next_cursor is None on the last page.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return [], None
+    
+    if limit is None:
+        limit = getattr(settings, 'JOB_SEARCH_MAX_RESULTS', 50)
+    
+    matches = JobSearchTerm.objects.filter(term__in=terms)
+    if jobs is not None:
+        matches = matches.filter(job__in=jobs)
+    
+    ranked = matches.values('job_id').annotate(
+        matched=Count('term'),
+        score=Sum('weight'),
+    )
+    
+    position = _decode_rank(cursor)
+    if position:
+        matched, score, job_id = position
+        ranked = ranked.filter(
+            Q(matched__lt=matched)
+            | Q(matched=matched, score__lt=score)
+            | Q(matched=matched, score=score, job_id__lt=job_id)
+        )
+    
+    rows = list(ranked.order_by('-matched', '-score', '-job_id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_rank(last['matched'], last['score'], last['job_id'])
+    
+    return [row['job_id'] for row in rows], next_cursor
+
+
+def search_jobs(query, category=None, limit=None):
+    """Return open jobs matching the query, best matches first"""
+    jobs = Job.objects.filter(status='open')
+    if category:
+        jobs = jobs.filter(category=category)
+    job_ids, next_cursor = search_job_ids(query, jobs=jobs, limit=limit)
+    jobs = Job.objects.filter(id__in=job_ids).select_related('client').in_bulk()
+    return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+
+def _range_q(field, low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__lt': high})
+    return q
+
+
+def _budget_label(low, high):
+    if low is None:
+        return f'Under {format_money(high)}'
+    if high is None:
+        return f'Over {format_money(low)}'
+    return f'{format_money(low)} - {format_money(high)}'
+
+
+def _budget_q(low, high):
+    """Jobs whose budget, converted to DEFAULT_CURRENCY, is in [low, high)"""
+    q = Q()
+    for currency in sorted(CURRENCY_CODES):
+        try:
+            rate = fx.rate(DEFAULT_CURRENCY, currency)
+        except fx.RateUnavailable:
+            # Jobs in a currency without a rate cannot be placed in a range
+            continue
+        q |= Q(currency=currency) & _range_q(
+            'budget',
+            low * rate if low is not None else None,
+            high * rate if high is not None else None,
+        )
+    return q
+
+
+def _facet_options():
+    """Return {facet: [(key, label, Q), ...]} for every facet on the job board"""
+    today = timezone.localdate()
+    deadline_options = []
+    for key, label, after_days, until_days in DEADLINE_WINDOWS:
+        q = Q()
+        if after_days is not None:
+            q &= Q(deadline__gt=today + timedelta(days=after_days))
+        if until_days is not None:
+            q &= Q(deadline__lte=today + timedelta(days=until_days))
+        deadline_options.append((key, label, q))
+    
+    return {
+        'category': [(key, label, Q(category=key)) for key, label in Job.CATEGORY_CHOICES],
+        'budget': [(key, _budget_label(low, high), _budget_q(low, high)) for key, low, high in BUDGET_RANGES],
+        'deadline': deadline_options,
+    }
+
+
+def job_filters(**selected):
+    """Turn selected facet values into {facet: Q}. Unknown values are ignored."""
+    filters = {}
+    for facet, options in _facet_options().items():
+        for key, label, q in options:
+            if selected.get(facet) == key:
+                filters[facet] = q
+    return filters
+
+
+def job_facets_cache_key(query, selected):
+    """Cache key for the facet counts of one search and set of filters"""
+    raw = '|'.join([' '.join(sorted(set(tokenize(query))))] + [f'{k}={v}' for k, v in sorted(selected.items())])
+    return f'job_facets:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def job_facets(queryset, filters):
+    """Count jobs for every facet value in a single aggregate query.
+    
+    The counts for one facet honour the filters on the other facets but not
+    its own, so they show what picking a different value would return.
+    """
+    options = _facet_options()
+    
+    def others(facet):
+        q = Q()
+        for other, other_q in filters.items():
+            if other != facet:
+                q &= other_q
+        return q
+    
+    aggregates = {'total': Count('id', filter=others(None))}
+    for facet, facet_options in options.items():
+        for key, label, q in facet_options:
+            aggregates[f'{facet}_{key}'] = Count('id', filter=q & others(facet))
+    
+    counts = queryset.aggregate(**aggregates)
+    
+    facets = {'total': counts['total']}
+    for facet, facet_options in options.items():
+        facets[facet] = [
+            {'value': key, 'label': label, 'count': counts[f'{facet}_{key}']}
+            for key, label, q in facet_options
+        ]
+    return facets
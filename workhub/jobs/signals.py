@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from payments import outbox
+from .models import Job, Application, WorkSubmission, WorkFile, job_detail_cache_key
+from .search import index_job, INDEXED_FIELDS
+
+@receiver(post_save, sender=Job)
+def update_job_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in sync whenever a job is saved"""
+    if update_fields and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    index_job(instance)
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def invalidate_job_detail_cache(sender, instance, **kwargs):
+    """Drop the cached job detail payload so the next request rebuilds it"""
+    cache.delete(job_detail_cache_key(instance.id))
+
+@receiver(post_save, sender=WorkFile)
+def add_work_file_to_totals(sender, instance, created, **kwargs):
+    """Count a new file on its submission with a single UPDATE"""
+    if created:
+        WorkSubmission.objects.filter(id=instance.work_submission_id).update(
+            files_count=F('files_count') + 1,
+            total_size=F('total_size') + instance.file_size,
+        )
+
+@receiver(post_delete, sender=WorkFile)
+def remove_work_file_from_totals(sender, instance, **kwargs):
+    """Take a deleted file off its submission's totals"""
+    WorkSubmission.objects.filter(id=instance.work_submission_id).update(
+        files_count=F('files_count') - 1,
+        total_size=F('total_size') - instance.file_size,
+    )
+
+@outbox.handler('application.accepted')
+def decline_other_applications(payloads):
+    """Decline the remaining applications of every job accepted in the batch"""
+    Application.objects.filter(
+        job_id__in=[payload['job_id'] for payload in payloads],
+    ).exclude(
+        id__in=[payload['application_id'] for payload in payloads],
+    ).update(status='declined')
@@ -56,6 +56,32 @@ document.addEventListener('DOMContentLoaded', function() {
                 jobCards.forEach(c => c.classList.remove('selected'));
             });
         }
+
+        markAppliedJobs();
+    }
+
+    // Look up the applied state of every visible card in one request
+    function markAppliedJobs() {
+        if (jobCards.length === 0) return;
+
+        const ids = Array.from(jobCards).map(card => card.dataset.jobId);
+
+        fetch(`/jobs/applied/?ids=${ids.join(',')}`, {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        })
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data || !data.success) return;
+                const applied = new Set(data.applied.map(String));
+                jobCards.forEach(card => {
+                    if (!applied.has(card.dataset.jobId)) return;
+                    const title = card.querySelector('.job-title');
+                    if (title && !title.querySelector('.applied-badge')) {
+                        title.insertAdjacentHTML('beforeend', ' <span class="badge bg-secondary applied-badge"><i class="fas fa-check"></i> Applied</span>');
+                    }
+                });
+            })
+            .catch(error => console.error('Error loading applied jobs:', error));
     }
 
     function loadJobDetail(jobId) {
@@ -97,123 +123,27 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
     }
 
-    /** ---------------- SEARCH (FIXED CATEGORY FILTERING) ---------------- **/
+    /** ---------------- SEARCH (SERVER-SIDE) ---------------- **/
     function initSearchFeatures() {
+        const searchForm = document.getElementById('job-search-form');
         const searchInput = document.getElementById('job-search');
-        const categoryFilter = document.getElementById('category-filter');
+        const facetFilters = document.querySelectorAll('.facet-filter');
         const clearSearchBtn = document.getElementById('clear-search');
-        const resetSearchBtn = document.getElementById('reset-search');
-        const noResultsMessage = document.getElementById('no-results-message');
-        const searchResultsInfo = document.getElementById('search-results-info');
-        const resultsCount = document.getElementById('results-count');
-        const searchTermDisplay = document.getElementById('search-term-display');
-        const jobListings = document.getElementById('job-listings');
-
-        if (!searchInput || !categoryFilter) return;
-
-        let searchTimeout;
-        function performSearch() {
-            const searchTerm = searchInput.value.toLowerCase().trim();
-            const selectedCategory = categoryFilter.value;
-            let visibleCount = 0;
-
-            jobCards.forEach(card => {
-                const title = card.querySelector('.job-title')?.textContent.toLowerCase() || '';
-                const description = card.querySelector('.job-description')?.textContent.toLowerCase() || '';
-                const categoryText = card.querySelector('.job-category')?.textContent.toLowerCase() || '';
-                const categoryValue = card.getAttribute('data-category') || '';
-                const categoryDisplayText = card.querySelector('.job-category')?.textContent || '';
-
-                const textMatch = !searchTerm || 
-                    title.includes(searchTerm) || 
-                    description.includes(searchTerm) || 
-                    categoryText.includes(searchTerm);
-
-                let categoryMatch = true;
-                if (selectedCategory) {
-                    const directMatch = categoryValue === selectedCategory;
-                    const categoryNames = {
-                        'web-development': ['web development', 'web dev'],
-                        'mobile-development': ['mobile development', 'mobile dev', 'mobile app'],
-                        'design': ['design', 'graphic design', 'ui/ux'],
-                        'writing': ['writing', 'content writing', 'copywriting'],
-                        'marketing': ['marketing', 'digital marketing'],
-                        'data-entry': ['data entry', 'data processing'],
-                        'other': ['other', 'miscellaneous']
-                    };
-                    
-                    const fallbackMatch = categoryNames[selectedCategory]?.some(name => 
-                        categoryDisplayText.toLowerCase().includes(name)
-                    ) || false;
-                    
-                    categoryMatch = directMatch || fallbackMatch;
-                }
-
-                if (textMatch && categoryMatch) {
-                    card.style.display = 'block';
-                    visibleCount++;
-                } else {
-                    card.style.display = 'none';
-                }
-            });
 
-            // Update UI
-            if (resultsCount) resultsCount.textContent = visibleCount;
+        if (!searchForm || !searchInput) return;
 
-            const hasActiveSearch = searchTerm || selectedCategory;
-            if (searchResultsInfo) {
-                searchResultsInfo.style.display = hasActiveSearch ? 'block' : 'none';
-            }
-            
-            const shouldShowNoResults = hasActiveSearch && visibleCount === 0;
-            if (noResultsMessage) {
-                noResultsMessage.style.display = shouldShowNoResults ? 'block' : 'none';
-            }
-            
-            if (jobListings) {
-                jobListings.style.display = shouldShowNoResults ? 'none' : 'block';
-            }
-
-            // Update search term display
-            if (searchTermDisplay) {
-                let displayText = '';
-                if (searchTerm && selectedCategory) {
-                    displayText = ` for "${searchTerm}" in category "${categoryFilter.options[categoryFilter.selectedIndex].text}"`;
-                } else if (searchTerm) {
-                    displayText = ` for "${searchTerm}"`;
-                } else if (selectedCategory) {
-                    displayText = ` in category "${categoryFilter.options[categoryFilter.selectedIndex].text}"`;
-                }
-                searchTermDisplay.textContent = displayText;
-            }
-        }
-
-        // Event listeners
-        searchInput.addEventListener('input', () => {
-            clearTimeout(searchTimeout);
-            searchTimeout = setTimeout(performSearch, 300);
+        // Searching and filtering happen on the server, so just submit the form
+        facetFilters.forEach(select => {
+            select.addEventListener('change', () => searchForm.submit());
         });
-        
-        categoryFilter.addEventListener('change', performSearch);
-        
+
         if (clearSearchBtn) {
             clearSearchBtn.addEventListener('click', () => {
                 searchInput.value = '';
-                categoryFilter.value = '';
-                performSearch();
+                facetFilters.forEach(select => select.value = '');
+                searchForm.submit();
             });
         }
-        
-        if (resetSearchBtn) {
-            resetSearchBtn.addEventListener('click', () => {
-                searchInput.value = '';
-                categoryFilter.value = '';
-                performSearch();
-            });
-        }
-
-        // Initial search to set up the display
-        performSearch();
     }
 
     /** ---------------- APPLICATIONS WITH MODAL POPUPS ---------------- **/
@@ -399,6 +329,76 @@ document.addEventListener('DOMContentLoaded', function() {
             return true;
         }
         
+        // Finished upload ids by file, so a retried submission does not
+        // send the same file twice
+        const finishedUploads = new Map();
+        
+        function uploadRequest(url, options, retries = 3) {
+            return fetch(url, options).then(response => {
+                if (response.status >= 500 && retries > 0) {
+                    return new Promise(resolve => setTimeout(resolve, 1000))
+                        .then(() => uploadRequest(url, options, retries - 1));
+                }
+                return response.json();
+            }).catch(error => {
+                if (retries > 0) {
+                    return new Promise(resolve => setTimeout(resolve, 1000))
+                        .then(() => uploadRequest(url, options, retries - 1));
+                }
+                throw error;
+            });
+        }
+        
+        function uploadFile(file, csrfValue) {
+            if (finishedUploads.has(file)) {
+                return Promise.resolve(finishedUploads.get(file));
+            }
+            
+            return uploadRequest('/uploads/start/', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfValue},
+                body: JSON.stringify({filename: file.name, size: file.size})
+            }).then(upload => {
+                if (!upload.success) throw new Error(upload.error);
+                
+                // Send chunks in order, resuming from whatever the server
+                // says it has when a chunk is rejected
+                const sendFrom = (offset, attempts) => {
+                    if (offset >= file.size) {
+                        return uploadRequest(`/uploads/${upload.upload_id}/finish/`, {
+                            method: 'POST',
+                            headers: {'X-CSRFToken': csrfValue}
+                        });
+                    }
+                    
+                    return uploadRequest(`/uploads/${upload.upload_id}/chunk/`, {
+                        method: 'PUT',
+                        headers: {'X-CSRFToken': csrfValue, 'X-Upload-Offset': offset},
+                        body: file.slice(offset, offset + upload.chunk_size)
+                    }).then(result => {
+                        if (!result.success && (result.received_size === undefined || attempts <= 0)) {
+                            throw new Error(result.error);
+                        }
+                        return sendFrom(result.received_size, result.success ? 3 : attempts - 1);
+                    });
+                };
+                
+                return sendFrom(0, 3);
+            }).then(result => {
+                if (!result.success) throw new Error(result.error);
+                finishedUploads.set(file, result.upload_id);
+                return result.upload_id;
+            });
+        }
+        
+        function uploadFiles(files, csrfValue) {
+            // One file at a time keeps memory and connections bounded
+            return files.reduce(
+                (chain, file) => chain.then(ids => uploadFile(file, csrfValue).then(id => ids.concat(id))),
+                Promise.resolve([])
+            );
+        }
+        
         // Form submission
         if (form) {
             form.addEventListener('submit', function(e) {
@@ -430,21 +430,26 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (workDescription) formData.append('work_description', workDescription.value);
                 if (additionalNotes) formData.append('additional_notes', additionalNotes.value);
                 
-                // Add files
-                selectedFiles.forEach((file, index) => {
-                    formData.append(`work_files_${index}`, file);
-                });
-                formData.append('file_count', selectedFiles.length);
-                
-                // Submit to server
-                fetch('/submit-work/', {
-                    method: 'POST',
-                    body: formData,
-                    headers: {
-                        'X-CSRFToken': csrfToken ? csrfToken.value : ''
-                    }
+                // Files go up in chunks first, then the submission references them
+                const csrfValue = csrfToken ? csrfToken.value : '';
+                const action = `submit-work:${currentJobId}`;
+                uploadFiles(selectedFiles, csrfValue)
+                .then(uploadIds => {
+                    formData.append('upload_ids', uploadIds.join(','));
+                    formData.append('file_count', 0);
+                    
+                    // Submit to server
+                    return fetch('/submit-work/', {
+                        method: 'POST',
+                        body: formData,
+                        headers: {
+                            'X-CSRFToken': csrfValue,
+                            'Idempotency-Key': Idempotency.keyFor(action)
+                        }
+                    });
                 })
                 .then(response => {
+                    Idempotency.settle(action, response);
                     if (!response.ok) {
                         throw new Error(`HTTP error! status: ${response.status}`);
                     }
@@ -456,7 +461,7 @@ document.addEventListener('DOMContentLoaded', function() {
                         
                         // Show success toast
                         if (window.toast) {
-                            const message = `Payment of $${data.payment_released} has been released to your account. Uploaded ${data.files ? data.files.length : 0} file(s).`;
+                            const message = data.message;
                             window.toast.success('Work Submitted Successfully!', message, 5000);
                         }
                         
@@ -475,7 +480,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     console.error('Error:', error);
                     // Show error toast
                     if (window.toast) {
-                        window.toast.error('Network Error', 'An error occurred while submitting your work. Please try again.', 5000);
+                        window.toast.error('Upload Failed', error.message || 'An error occurred while submitting your work. Please try again.', 5000);
                     }
                 })
                 .finally(() => {
@@ -656,13 +661,15 @@ document.addEventListener('DOMContentLoaded', function() {
         const updateUrl = applicationData?.dataset.updateUrl || '/update-application-status/';
         const walletUrl = applicationData?.dataset.walletUrl || '/wallet/';
 
+        const action = `application-status:${applicationId}:${status}`;
         console.log(`Sending request to ${updateUrl} with applicationId=${applicationId}, status=${status}`);
 
         fetch(updateUrl, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-                'X-CSRFToken': csrfToken
+                'X-CSRFToken': csrfToken,
+                'Idempotency-Key': Idempotency.keyFor(action)
             },
             body: JSON.stringify({ 
                 application_id: parseInt(applicationId), 
@@ -671,6 +678,7 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => {
             console.log('Response status:', response.status);
+            Idempotency.settle(action, response);
             return response.json();
         })
         .then(data => {
@@ -861,81 +869,3 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 });
-
-/**
- * Update navbar notification dot
- */
-function updateNavbarBadge(count) {
-    const navLinks = document.querySelectorAll('.navbar a[href*="inbox"]');
-    
-    navLinks.forEach(link => {
-        let dot = link.querySelector('.unread-dot');
-        
-        if (count > 0) {
-            if (!dot) {
-                dot = document.createElement('span');
-                dot.className = 'unread-dot';
-                link.appendChild(dot);
-            }
-        } else {
-            if (dot) {
-                dot.remove();
-            }
-        }
-    });
-}
-
-/**
- * Check unread message count
- */
-function checkUnreadMessages() {
-    const inboxLink = document.querySelector('.navbar a[href*="inbox"]');
-    if (!inboxLink) return;
-    
-    const csrftoken = getCookie('csrftoken');
-    
-    fetch('/api/unread-count/', {
-        method: 'GET',
-        headers: {
-            'X-Requested-With': 'XMLHttpRequest',
-            'X-CSRFToken': csrftoken
-        }
-    })
-    .then(response => {
-        if (!response.ok) throw new Error('Network error');
-        return response.json();
-    })
-    .then(data => {
-        updateNavbarBadge(data.unread_count);
-    })
-    .catch(error => {
-        // Silently fail
-    });
-}
-
-/**
- * Helper function to get cookie
- */
-function getCookie(name) {
-    let cookieValue = null;
-    if (document.cookie && document.cookie !== '') {
-        const cookies = document.cookie.split(';');
-        for (let i = 0; i < cookies.length; i++) {
-            const cookie = cookies[i].trim();
-            if (cookie.substring(0, name.length + 1) === (name + '=')) {
-                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
-                break;
-            }
-        }
-    }
-    return cookieValue;
-}
-
-// Check for unread messages on page load
-document.addEventListener('DOMContentLoaded', function() {
-    const inboxLink = document.querySelector('.navbar a[href*="inbox"]');
-    if (inboxLink) {
-        checkUnreadMessages();
-        setInterval(checkUnreadMessages, 5000);
-    }
-});
\ No newline at end of file
@@ -1,3 +1,337 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Profile
+from payments import escrow, ledger
+from payments.models import ExchangeRate, Payment
+from workhub.storage import content_storage
+from . import uploads
+from .models import Application, Job, JobSearchTerm, UploadSession, WorkSubmission
+from .pagination import decode_cursor, encode_cursor, paginate_keyset
+from .search import job_facets, job_filters, search_job_ids, search_jobs, tokenize
 
-# Create your tests here.
+
+def make_job(client, title='Job', category='web_dev', budget='100.00', description='', **fields):
+    return Job.objects.create(
+        title=title, description=description or title, category=category, budget=Decimal(budget),
+        deadline=fields.pop('deadline', date.today() + timedelta(days=60)), client=client, **fields,
+    )
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        start = timezone.now()
+        for i in range(7):
+            job = make_job(self.client_user, title=f'Job {i}')
+            # Two jobs share each timestamp, so paging has to fall back to the id
+            Job.objects.filter(pk=job.pk).update(created_at=start - timedelta(minutes=i // 2))
+
+    def test_pages_cover_every_row_once_in_order(self):
+        jobs = Job.objects.all()
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_keyset(jobs, cursor, 3)
+            seen.extend(job.id for job in page)
+            if not cursor:
+                break
+
+        expected = list(jobs.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = paginate_keyset(Job.objects.all(), None, 7)
+
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip_and_bad_cursors(self):
+        now = timezone.now()
+
+        self.assertEqual(decode_cursor(encode_cursor(now, 42)), (now, 42))
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertIsNone(decode_cursor(''))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+
+    def test_tokenize_drops_stop_words_and_short_tokens(self):
+        self.assertEqual(tokenize('Build a Django API for the shop!'), ['build', 'django', 'api', 'shop'])
+
+    def test_only_open_jobs_are_indexed(self):
+        job = make_job(self.client_user, title='Python scraper')
+        self.assertTrue(JobSearchTerm.objects.filter(job=job, term='python').exists())
+
+        job.status = 'in_progress'
+        job.save()
+        self.assertFalse(JobSearchTerm.objects.filter(job=job).exists())
+
+    def test_more_matched_terms_rank_first_then_title_matches(self):
+        both = make_job(self.client_user, title='Django API', description='python')
+        title = make_job(self.client_user, title='Django site', description='html')
+        described = make_job(self.client_user, title='Website', description='django')
+
+        job_ids, cursor = search_job_ids('django python')
+
+        self.assertEqual(job_ids, [both.id, title.id, described.id])
+        self.assertIsNone(cursor)
+
+    def test_filters_apply_before_the_page_is_cut(self):
+        for i in range(5):
+            make_job(self.client_user, title=f'Python cheap {i}', budget='50.00')
+        pricey = [make_job(self.client_user, title=f'Python pricey {i}', budget='2000.00') for i in range(3)]
+
+        filters = job_filters(budget='over_1000')
+        jobs = Job.objects.filter(*filters.values(), status='open')
+        first, cursor = search_job_ids('python', jobs=jobs, limit=2)
+        rest, last_cursor = search_job_ids('python', jobs=jobs, limit=2, cursor=cursor)
+
+        self.assertEqual(sorted(first + rest), sorted(job.id for job in pricey))
+        self.assertIsNone(last_cursor)
+
+    def test_search_jobs_narrows_by_category(self):
+        make_job(self.client_user, title='Python site', category='web_dev')
+        logo = make_job(self.client_user, title='Python logo', category='design')
+
+        self.assertEqual(search_jobs('python', category='design'), [logo])
+
+    def test_facets_ignore_their_own_filter(self):
+        make_job(self.client_user, title='Site', category='web_dev', budget='50.00')
+        make_job(self.client_user, title='Site', category='web_dev', budget='700.00')
+        make_job(self.client_user, title='Logo', category='design', budget='50.00')
+
+        facets = job_facets(Job.objects.filter(status='open'), job_filters(category='web_dev', budget='under_100'))
+        categories = {option['value']: option['count'] for option in facets['category']}
+        budgets = {option['value']: option['count'] for option in facets['budget']}
+
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual((categories['web_dev'], categories['design']), (1, 1))
+        self.assertEqual((budgets['under_100'], budgets['500_1000']), (1, 1))
+
+    def test_budget_ranges_compare_converted_budgets(self):
+        ExchangeRate.objects.create(base='USD', quote='PKR', day=date.today(), rate=Decimal('280'))
+        make_job(self.client_user, title='Logo', currency='PKR', budget='28000.00')
+        make_job(self.client_user, title='Banner', currency='PKR', budget='5000.00')
+        make_job(self.client_user, title='Site', currency='USD', budget='2000.00')
+
+        facets = job_facets(Job.objects.filter(status='open'), {})
+        budgets = {option['value']: (option['label'], option['count']) for option in facets['budget']}
+
+        self.assertEqual(budgets['under_100'], ('Under $100.00', 1))
+        self.assertEqual(budgets['100_500'], ('$100.00 - $500.00', 1))
+        self.assertEqual(budgets['over_1000'], ('Over $1000.00', 1))
+
+
+class JobListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user('client')
+        make_job(self.client_user, title='Python site', category='web_dev')
+        make_job(self.client_user, title='Python logo', category='design')
+
+    def get(self, **params):
+        return self.client.get(reverse('job_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_category_facets_count_every_category_of_a_search(self):
+        data = self.get(q='python', category='web_dev')
+        categories = {option['value']: option['count'] for option in data['facets']['category']}
+
+        self.assertEqual([job['title'] for job in data['results']], ['Python site'])
+        self.assertEqual((categories['web_dev'], categories['design']), (1, 1))
+
+    @override_settings(JOB_BOARD_PAGE_SIZE=1)
+    def test_search_results_are_paged(self):
+        first = self.get(q='python')
+        second = self.get(q='python', cursor=first['next_cursor'])
+
+        self.assertEqual(len(first['results']), 1)
+        self.assertEqual(second['facets'], first['facets'])
+        self.assertIsNone(second['next_cursor'])
+        self.assertNotEqual(first['results'], second['results'])
+
+
+class AppliedJobsTests(TestCase):
+    def setUp(self):
+        client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        self.jobs = [make_job(client_user, title=f'Job {i}') for i in range(3)]
+        Application.objects.create(
+            job=self.jobs[0], freelancer=self.freelancer, cover_letter='Hi',
+            proposed_budget=Decimal('90.00'), estimated_duration='1 week',
+        )
+        self.client.force_login(self.freelancer)
+
+    def applied(self, jobs):
+        ids = ','.join(str(job.id) for job in jobs)
+        return self.client.get(reverse('applied_jobs'), {'ids': ids}).json()['applied']
+
+    def test_only_the_asked_ids_are_looked_up_and_nothing_is_kept(self):
+        with self.assertNumQueries(3):  # session, user, applications
+            self.assertEqual(self.applied(self.jobs[1:]), [])
+        self.assertEqual(self.applied(self.jobs), [self.jobs[0].id])
+        self.assertNotIn('applied_jobs', self.client.session)
+
+    def test_a_new_application_shows_at_once(self):
+        self.applied(self.jobs)
+        Application.objects.create(
+            job=self.jobs[2], freelancer=self.freelancer, cover_letter='Hi',
+            proposed_budget=Decimal('90.00'), estimated_duration='1 week',
+        )
+
+        self.assertEqual(self.applied(self.jobs), [self.jobs[0].id, self.jobs[2].id])
+
+
+class WorkReviewTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        ledger.adjust_balance(self.client_user, '500.00')
+        self.job = make_job(self.client_user, freelancer=self.freelancer, status='in_progress')
+        self.payment = escrow.hold(self.job, self.client_user, self.freelancer, Decimal('90.00'))
+
+    def submit(self):
+        self.client.force_login(self.freelancer)
+        return self.client.post(reverse('submit_work'), {'job_id': self.job.id, 'work_description': 'Done', 'file_count': 0}).json()
+
+    def test_submitting_work_waits_for_approval(self):
+        data = self.submit()
+        deadline = Payment.objects.get(pk=self.payment.pk).release_after
+
+        self.assertTrue(data['success'])
+        self.assertIn('when the client approves the work', data['message'])
+        self.assertIn(f'automatically on {deadline:%b %d, %Y}', data['message'])
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('0.00'))
+
+    def test_approving_work_releases_the_payment_before_the_deadline(self):
+        self.submit()
+        deadline = Payment.objects.get(pk=self.payment.pk).release_after
+        self.client.force_login(self.client_user)
+        response = self.client.post(reverse('approve_work', args=[self.job.id]))
+
+        [message] = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertIn(f'instead of automatically on {deadline:%b %d, %Y}', message)
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('90.00'))
+        self.assertEqual(Job.objects.get(pk=self.job.pk).status, 'completed')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class MyJobsTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        self.other_freelancer = User.objects.create_user('other')
+        Profile.objects.create(user=self.client_user, role='client')
+        Profile.objects.create(user=self.freelancer, role='freelancer')
+        ledger.adjust_balance(self.client_user, '10000.00')
+
+    def add_jobs(self, count):
+        for i in range(count):
+            job = make_job(self.client_user, title=f'Job {i}')
+            for applicant in (self.freelancer, self.other_freelancer):
+                Application.objects.create(
+                    job=job, freelancer=applicant, cover_letter='Hi',
+                    proposed_budget=Decimal('90.00'), estimated_duration='1 week',
+                )
+            if i % 3 == 0:
+                Job.objects.filter(pk=job.pk).update(freelancer=self.freelancer, status='under_review')
+                escrow.hold(job, self.client_user, self.freelancer, Decimal('90.00'))
+                WorkSubmission.objects.create(job=job, freelancer=self.freelancer, description='Done')
+
+    def test_query_count_does_not_grow_with_jobs(self):
+        self.add_jobs(3)
+        for user in (self.client_user, self.freelancer):
+            self.client.force_login(user)
+            self.assertEqual(self.client.get(reverse('my_jobs')).status_code, 200)
+
+        self.add_jobs(12)
+        for user in (self.client_user, self.freelancer):
+            self.client.force_login(user)
+            response = self.client.get(reverse('my_jobs'))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['assigned_jobs']), 5)
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('freelancer')
+
+    def send(self, upload, offset, data):
+        return uploads.append_chunk(upload, offset, io.BytesIO(data), len(data))
+
+    def test_chunks_build_the_file_and_its_hash(self):
+        upload = uploads.start_upload(self.user, 'report.pdf', 10)
+        self.send(upload, 0, b'hello')
+        self.send(upload, 5, b'world')
+
+        upload = uploads.finish_upload(UploadSession.objects.get(id=upload.id))
+        self.assertEqual(upload.sha256, hashlib.sha256(b'helloworld').hexdigest())
+
+    def test_chunk_for_an_offset_already_taken_is_refused(self):
+        upload = uploads.start_upload(self.user, 'report.pdf', 10)
+        # Both copies saw the session before either chunk was written
+        stale = UploadSession.objects.get(id=upload.id)
+        self.send(upload, 0, b'hello')
+
+        with self.assertRaisesMessage(uploads.UploadError, 'Expected offset 5, got 0'):
+            self.send(stale, 0, b'HELLO')
+        self.assertEqual(stale.received_size, 5)
+        self.assertEqual(UploadSession.objects.get(id=upload.id).received_size, 5)
+
+    @override_settings(UPLOAD_HASH_CACHE_SIZE=2)
+    def test_running_hashes_are_bounded(self):
+        first = uploads.start_upload(self.user, 'a.txt', 3)
+        for name in ('b.txt', 'c.txt', 'd.txt'):
+            uploads.start_upload(self.user, name, 3)
+        self.send(first, 0, b'abc')
+
+        self.assertLessEqual(len(uploads._hashers), 2)
+        upload = uploads.finish_upload(UploadSession.objects.get(id=first.id))
+        self.assertEqual(upload.sha256, hashlib.sha256(b'abc').hexdigest())
+
+
+class MediaGarbageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = content_storage()
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save('report.pdf', ContentFile(b'same bytes'))
+        second = self.storage.save('copy.PDF', ContentFile(b'same bytes'))
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.pdf'))
+
+    def test_reused_content_is_not_swept_before_its_row_commits(self):
+        name = self.storage.save('report.pdf', ContentFile(b'old bytes'))
+        old = time.time() - 48 * 3600
+        os.utime(self.storage.path(name), (old, old))
+
+        # A new upload of the same content, its row not written yet
+        self.assertEqual(self.storage.save('again.pdf', ContentFile(b'old bytes')), name)
+        call_command('collect_media_garbage', stdout=io.StringIO())
+
+        self.assertTrue(self.storage.exists(name))
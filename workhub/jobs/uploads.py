@@ -0,0 +1,185 @@
+"""Chunked, resumable uploads for work submissions.
+
+A client starts an upload with the file's name and size, sends the bytes in
+order as one or more chunks, then finishes it. Chunks are streamed to a
+temporary file in small blocks, so memory use does not depend on file size,
+and the SHA-256 of the content is computed as the bytes arrive. A finished
+upload can then be referenced from submit_work.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from .models import UploadSession, WorkFile
+
+BLOCK_SIZE = 64 * 1024
+
+# Running hashes for uploads in progress in this process, keyed by upload id,
+# least recently used first. Abandoned uploads fall off the end once there are
+# more than UPLOAD_HASH_CACHE_SIZE. If a chunk lands on another worker, or the
+# hash was dropped, it is recomputed from the file when finishing.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be accepted"""
+
+
+def max_file_size():
+    return getattr(settings, 'WORK_FILE_MAX_SIZE', 50 * 1024 * 1024)
+
+
+def _keep_hasher(upload_id, hasher, hashed):
+    with _hashers_lock:
+        _hashers[upload_id] = (hasher, hashed)
+        _hashers.move_to_end(upload_id)
+        while len(_hashers) > getattr(settings, 'UPLOAD_HASH_CACHE_SIZE', 256):
+            _hashers.popitem(last=False)
+
+
+def _take_hasher(upload_id):
+    with _hashers_lock:
+        return _hashers.pop(upload_id, (None, None))
+
+
+def start_upload(user, original_name, total_size):
+    """Validate the declared size and open a new upload session"""
+    if not original_name:
+        raise UploadError('Missing file name')
+    if total_size <= 0:
+        raise UploadError('File is empty')
+    if total_size > max_file_size():
+        raise UploadError(f'File {original_name} is too large. Maximum size is {max_file_size() // (1024 * 1024)}MB.')
+    
+    upload = UploadSession.objects.create(
+        user=user,
+        original_name=os.path.basename(original_name)[:255],
+        total_size=total_size,
+    )
+    
+    os.makedirs(os.path.dirname(upload.get_temp_path()), exist_ok=True)
+    open(upload.get_temp_path(), 'wb').close()
+    _keep_hasher(upload.id, hashlib.sha256(), 0)
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """Stream one chunk from a file-like object onto the end of the upload.
+    
+    Chunks must arrive in order: offset has to equal the bytes received so
+    far, which is what a client resumes from after a failure. The session row
+    stays locked while the chunk is written, so of two chunks sent at the
+    same offset one is written and the other is turned away.
+    """
+    if offset + length > upload.total_size:
+        raise UploadError('Chunk goes past the declared file size')
+    
+    with transaction.atomic():
+        _claim_offset(upload, offset)
+        received_size = _write_chunk(upload, offset, stream, length)
+        UploadSession.objects.filter(id=upload.id).update(received_size=received_size, updated_at=timezone.now())
+    
+    upload.received_size = received_size
+    return received_size
+
+
+def _claim_offset(upload, offset):
+    """Lock the session row if it is still waiting for the bytes at offset"""
+    claimed = UploadSession.objects.filter(
+        id=upload.id, status='uploading', received_size=offset,
+    ).update(updated_at=timezone.now())
+    if not claimed:
+        upload.refresh_from_db(fields=['status', 'received_size'])
+        if upload.status != 'uploading':
+            raise UploadError('Upload is already finished')
+        raise UploadError(f'Expected offset {upload.received_size}, got {offset}')
+
+
+def _write_chunk(upload, offset, stream, length):
+    hasher, hashed = _take_hasher(upload.id)
+    if hashed != offset:
+        hasher = None
+    
+    written = 0
+    with open(upload.get_temp_path(), 'r+b') as destination:
+        destination.truncate(offset)
+        destination.seek(offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            destination.write(block)
+            if hasher:
+                hasher.update(block)
+            written += len(block)
+    
+    if written != length:
+        raise UploadError('Chunk was cut short, resume from the last offset')
+    
+    if hasher:
+        _keep_hasher(upload.id, hasher, offset + written)
+    return offset + written
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def finish_upload(upload):
+    """Check every byte arrived and record the content hash"""
+    if upload.status != 'uploading':
+        return upload
+    if upload.received_size != upload.total_size:
+        raise UploadError(f'Upload incomplete: {upload.received_size} of {upload.total_size} bytes received')
+    
+    hasher, hashed = _take_hasher(upload.id)
+    if hasher and hashed == upload.total_size:
+        upload.sha256 = hasher.hexdigest()
+    else:
+        upload.sha256 = _hash_file(upload.get_temp_path())
+    
+    upload.status = 'complete'
+    upload.save(update_fields=['sha256', 'status', 'updated_at'])
+    return upload
+
+
+def attach_upload(upload, work_submission):
+    """Move a finished upload into storage as a file of the work submission"""
+    if upload.status != 'complete':
+        raise UploadError(f'Upload {upload.original_name} is not finished')
+    
+    with open(upload.get_temp_path(), 'rb') as source:
+        content = File(source, name=upload.original_name)
+        # Already hashed while receiving, so storage does not read it twice
+        content.sha256 = upload.sha256
+        work_file = WorkFile.objects.create(
+            work_submission=work_submission,
+            file=content,
+            original_name=upload.original_name,
+            file_size=upload.total_size,
+        )
+    
+    # Keep the temporary file until the submission is committed so a failed
+    # submission can be retried with the same upload
+    temp_path = upload.get_temp_path()
+    transaction.on_commit(lambda: os.path.exists(temp_path) and os.remove(temp_path))
+    upload.status = 'attached'
+    upload.save(update_fields=['status', 'updated_at'])
+    return work_file
+
+
+def discard_upload(upload):
+    """Delete an upload session and its partial file"""
+    _take_hasher(upload.id)
+    if os.path.exists(upload.get_temp_path()):
+        os.remove(upload.get_temp_path())
+    upload.delete()
@@ -3,12 +3,19 @@ from . import views
 
 urlpatterns = [
     path('jobs/', views.job_list, name='job_list'),
+    path('jobs/search/', views.search_jobs_api, name='search_jobs'),
     path('post/', views.post_job, name='post_job'),
     path('job/<int:job_id>/', views.get_job_detail, name='job_detail'),
+    path('jobs/applied/', views.applied_jobs, name='applied_jobs'),
     path('apply/<int:job_id>/', views.apply_job, name='apply_job'),
     path('applications/', views.applications, name='applications'),
     path('update-application-status/', views.update_application_status, name='update_application_status'),
     path('submit-work/', views.submit_work, name='submit_work'),
+    path('uploads/start/', views.start_upload, name='start_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('uploads/<uuid:upload_id>/chunk/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finish/', views.finish_upload, name='finish_upload'),
+    path('approve-work/<int:job_id>/', views.approve_work, name='approve_work'),
     path('view-work-submission/<int:job_id>/', views.view_work_submission, name='view_work_submission'),
     path('my-jobs/', views.my_jobs, name='my_jobs'),
 ]
\ No newline at end of file
@@ -1,62 +1,213 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_http_methods
 from django.contrib import messages
-from .models import Job, Application, WorkSubmission, WorkFile
-from payments.models import Wallet, Payment, Transaction
+from .models import Job, Application, WorkSubmission, WorkFile, UploadSession, job_detail_cache_key
+from . import uploads
+from .search import search_jobs, search_job_ids, matching_jobs, job_filters, job_facets, job_facets_cache_key
+from .pagination import paginate_keyset
+from workhub.decorators import query_budget
+from payments.models import Payment
+from payments import escrow, ledger, outbox
+from payments.currency import CURRENCY_CHOICES, CURRENCY_CODES, DEFAULT_CURRENCY, format_money
+from payments.idempotency import RETRYABLE_ERRORS, idempotent
 from reviews.models import Review
-from django.db import transaction
-from django.utils import timezone
-from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+import hashlib
 import json
 import os
 from django.core.serializers import serialize
 
+def _job_summary(job):
+    return {
+        'id': job.id,
+        'title': job.title,
+        'category': job.get_category_display(),
+        'budget': str(job.budget),
+        'currency': job.currency,
+        'deadline': job.deadline.strftime('%Y-%m-%d'),
+        'client': job.client.username,
+    }
+
 def job_list(request):
-    jobs = Job.objects.filter(status='open')
-    return render(request, 'jobs/job_list.html', {'jobs': jobs})
+    query = request.GET.get('q', '').strip()
+    selected = {
+        'category': request.GET.get('category', ''),
+        'budget': request.GET.get('budget', ''),
+        'deadline': request.GET.get('deadline', ''),
+    }
+    filters = job_filters(**selected)
+    
+    jobs = matching_jobs(query) if query else Job.objects.filter(status='open')
+    cursor = request.GET.get('cursor')
+    
+    # Facets are counted on the first page and reused while paging through it
+    facets_key = job_facets_cache_key(query, selected)
+    facets = cache.get(facets_key) if cursor else None
+    if facets is None:
+        facets = job_facets(jobs, filters)
+        cache.set(facets_key, facets, getattr(settings, 'JOB_FACETS_CACHE_TIMEOUT', 60))
+    
+    page_size = getattr(settings, 'JOB_BOARD_PAGE_SIZE', 20)
+    if query:
+        # Ranked matches come from the search index, filtered before paging
+        ranked_ids, next_cursor = search_job_ids(
+            query, jobs=Job.objects.filter(*filters.values(), status='open'),
+            limit=page_size, cursor=cursor,
+        )
+        jobs_by_id = Job.objects.filter(id__in=ranked_ids).select_related('client').in_bulk()
+        jobs = [jobs_by_id[job_id] for job_id in ranked_ids if job_id in jobs_by_id]
+    else:
+        jobs = jobs.filter(*filters.values()).select_related('client')
+        jobs, next_cursor = paginate_keyset(jobs, cursor, page_size)
+    
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            'results': [_job_summary(job) for job in jobs],
+            'next_cursor': next_cursor,
+            'facets': facets,
+        })
+    
+    next_page_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_page_query = params.urlencode()
+    
+    context = {
+        'jobs': jobs,
+        'query': query,
+        'selected': selected,
+        'facets': facets,
+        'next_page_query': next_page_query,
+        'is_filtered': bool(query or filters),
+    }
+    
+    return render(request, 'jobs/job_list.html', context)
+
+def search_jobs_api(request):
+    """AJAX endpoint returning ranked job search results"""
+    query = request.GET.get('q', '').strip()
+    category = request.GET.get('category', '')
+    
+    results = [_job_summary(job) for job in search_jobs(query, category=category)]
+    
+    return JsonResponse({'query': query, 'results': results})
 
 @login_required
 def post_job(request):
     if request.method == 'POST':
+        currency = request.POST.get('currency', DEFAULT_CURRENCY)
+        if currency not in CURRENCY_CODES:
+            messages.error(request, 'Unsupported currency')
+            return redirect('post_job')
+        
         job = Job.objects.create(
             title=request.POST['title'],
             description=request.POST['description'],
             category=request.POST['category'],
             budget=request.POST['budget'],
+            currency=currency,
             deadline=request.POST['deadline'],
             client=request.user
         )
         messages.success(request, 'Job posted successfully!')
         return redirect('my_jobs')
     
-    return render(request, 'jobs/post_job.html')
+    return render(request, 'jobs/post_job.html', {
+        'currency_choices': CURRENCY_CHOICES,
+        'default_currency': ledger.wallet_currency(request.user),
+    })
+
+def _public_job_detail(job_id):
+    """Public part of the job detail payload, cached until the job is saved"""
+    key = job_detail_cache_key(job_id)
+    detail = cache.get(key)
+    
+    if detail is None:
+        job = get_object_or_404(Job.objects.select_related('client'), id=job_id)
+        detail = {
+            'client_id': job.client_id,
+            'updated_at': job.updated_at,
+            'data': {
+                'id': job.id,
+                'title': job.title,
+                'description': job.description,
+                'category': job.get_category_display(),
+                'budget': str(job.budget),
+                'currency': job.currency,
+                'deadline': job.deadline.strftime('%Y-%m-%d'),
+                'client': job.client.username,
+                'created_at': job.created_at.strftime('%B %d, %Y'),
+            },
+        }
+        cache.set(key, detail, getattr(settings, 'JOB_DETAIL_CACHE_TIMEOUT', 300))
+    
+    return detail
+
+def _applied_job_ids(request, job_ids):
+    """Return the subset of job_ids the current user has applied to.
+    
+    Only the ids asked about are looked up, with one query on the
+    (job, freelancer) unique index, so the cost follows the page size rather
+    than how many jobs the user has ever applied to.
+    """
+    if not request.user.is_authenticated or not job_ids:
+        return set()
+    
+    return set(Application.objects.filter(
+        freelancer=request.user, job_id__in=job_ids,
+    ).values_list('job_id', flat=True))
 
 def get_job_detail(request, job_id):
     """AJAX endpoint to get job details"""
-    job = get_object_or_404(Job, id=job_id)
+    detail = _public_job_detail(job_id)
     
-    # Check if user has already applied
-    has_applied = False
-    if request.user.is_authenticated:
-        has_applied = Application.objects.filter(job=job, freelancer=request.user).exists()
+    # Per-user bits are never cached
+    has_applied = job_id in _applied_job_ids(request, [job_id])
+    is_owner = request.user.is_authenticated and detail['client_id'] == request.user.id
     
-    job_data = {
-        'id': job.id,
-        'title': job.title,
-        'description': job.description,
-        'category': job.get_category_display(),
-        'budget': str(job.budget),
-        'deadline': job.deadline.strftime('%Y-%m-%d'),
-        'client': job.client.username,
-        'created_at': job.created_at.strftime('%B %d, %Y'),
-        'has_applied': has_applied,
-        'is_owner': request.user.is_authenticated and job.client == request.user
-    }
+    etag = '"%s"' % hashlib.md5(
+        f"{job_id}:{detail['updated_at'].isoformat()}:{has_applied}:{is_owner}".encode()
+    ).hexdigest()
+    last_modified = int(detail['updated_at'].timestamp())
+    
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse({
+            **detail['data'],
+            'has_applied': has_applied,
+            'is_owner': is_owner,
+        })
     
-    return JsonResponse(job_data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def applied_jobs(request):
+    """AJAX endpoint returning which of the given jobs the user has applied to.
+    
+    Takes ?ids=1,2,3 and answers from a single lookup, so the job board can
+    mark every visible card in one round-trip.
+    """
+    try:
+        job_ids = [int(job_id) for job_id in request.GET.get('ids', '').split(',') if job_id]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid job ids'}, status=400)
+    
+    max_ids = getattr(settings, 'APPLIED_JOBS_MAX_IDS', 200)
+    if len(job_ids) > max_ids:
+        return JsonResponse({'success': False, 'error': f'At most {max_ids} job ids per request'}, status=400)
+    
+    applied = _applied_job_ids(request, job_ids)
+    return JsonResponse({'success': True, 'applied': sorted(applied)})
 
 @login_required
 def apply_job(request, job_id):
@@ -101,6 +252,7 @@ def applications(request):
     return render(request, 'jobs/applications.html', context)
 
 @login_required
+@idempotent
 @require_POST
 def update_application_status(request):
     """AJAX endpoint to accept/decline applications with payment integration"""
@@ -118,16 +270,8 @@ def update_application_status(request):
         if status == 'accepted':
             # Check if client has sufficient balance before accepting
             try:
-                wallet, created = Wallet.objects.get_or_create(user=request.user)
                 amount = application.proposed_budget
                 
-                if not wallet.can_withdraw(amount):
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Insufficient balance. You need ${amount} but only have ${wallet.balance}. Please top up your wallet first.',
-                        'insufficient_funds': True
-                    })
-                
                 with transaction.atomic():
                     # Update application status
                     application.status = status
@@ -138,38 +282,28 @@ def update_application_status(request):
                     application.job.freelancer = application.freelancer
                     application.job.save()
                     
-                    # Create payment on hold
-                    if not wallet.deduct_funds(amount):
-                        return JsonResponse({'success': False, 'error': 'Failed to deduct funds'})
-                    
-                    payment = Payment.objects.create(
-                        job=application.job,
-                        from_user=request.user,
-                        to_user=application.freelancer,
-                        amount=amount,
-                        status='on_hold',
-                        payment_type='job_payment',
-                        description=f'Payment for job: {application.job.title}'
-                    )
+                    # Hold the payment in escrow, a short balance rolls all of this back
+                    escrow.hold(application.job, request.user, application.freelancer, amount)
                     
-                    # Create transaction record for client (debit)
-                    Transaction.objects.create(
-                        wallet=wallet,
-                        payment=payment,
-                        amount=amount,
-                        transaction_type='debit',
-                        description=f'Payment on hold for job: {application.job.title}',
-                        balance_after=wallet.balance
-                    )
-                    
-                    # Decline other applications for this job
-                    Application.objects.filter(job=application.job).exclude(id=application_id).update(status='declined')
+                    # The outbox worker declines the other applications after commit
+                    outbox.emit('application.accepted', job_id=application.job_id, application_id=application.id)
                 
                 return JsonResponse({
                     'success': True, 
-                    'message': f'Application accepted and payment of ${amount} placed on hold'
+                    'message': f'Application accepted and payment of {format_money(amount, application.job.currency)} placed on hold'
                 })
                 
+            except ledger.InsufficientFunds as e:
+                return JsonResponse({
+                    'success': False, 
+                    'error': f'{e}. Please top up your wallet first.',
+                    'insufficient_funds': True
+                })
+            except IntegrityError:
+                return JsonResponse({'success': False, 'error': 'Payment already made for this job'})
+            except RETRYABLE_ERRORS:
+                # Free the idempotency key so the client can retry
+                raise
             except Exception as e:
                 return JsonResponse({'success': False, 'error': str(e)})
         else:
@@ -182,13 +316,96 @@ def update_application_status(request):
 
 @login_required
 @require_POST
+def start_upload(request):
+    """Open a chunked upload session for a work file"""
+    try:
+        data = json.loads(request.body)
+        upload = uploads.start_upload(request.user, data.get('filename'), int(data.get('size', 0)))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid upload request'})
+    except uploads.UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(upload.id),
+        'chunk_size': getattr(settings, 'UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024),
+        'received_size': 0,
+    })
+
+@login_required
+def upload_status(request, upload_id):
+    """Report how much of an upload has arrived so the client can resume"""
+    upload = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(upload.id),
+        'status': upload.status,
+        'received_size': upload.received_size,
+        'total_size': upload.total_size,
+    })
+
+@login_required
+@require_http_methods(['PUT', 'POST'])
+def upload_chunk(request, upload_id):
+    """Append the raw request body to an upload at the X-Upload-Offset header"""
+    upload = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    
+    try:
+        offset = int(request.headers.get('X-Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Missing upload offset'}, status=400)
+    
+    if length > getattr(settings, 'UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024):
+        return JsonResponse({'success': False, 'error': 'Chunk is too large'}, status=413)
+    
+    try:
+        # Read straight from the request stream instead of request.body so
+        # the chunk is never held in memory as a whole
+        received_size = uploads.append_chunk(upload, offset, request, length)
+    except uploads.UploadError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'received_size': upload.received_size,
+        }, status=409)
+    
+    return JsonResponse({'success': True, 'received_size': received_size})
+
+@login_required
+@require_POST
+def finish_upload(request, upload_id):
+    """Complete an upload once every chunk has arrived"""
+    upload = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    
+    try:
+        upload = uploads.finish_upload(upload)
+    except uploads.UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'received_size': upload.received_size})
+    
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(upload.id),
+        'size': upload.total_size,
+        'sha256': upload.sha256,
+    })
+
+@login_required
+@idempotent
+@require_POST
 def submit_work(request):
-    """Handle work submission with files, description, and automatic payment release"""
+    """Handle work submission with files and description, starting the client's review.
+    
+    The held payment is released when the client approves the work, or by
+    release_due_payments once the review period passes without a dispute.
+    """
     try:
         job_id = request.POST.get('job_id')
         work_description = request.POST.get('work_description')
         additional_notes = request.POST.get('additional_notes', '')
         file_count = int(request.POST.get('file_count', 0))
+        upload_ids = [upload_id for upload_id in request.POST.get('upload_ids', '').split(',') if upload_id]
         
         if not job_id or not work_description:
             return JsonResponse({'success': False, 'error': 'Missing required fields'})
@@ -207,6 +424,25 @@ def submit_work(request):
         if WorkSubmission.objects.filter(job=job).exists():
             return JsonResponse({'success': False, 'error': 'Work already submitted for this job'})
         
+        # Files sent directly with the form
+        direct_files = [
+            request.FILES[f'work_files_{i}'] for i in range(file_count)
+            if f'work_files_{i}' in request.FILES
+        ]
+        
+        # Validate file sizes before anything is written
+        for uploaded_file in direct_files:
+            if uploaded_file.size > uploads.max_file_size():
+                return JsonResponse({
+                    'success': False, 
+                    'error': f'File {uploaded_file.name} is too large. Maximum size is {uploads.max_file_size() // (1024 * 1024)}MB.'
+                })
+        
+        # Files already sent through the chunked upload API
+        finished_uploads = list(UploadSession.objects.filter(id__in=upload_ids, user=request.user, status='complete'))
+        if len(finished_uploads) != len(set(upload_ids)):
+            return JsonResponse({'success': False, 'error': 'Some uploads are missing or not finished'})
+        
         with transaction.atomic():
             # Create work submission
             work_submission = WorkSubmission.objects.create(
@@ -214,100 +450,116 @@ def submit_work(request):
                 freelancer=request.user,
                 description=work_description,
                 additional_notes=additional_notes,
-                status='approved'  # Automatically approved since payment was already held
             )
             
             # Handle file uploads
             uploaded_files = []
-            for i in range(file_count):
-                file_key = f'work_files_{i}'
-                if file_key in request.FILES:
-                    uploaded_file = request.FILES[file_key]
-                    
-                    # Validate file size (50MB limit)
-                    if uploaded_file.size > 50 * 1024 * 1024:
-                        return JsonResponse({
-                            'success': False, 
-                            'error': f'File {uploaded_file.name} is too large. Maximum size is 50MB.'
-                        })
-                    
-                    # Save file
-                    file_path = f'work_submissions/{job.id}/{uploaded_file.name}'
-                    saved_path = default_storage.save(file_path, uploaded_file)
-                    
-                    # Create work file record
-                    WorkFile.objects.create(
-                        work_submission=work_submission,
-                        file=saved_path,
-                        original_name=uploaded_file.name,
-                        file_size=uploaded_file.size
-                    )
-                    
-                    uploaded_files.append(uploaded_file.name)
+            for uploaded_file in direct_files:
+                # Create work file record, the field's storage keeps one copy per content
+                WorkFile.objects.create(
+                    work_submission=work_submission,
+                    file=uploaded_file,
+                    original_name=uploaded_file.name,
+                    file_size=uploaded_file.size
+                )
+                
+                uploaded_files.append(uploaded_file.name)
             
-            # Mark job as completed and release payment automatically
-            job.status = 'completed'
-            job.save()
+            for upload in finished_uploads:
+                uploads.attach_upload(upload, work_submission)
+                uploaded_files.append(upload.original_name)
             
-            # Find and release payment
-            payment = Payment.objects.filter(
-                job=job, 
-                status='on_hold', 
-                to_user=job.freelancer
-            ).first()
+            # The client reviews the work, the auto-release clock starts now
+            job.status = 'under_review'
+            job.save()
+            payment = escrow.deliver(job)
             
-            if payment:
-                # Create or get freelancer's wallet
-                freelancer_wallet, created = Wallet.objects.get_or_create(user=job.freelancer)
-                
-                # Add funds to freelancer's wallet
-                freelancer_wallet.add_funds(payment.amount)
-                
-                # Update payment status
-                payment.status = 'completed'
-                payment.completed_at = timezone.now()
-                payment.save()
-                
-                # Create transaction record for freelancer (credit)
-                Transaction.objects.create(
-                    wallet=freelancer_wallet,
-                    payment=payment,
-                    amount=payment.amount,
-                    transaction_type='credit',
-                    description=f'Payment received for job: {job.title}',
-                    balance_after=freelancer_wallet.balance
+            message = f'Work submitted successfully! Uploaded {len(uploaded_files)} files.'
+            if payment and payment.release_after:
+                message += (
+                    f' Payment of {format_money(payment.amount, payment.currency)} will be released when the client '
+                    f'approves the work, or automatically on {payment.release_after:%b %d, %Y}.'
                 )
+            elif payment:
+                message += f' Payment of {format_money(payment.amount, payment.currency)} will be released when the client approves the work.'
             
             return JsonResponse({
                 'success': True,
-                'message': f'Work submitted successfully! Payment of ${payment.amount if payment else job.budget} has been released to your account. Uploaded {len(uploaded_files)} files.',
+                'message': message,
                 'files': uploaded_files,
-                'payment_released': payment.amount if payment else job.budget
+                'payment_release_after': payment.release_after if payment else None,
             })
             
+    except RETRYABLE_ERRORS:
+        # Free the idempotency key so the client can retry
+        raise
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
     
 @login_required
+@require_POST
+def approve_work(request, job_id):
+    """Approve delivered work, releasing the held payment to the freelancer"""
+    job = get_object_or_404(Job, id=job_id)
+    
+    if job.client != request.user:
+        messages.error(request, 'You are not authorized to approve this work.')
+        return redirect('my_jobs')
+    
+    if job.status != 'under_review':
+        messages.error(request, 'This work is not waiting for review.')
+        return redirect('view_work_submission', job_id=job.id)
+    
+    try:
+        with transaction.atomic():
+            payment = Payment.objects.filter(job=job, status='on_hold', to_user=job.freelancer).first()
+            release_after = payment.release_after if payment else None
+            if payment:
+                escrow.release(payment)
+            escrow.complete_jobs([job.id])
+    except escrow.InvalidTransition:
+        messages.error(request, 'The payment for this job is disputed and will be settled by our team.')
+        return redirect('view_work_submission', job_id=job.id)
+    
+    if payment:
+        message = f'Work approved. Payment of {format_money(payment.amount, payment.currency)} has been released to {job.freelancer.username}'
+        if release_after:
+            message += f' now, instead of automatically on {release_after:%b %d, %Y}'
+        messages.success(request, f'{message}.')
+    else:
+        messages.success(request, 'Work approved.')
+    return redirect('view_work_submission', job_id=job.id)
+
+@login_required
+@query_budget(10)
 def my_jobs(request):
+    user = request.user
+    
+    # Fetch every job the user is involved in once, then split it up in memory
+    jobs = list(
+        Job.objects.filter(Q(client=user) | Q(freelancer=user))
+        .select_related('client', 'freelancer', 'work_submission')
+        .annotate(application_count=Count('applications'))
+    )
+    
     # Jobs posted by user (client)
-    posted_jobs = Job.objects.filter(client=request.user)
+    posted_jobs = [job for job in jobs if job.client_id == user.id]
     
-    # Jobs assigned to user (freelancer) - only in progress ones
-    assigned_jobs = Job.objects.filter(freelancer=request.user, status='in_progress')
+    # Jobs assigned to user (freelancer) - in progress or waiting for the client's review
+    assigned_jobs = [job for job in jobs if job.freelancer_id == user.id and job.status in ['in_progress', 'under_review']]
     
     # Completed jobs for freelancer
-    completed_jobs = Job.objects.filter(freelancer=request.user, status='completed')
+    completed_jobs = [job for job in jobs if job.freelancer_id == user.id and job.status == 'completed']
     
     # Jobs with submitted work (for client review)
-    jobs_under_review = Job.objects.filter(
-        client=request.user, 
-        status__in=['under_review', 'completed']
-    ).filter(work_submission__isnull=False)
+    jobs_under_review = [
+        job for job in posted_jobs
+        if job.status in ['under_review', 'completed'] and hasattr(job, 'work_submission')
+    ]
     
     # Calculate counts for client
-    pending_jobs = posted_jobs.filter(status__in=['open', 'in_progress', 'under_review'])
-    completed_client_jobs = posted_jobs.filter(status='completed')
+    pending_jobs = [job for job in posted_jobs if job.status in ['open', 'in_progress', 'under_review']]
+    completed_client_jobs = [job for job in posted_jobs if job.status == 'completed']
     
     context = {
         'posted_jobs': posted_jobs,
@@ -316,6 +568,7 @@ def my_jobs(request):
         'jobs_under_review': jobs_under_review,
         'pending_jobs': pending_jobs,
         'completed_client_jobs': completed_client_jobs,
+        'freelancer_jobs_count': len(assigned_jobs) + len(completed_jobs),
     }
     
     return render(request, 'jobs/my_jobs.html', context)
@@ -342,6 +595,7 @@ def view_work_submission(request, job_id):
             'is_client': request.user == job.client,
             'is_freelancer': request.user == job.freelancer,
             'has_review': has_review,  
+            'held_payment': Payment.objects.filter(job=job, status__in=['on_hold', 'disputed']).first(),
         }
         
         return render(request, 'jobs/submit_detail.html', context)
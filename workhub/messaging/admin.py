@@ -1,17 +1,27 @@
 from django.contrib import admin
-from .models import Conversation, Message, MessageNotification
+from .models import Conversation, ConversationMembership, Message, MessageNotification
+
+
+class ConversationMembershipInline(admin.TabularInline):
+    model = ConversationMembership
+    raw_id_fields = ('user',)
+    readonly_fields = ('unread_count', 'last_read_at', 'last_activity_at')
+    extra = 0
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'subject', 'get_participants', 'created_at', 'updated_at')
+    list_display = ('id', 'subject', 'is_group', 'get_participants', 'created_at', 'last_message_at')
     search_fields = ('subject', 'participants__username')
-    list_filter = ('created_at', 'updated_at')
-    filter_horizontal = ('participants', 'deleted_by')
+    list_filter = ('is_group', 'fanout_on_read', 'created_at', 'updated_at')
+    inlines = (ConversationMembershipInline,)
+    raw_id_fields = ('last_message',)
     ordering = ('-updated_at',)
 
     def get_participants(self, obj):
-        return ", ".join([user.username for user in obj.participants.all()])
+        # Groups may be large, name the first few
+        usernames = [user.username for user in obj.participants.all()[:10]]
+        return ", ".join(usernames)
     get_participants.short_description = 'Participants'
 
 
@@ -0,0 +1,15 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
+
+
+def messaging_context(request):
+    """Where pages get messaging updates from.
+    
+    The events stream is only offered to pages served over ASGI, pages
+    served over WSGI poll the unread count instead.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    return {
+        'messaging_events_url': reverse('messaging_events') if isinstance(request, ASGIRequest) else '',
+    }
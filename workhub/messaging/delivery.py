@@ -0,0 +1,87 @@
+"""Sending messages.
+
+send_message() is the write path for a new message. Each member's inbox is
+their membership row, so a message fans out on write: it is added to every
+other member's unread count and notifications, and moves the conversation
+to the top of each inbox. For a conversation of up to
+MESSAGING_FANOUT_BATCH_SIZE members that is one read of the member ids, then
+in one transaction the message INSERT, one bulk INSERT of notifications, one
+UPDATE of the membership rows and one UPDATE of the conversation row.
+
+Larger groups are fanned out in batches of that size, each in its own short
+transaction after the message is committed, so no single write holds the
+lock for the whole group. Groups of more than MESSAGING_FANOUT_MAX_MEMBERS
+stop fanning out: the conversation is marked fanout_on_read, and inboxes
+read its activity from the conversation row and count unread messages from
+last_read_at instead (see membership_unread). Only the membership rows of
+members who deleted the conversation are written, to bring it back.
+
+The attachment is written to content storage before the transaction starts,
+so the write lock is not held during file IO. If the transaction fails the
+stored file is left unreferenced for collect_media_garbage.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, When
+from . import realtime
+from .models import Conversation, Message, MessageNotification
+
+
+def _fan_out(conversation, message, user_ids):
+    MessageNotification.objects.bulk_create([
+        MessageNotification(user_id=user_id, message=message)
+        for user_id in user_ids if user_id != message.sender_id
+    ])
+    conversation.memberships.filter(user_id__in=user_ids).update(
+        unread_count=F('unread_count') + Case(When(user_id=message.sender_id, then=0), default=1),
+        deleted=False,
+        last_activity_at=message.created_at,
+    )
+
+
+def send_message(conversation, sender, content, attachment=None):
+    """Post a message to a conversation and return it.
+
+    Every other member gets a notification and an unread message, the
+    conversation moves to the top of everyone's inbox and comes back for
+    anyone who deleted it, and members' open pages are told once it commits.
+    A fanout_on_read group only has its conversation row and the memberships
+    that deleted it updated.
+    """
+    member_ids = list(conversation.memberships.order_by('user_id').values_list('user_id', flat=True))
+
+    fanout_on_read = conversation.fanout_on_read or len(member_ids) > getattr(settings, 'MESSAGING_FANOUT_MAX_MEMBERS', 1000)
+    batch_size = getattr(settings, 'MESSAGING_FANOUT_BATCH_SIZE', 200)
+    batches = [] if fanout_on_read else [
+        member_ids[start:start + batch_size] for start in range(0, len(member_ids), batch_size)
+    ]
+
+    message = Message(
+        conversation=conversation,
+        sender=sender,
+        content=content or '',
+        attachment_name=attachment.name if attachment else '',
+    )
+    if attachment:
+        message.attachment.save(attachment.name, attachment, save=False)
+
+    with transaction.atomic():
+        message.save()
+        if batches:
+            _fan_out(conversation, message, batches[0])
+        else:
+            conversation.memberships.filter(deleted=True).update(deleted=False)
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            updated_at=message.created_at,
+            fanout_on_read=fanout_on_read,
+        )
+        realtime.message_posted(message, member_ids)
+    conversation.fanout_on_read = fanout_on_read
+
+    for batch in batches[1:]:
+        with transaction.atomic():
+            _fan_out(conversation, message, batch)
+
+    return message
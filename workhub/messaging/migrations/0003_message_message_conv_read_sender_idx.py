@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_conversation_deleted_by'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'is_read', 'sender'], name='message_conv_read_sender_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:51
+
+import workhub.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_message_message_conv_read_sender_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=workhub.storage.content_storage, upload_to='message_attachments/'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill(apps, schema_editor):
+    """Fill in last messages, unread counts and deleted flags from the existing rows"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationMembership = apps.get_model('messaging', 'ConversationMembership')
+    Message = apps.get_model('messaging', 'Message')
+    
+    for conversation in Conversation.objects.prefetch_related('deleted_by').iterator(chunk_size=500):
+        last_message = Message.objects.filter(conversation=conversation).order_by('-created_at', '-id').first()
+        last_activity = last_message.created_at if last_message else conversation.created_at
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message=last_message,
+            last_message_at=last_message.created_at if last_message else None,
+        )
+        
+        deleted_ids = {user.id for user in conversation.deleted_by.all()}
+        unread = dict(
+            Message.objects.filter(conversation=conversation, is_read=False)
+            .values('sender').annotate(count=Count('id')).values_list('sender', 'count')
+        )
+        total_unread = sum(unread.values())
+        for membership in ConversationMembership.objects.filter(conversation=conversation):
+            membership.unread_count = total_unread - unread.get(membership.user_id, 0)
+            membership.deleted = membership.user_id in deleted_ids
+            membership.last_activity_at = last_activity
+            membership.save(update_fields=['unread_count', 'deleted', 'last_activity_at'])
+
+
+def restore_deleted_by(apps, schema_editor):
+    ConversationMembership = apps.get_model('messaging', 'ConversationMembership')
+    for membership in ConversationMembership.objects.filter(deleted=True).select_related('conversation'):
+        membership.conversation.deleted_by.add(membership.user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_message_content_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The participants table already holds one row per (conversation, user),
+        # so it becomes the membership table rather than being copied
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationMembership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='messaging.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'messaging_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='messaging.ConversationMembership', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='conversationmembership',
+            table=None,
+        ),
+        migrations.AddField(
+            model_name='conversationmembership',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmembership',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationmembership',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversationmembership',
+            name='deleted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill, restore_deleted_by),
+        migrations.RemoveField(
+            model_name='conversation',
+            name='deleted_by',
+        ),
+        migrations.AddIndex(
+            model_name='conversationmembership',
+            index=models.Index(fields=['user', 'deleted', '-last_activity_at', '-id'], name='membership_inbox_idx'),
+        ),
+    ]
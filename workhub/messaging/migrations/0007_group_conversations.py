@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0006_message_message_conv_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='fanout_on_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='is_group',
+            field=models.BooleanField(default=False),
+        ),
+    ]
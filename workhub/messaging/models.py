@@ -1,14 +1,24 @@
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
+from workhub.storage import content_storage
 
 class Conversation(models.Model):
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, related_name='conversations', through='ConversationMembership')
     subject = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_by = models.ManyToManyField(User, related_name='deleted_conversations', blank=True)
+    # Kept up to date when a message is sent so the inbox never reads messages
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Threads for more than two people, named by subject
+    is_group = models.BooleanField(default=False)
+    # Set for good once a group is too large to update every member's row on
+    # each message, see messaging.delivery
+    fanout_on_read = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['-updated_at']
@@ -17,14 +27,27 @@ class Conversation(models.Model):
         return f"Conversation {self.id}: {self.subject or 'No subject'}"
     
     def get_last_message(self):
-        return self.messages.first()
+        return self.last_message
     
     def get_other_participant(self, user):
         """Get the other participant in a 2-person conversation"""
         return self.participants.exclude(id=user.id).first()
     
+    def add_members(self, users):
+        """Add users to the conversation with nothing unread, skipping existing members"""
+        now = timezone.now()
+        ConversationMembership.objects.bulk_create([
+            ConversationMembership(
+                conversation=self,
+                user=user,
+                last_read_at=now,
+                last_activity_at=self.last_message_at or now,
+            )
+            for user in users
+        ], ignore_conflicts=True)
+    
     def mark_as_read(self, user):
-        """Mark all messages in conversation as read for a user"""
+        """Mark all messages in conversation as read for a user, returning how many were unread"""
         self.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
         # Also mark notifications as read
         MessageNotification.objects.filter(
@@ -32,34 +55,92 @@ class Conversation(models.Model):
             message__conversation=self,
             is_read=False
         ).update(is_read=True)
+        membership = self.memberships.filter(user=user)
+        cleared = membership.annotate(unread=membership_unread()).values_list('unread', flat=True).first() or 0
+        membership.update(unread_count=0, last_read_at=timezone.now())
+        return cleared
     
     def soft_delete_for_user(self, user):
         """Soft delete conversation for a specific user"""
-        self.deleted_by.add(user)
+        self.memberships.filter(user=user).update(deleted=True)
+    
+    def restore_for_user(self, user):
+        """Show a conversation the user deleted in their inbox again"""
+        self.memberships.filter(user=user, deleted=True).update(deleted=False)
     
     def is_deleted_for_user(self, user):
         """Check if conversation is deleted for a specific user"""
-        return self.deleted_by.filter(id=user.id).exists()
+        return self.memberships.filter(user=user, deleted=True).exists()
+
+
+class ConversationMembership(models.Model):
+    """One user's view of a conversation: their unread count and whether they deleted it.
+    
+    last_activity_at copies the time of the conversation's last message (or
+    its creation), so a user's inbox is one index scan over their rows.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    deleted = models.BooleanField(default=False)
+    
+    class Meta:
+        unique_together = [('conversation', 'user')]
+        indexes = [
+            models.Index(fields=['user', 'deleted', '-last_activity_at', '-id'], name='membership_inbox_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} in conversation {self.conversation_id}"
+
+
+def membership_unread():
+    """Expression for the number of messages a membership has not read.
+    
+    That is the stored unread_count, except in fan-out-on-read groups where
+    it is not kept up to date: there the messages from others since
+    last_read_at are counted instead.
+    """
+    since_read = Message.objects.filter(
+        conversation=OuterRef('conversation'),
+        created_at__gt=OuterRef('last_read_at'),
+    ).exclude(
+        sender=OuterRef('user'),
+    ).order_by().values('conversation').annotate(total=Count('id')).values('total')
+    
+    return Case(
+        When(conversation__fanout_on_read=True, then=Coalesce(Subquery(since_read), 0)),
+        default=F('unread_count'),
+        output_field=models.PositiveIntegerField(),
+    )
 
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
-    attachment = models.FileField(upload_to='message_attachments/', blank=True, null=True)
+    attachment = models.FileField(upload_to='message_attachments/', storage=content_storage, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'is_read', 'sender'], name='message_conv_read_sender_idx'),
+            # Keyset pages of a conversation's history
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_conv_created_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} at {self.created_at}"
     
     def get_attachment_name(self):
-        """Get just the filename without the directory path"""
+        """Get the name the attachment was uploaded with"""
         if self.attachment:
-            return os.path.basename(self.attachment.name)
+            return self.attachment_name or os.path.basename(self.attachment.name)
         return None
 
 
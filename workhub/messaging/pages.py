@@ -0,0 +1,64 @@
+"""Queries behind the inbox and conversation pages.
+
+The views render these, and the index_advisor command runs them through
+EXPLAIN, so both see the same SQL.
+"""
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from jobs.pagination import encode_cursor, paginate_keyset
+from .models import ConversationMembership, membership_unread
+
+
+def inbox_page(user, cursor):
+    """One page of a user's memberships, newest activity first, and the next cursor.
+
+    Rows are read through the (user, deleted, last_activity_at) index, with
+    the activity time in activity_at and the unread count in unread. The
+    few fanout_on_read groups a user belongs to keep no activity on their
+    rows, so they are paged separately by the conversation's last message
+    and merged in.
+    """
+    page_size = getattr(settings, 'INBOX_PAGE_SIZE', 50)
+    other_member = ConversationMembership.objects.filter(
+        conversation=OuterRef('conversation'),
+    ).exclude(user=OuterRef('user')).order_by('id').values('user__username')[:1]
+
+    memberships = ConversationMembership.objects.filter(
+        user=user,
+        deleted=False,
+    ).select_related(
+        'conversation__last_message__sender',
+    ).annotate(
+        other_username=Subquery(other_member),
+    )
+    read_side = list(memberships.filter(conversation__fanout_on_read=True).values_list('id', flat=True))
+
+    rows, next_cursor = paginate_keyset(
+        memberships.exclude(id__in=read_side), cursor, page_size, field='last_activity_at',
+    )
+    for row in rows:
+        row.activity_at, row.unread = row.last_activity_at, row.unread_count
+
+    if read_side:
+        group_rows, group_cursor = paginate_keyset(
+            memberships.filter(id__in=read_side).annotate(
+                activity_at=Coalesce('conversation__last_message_at', 'last_activity_at'),
+                unread=membership_unread(),
+            ),
+            cursor, page_size, field='activity_at',
+        )
+        rows = sorted(rows + group_rows, key=lambda row: (row.activity_at, row.id), reverse=True)
+        if next_cursor or group_cursor or len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1].activity_at, rows[-1].id)
+
+    return rows, next_cursor
+
+
+def message_page(conversation, cursor=None):
+    """One page of a conversation's messages, newest first, and the cursor for older ones"""
+    return paginate_keyset(
+        conversation.messages.select_related('sender'), cursor,
+        getattr(settings, 'CONVERSATION_PAGE_SIZE', 50),
+    )
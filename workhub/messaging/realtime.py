@@ -0,0 +1,201 @@
+"""Push messaging events to connected browsers.
+
+A signed-in page served over ASGI keeps one Server-Sent Events stream open
+(the events view) on its user's channel, ``user:<id>``. Views publish small JSON events to the
+channel once their transaction commits:
+
+    message   a message was posted in one of the user's conversations
+    unread    the user's unread total changed by ``delta``
+    resync    events were dropped, the page should re-read its state
+
+The hub fans events out to the streams connected to this process. The broker
+carries published events to the hub of every process serving streams, and
+MESSAGING_BROKER names its class. InMemoryBroker hands them straight to the
+local hub, which is all one ASGI process or a test needs. Several worker
+processes need a broker over a shared transport (Redis pub/sub, Postgres
+LISTEN/NOTIFY) that passes what it receives to hub.dispatch().
+
+An open stream is a coroutine waiting on its queue, so streams are only
+served over ASGI. Under WSGI each one would hold a worker for as long as the
+page is open, so there the events view turns streams away and pages poll
+api/unread-count/ instead (see messaging.context_processors).
+"""
+import abc
+import asyncio
+import json
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+RESYNC = {'type': 'resync'}
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RETRY_FRAME = 'retry: 5000\n\n'
+KEEPALIVE_FRAME = ': keepalive\n\n'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """Events waiting for one connected stream on the event loop.
+
+    The queue is bounded: a stream that falls behind loses what does not fit
+    and is sent a resync event instead.
+    """
+
+    def __init__(self, hub, channel, loop):
+        self.hub = hub
+        self.channel = channel
+        self._loop = loop
+        self._queue = asyncio.Queue(getattr(settings, 'MESSAGING_EVENTS_QUEUE_SIZE', 100))
+        self._overflowed = False
+
+    def deliver(self, event):
+        # Called from whichever thread published the event
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop closed, so the stream is gone
+            pass
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflowed = True
+
+    def _resync(self):
+        self._overflowed = False
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        return RESYNC
+
+    async def get(self, timeout):
+        """Next event, or None if none arrives within timeout seconds"""
+        if self._overflowed:
+            return self._resync()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Channels and the subscriptions connected to them in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channel, loop):
+        subscription = Subscription(self, channel, loop)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def dispatch(self, channel, event):
+        """Hand event to every subscription on channel in this process"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class Broker(abc.ABC):
+    """Carries published events to the hub of every process serving streams"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    @abc.abstractmethod
+    def publish(self, channel, event):
+        """Get event to hub.dispatch(channel, event) in every process"""
+
+
+class InMemoryBroker(Broker):
+    """Delivers to this process's hub only"""
+
+    def publish(self, channel, event):
+        self.hub.dispatch(channel, event)
+
+
+hub = Hub()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    broker_class = import_string(getattr(settings, 'MESSAGING_BROKER', 'messaging.realtime.InMemoryBroker'))
+    return broker_class(hub)
+
+
+def publish(user_ids, event):
+    """Send event to each user's channel once the current transaction commits"""
+    user_ids = list(user_ids)
+
+    def send():
+        broker = get_broker()
+        for user_id in user_ids:
+            broker.publish(user_channel(user_id), event)
+
+    # A broker that is down must not fail a request whose data is committed
+    transaction.on_commit(send, robust=True)
+
+
+def message_posted(message, member_ids):
+    """Announce a new message to a conversation's members.
+
+    The sender gets the message event too, for their other open pages, but
+    only the other members have it added to their unread count.
+    """
+    publish(member_ids, {
+        'type': 'message',
+        'conversation_id': message.conversation_id,
+        'message_id': message.id,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'preview': (message.content or '')[:100],
+        'has_attachment': bool(message.attachment),
+        'created_at': message.created_at,
+    })
+    publish([user_id for user_id in member_ids if user_id != message.sender_id], {
+        'type': 'unread', 'conversation_id': message.conversation_id, 'delta': 1,
+    })
+
+
+def unread_changed(user_id, conversation_id, delta):
+    """Tell a user's pages their unread total moved by delta"""
+    publish([user_id], {'type': 'unread', 'conversation_id': conversation_id, 'delta': delta})
+
+
+def _frame(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def stream(subscription, keepalive):
+    """Server-Sent Events body for one subscription.
+
+    The keepalive comment also finds out about a closed connection: the
+    server cancels this generator and the subscription goes.
+    """
+    try:
+        yield RETRY_FRAME
+        while True:
+            event = await subscription.get(keepalive)
+            yield _frame(event) if event else KEEPALIVE_FRAME
+    finally:
+        subscription.close()
@@ -1,3 +1,230 @@
-from django.test import TestCase
+import asyncio
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import realtime
+from .delivery import send_message
+from .models import Conversation, ConversationMembership, MessageNotification, membership_unread
+from .pages import inbox_page
 
-# Create your tests here.
+
+def make_conversation(users, **fields):
+    conversation = Conversation.objects.create(**fields)
+    conversation.add_members(users)
+    return conversation
+
+
+def unread_by_user(conversation):
+    return dict(
+        conversation.memberships.annotate(unread=membership_unread()).values_list('user__username', 'unread')
+    )
+
+
+class SendMessageTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{i}') for i in range(5)]
+        self.sender = self.users[0]
+
+    def test_message_fans_out_to_the_other_members(self):
+        conversation = make_conversation(self.users[:3], is_group=True, subject='Team')
+        conversation.soft_delete_for_user(self.users[2])
+
+        message = send_message(conversation, self.sender, 'Hello')
+
+        self.assertEqual(unread_by_user(conversation), {'user0': 0, 'user1': 1, 'user2': 1})
+        self.assertEqual(
+            set(MessageNotification.objects.values_list('user__username', flat=True)), {'user1', 'user2'},
+        )
+        memberships = conversation.memberships.all()
+        self.assertTrue(all(membership.last_activity_at == message.created_at for membership in memberships))
+        self.assertFalse(any(membership.deleted for membership in memberships))
+
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.last_message, conversation.last_message_at), (message, message.created_at))
+        self.assertFalse(conversation.fanout_on_read)
+
+    @override_settings(MESSAGING_FANOUT_BATCH_SIZE=2)
+    def test_large_group_is_fanned_out_in_batches(self):
+        conversation = make_conversation(self.users, is_group=True, subject='Team')
+
+        send_message(conversation, self.sender, 'One')
+        send_message(conversation, self.users[4], 'Two')
+
+        self.assertEqual(
+            unread_by_user(conversation),
+            {'user0': 1, 'user1': 2, 'user2': 2, 'user3': 2, 'user4': 1},
+        )
+        self.assertEqual(MessageNotification.objects.count(), 8)
+
+    @override_settings(MESSAGING_FANOUT_MAX_MEMBERS=3)
+    def test_oversized_group_is_read_on_demand(self):
+        conversation = make_conversation(self.users, is_group=True, subject='Everyone')
+
+        send_message(conversation, self.sender, 'One')
+        send_message(conversation, self.sender, 'Two')
+
+        conversation.refresh_from_db()
+        self.assertTrue(conversation.fanout_on_read)
+        self.assertFalse(MessageNotification.objects.exists())
+        self.assertEqual(set(conversation.memberships.values_list('unread_count', flat=True)), {0})
+        self.assertEqual(unread_by_user(conversation)['user1'], 2)
+        self.assertEqual(unread_by_user(conversation)['user0'], 0)
+
+        self.client.force_login(self.users[1])
+        self.assertEqual(self.client.get(reverse('unread_count')).json(), {'unread_count': 2})
+        self.assertEqual(conversation.mark_as_read(self.users[1]), 2)
+        self.assertEqual(self.client.get(reverse('unread_count')).json(), {'unread_count': 0})
+
+    @override_settings(MESSAGING_FANOUT_MAX_MEMBERS=3)
+    def test_oversized_group_comes_back_for_members_who_deleted_it(self):
+        conversation = make_conversation(self.users, is_group=True, subject='Everyone')
+        send_message(conversation, self.sender, 'One')
+        conversation.soft_delete_for_user(self.users[1])
+        self.assertEqual(inbox_page(self.users[1], None)[0], [])
+
+        send_message(conversation, self.sender, 'Two')
+
+        self.assertFalse(conversation.memberships.filter(deleted=True).exists())
+        self.assertEqual(
+            [membership.conversation_id for membership in inbox_page(self.users[1], None)[0]], [conversation.id],
+        )
+
+    def test_conversation_view_sends_and_marks_read(self):
+        conversation = make_conversation(self.users[:2])
+        self.client.force_login(self.sender)
+        self.client.post(reverse('conversation_detail', args=[conversation.id]), {'content': 'Hi'})
+
+        self.client.force_login(self.users[1])
+        self.assertEqual(self.client.get(reverse('unread_count')).json(), {'unread_count': 1})
+        self.client.get(reverse('conversation_detail', args=[conversation.id]))
+        self.assertEqual(self.client.get(reverse('unread_count')).json(), {'unread_count': 0})
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('me')
+        self.others = [User.objects.create_user(f'user{i}') for i in range(4)]
+
+    def inbox_ids(self, cursor=None):
+        rows, next_cursor = inbox_page(self.user, cursor)
+        return [row.conversation_id for row in rows], next_cursor
+
+    @override_settings(MESSAGING_FANOUT_MAX_MEMBERS=3)
+    def test_read_on_demand_groups_are_merged_by_activity(self):
+        older = make_conversation([self.user, self.others[0]])
+        group = make_conversation([self.user, *self.others], is_group=True, subject='Everyone')
+        newer = make_conversation([self.user, self.others[1]])
+
+        send_message(older, self.others[0], 'First')
+        send_message(group, self.others[2], 'Second')
+        send_message(newer, self.others[1], 'Third')
+
+        rows, next_cursor = inbox_page(self.user, None)
+        self.assertEqual([row.conversation_id for row in rows], [newer.id, group.id, older.id])
+        self.assertEqual([row.unread for row in rows], [1, 1, 1])
+        self.assertIsNone(next_cursor)
+
+    @override_settings(MESSAGING_FANOUT_MAX_MEMBERS=3, INBOX_PAGE_SIZE=2)
+    def test_mergedinbox_pages_without_gaps(self):
+        conversations = [make_conversation([self.user, other]) for other in self.others[:3]]
+        group = make_conversation([self.user, *self.others], is_group=True, subject='Everyone')
+        for conversation, sender in zip(conversations, self.others):
+            send_message(conversation, sender, 'Hello')
+            send_message(group, sender, 'Hello group')
+
+        first, cursor = self.inbox_ids()
+        second, last_cursor = self.inbox_ids(cursor)
+
+        self.assertEqual(first, [group.id, conversations[2].id])
+        self.assertEqual(second, [conversations[1].id, conversations[0].id])
+        self.assertIsNone(last_cursor)
+
+    def test_deleted_conversations_are_left_out(self):
+        kept = make_conversation([self.user, self.others[0]])
+        deleted = make_conversation([self.user, self.others[1]])
+        deleted.soft_delete_for_user(self.user)
+
+        self.assertEqual(self.inbox_ids(), ([kept.id], None))
+
+        send_message(deleted, self.others[1], 'Are you there?')
+        self.assertEqual(self.inbox_ids()[0], [deleted.id, kept.id])
+
+    def test_membership_created_for_participants(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user, self.others[0])
+
+        self.assertEqual(ConversationMembership.objects.filter(conversation=conversation).count(), 2)
+
+
+class ConversationHistoryTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{i}') for i in range(2)]
+        self.conversation = make_conversation(self.users)
+        self.messages = [send_message(self.conversation, self.users[i % 2], f'Message {i}') for i in range(5)]
+        self.client.force_login(self.users[0])
+
+    def page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        return self.client.get(reverse('conversation_messages', args=[self.conversation.id]), params).json()
+
+    @override_settings(CONVERSATION_PAGE_SIZE=2)
+    def test_older_pages_follow_the_cursor(self):
+        pages, cursor = [], None
+        while True:
+            data = self.page(cursor)
+            pages.append([message['id'] for message in data['messages']])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        ids = [message.id for message in self.messages]
+        self.assertEqual(pages, [ids[3:], ids[1:3], ids[:1]])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('conversation_messages', args=[self.conversation.id]), {'cursor': 'nope'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class RealtimeTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{i}') for i in range(2)]
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, user):
+        subscription = realtime.hub.subscribe(realtime.user_channel(user.id), self.loop)
+        self.addCleanup(subscription.close)
+        return subscription
+
+    def events(self, subscription):
+        events = []
+        while event := self.loop.run_until_complete(subscription.get(0.01)):
+            events.append(event)
+        return events
+
+    def test_members_hear_about_a_message_once_it_commits(self):
+        conversation = make_conversation(self.users)
+        sender, recipient = self.subscribe(self.users[0]), self.subscribe(self.users[1])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            send_message(conversation, self.users[0], 'Hello')
+            self.assertEqual(self.events(recipient), [])
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual([event['type'] for event in self.events(recipient)], ['message', 'unread'])
+        self.assertEqual([event['type'] for event in self.events(sender)], ['message'])
+
+    @override_settings(MESSAGING_EVENTS_QUEUE_SIZE=1)
+    def test_stream_that_falls_behind_is_told_to_resync(self):
+        subscription = self.subscribe(self.users[1])
+        for delta in (1, 1, 1):
+            realtime.hub.dispatch(realtime.user_channel(self.users[1].id), {'type': 'unread', 'delta': delta})
+
+        self.assertEqual(self.events(subscription), [realtime.RESYNC])
+
+    def test_wsgi_requests_are_told_to_poll(self):
+        self.client.force_login(self.users[0])
+
+        self.assertEqual(self.client.get(reverse('messaging_events')).status_code, 204)
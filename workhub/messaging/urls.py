@@ -5,7 +5,11 @@ urlpatterns = [
     path('inbox/', views.inbox, name='inbox'),
     path('conversation/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
     path('conversation/<int:conversation_id>/delete/', views.delete_conversation, name='delete_conversation'),
+    path('conversation/<int:conversation_id>/members/', views.add_group_members, name='add_group_members'),
+    path('start-group/', views.start_group_conversation, name='start_group_conversation'),
     path('start-conversation/<int:user_id>/', views.start_conversation_with_user, name='start_conversation_with_user'),
     path('api/unread-count/', views.unread_count, name='unread_count'),
+    path('api/conversation/<int:conversation_id>/messages/', views.conversation_messages, name='conversation_messages'),
+    path('api/events/', views.events, name='messaging_events'),
     path('api/message/<int:message_id>/mark-read/', views.mark_as_read, name='mark_message_read'),
 ]
\ No newline at end of file
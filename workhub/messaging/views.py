@@ -1,35 +1,44 @@
+import asyncio
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import JsonResponse
-from django.db.models import Q, Count, Max
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Sum
+from django.conf import settings
 from django.contrib import messages as django_messages
-from .models import Conversation, Message, MessageNotification
+from jobs.pagination import decode_cursor
+from . import realtime
+from .delivery import send_message
+from .pages import inbox_page, message_page
+from .models import Conversation, ConversationMembership, Message, membership_unread
 
 @login_required
 def inbox(request):
-    """Display all conversations for the logged-in user"""
-    conversations = Conversation.objects.filter(
-        participants=request.user
-    ).exclude(
-        deleted_by=request.user  # Exclude conversations deleted by this user
-    ).annotate(
-        unread_count=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user))
-    ).prefetch_related('participants', 'messages').order_by('-updated_at')  # Sort by most recent first
+    """Display the logged-in user's conversations, newest activity first.
     
-    # Add other_participant to each conversation for easier template access
-    for conversation in conversations:
-        conversation.other_participant = conversation.get_other_participant(request.user)
+    Rendered from the user's membership rows: the last message and unread
+    count are stored on them, and the other participant's name comes from a
+    subquery. See inbox_page for groups too large to fan out to.
+    """
+    page, next_cursor = inbox_page(request.user, request.GET.get('cursor'))
     
     context = {
-        'conversations': conversations,
+        'memberships': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'messaging/inbox.html', context)
 
 
 @login_required
 def conversation_detail(request, conversation_id):
-    """Display messages in a conversation and handle new message submission"""
+    """Display the latest messages in a conversation and handle new message submission
+    
+    Older messages are loaded on demand from conversation_messages.
+    """
     conversation = get_object_or_404(
         Conversation, 
         id=conversation_id, 
@@ -46,27 +55,7 @@ def conversation_detail(request, conversation_id):
         attachment = request.FILES.get('attachment')
         
         if content or attachment:
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                content=content,
-                attachment=attachment
-            )
-            
-            # Create notifications for other participants (silently)
-            for participant in conversation.participants.exclude(id=request.user.id):
-                MessageNotification.objects.create(
-                    user=participant,
-                    message=message
-                )
-            
-            # If the conversation was deleted by the other participant, restore it
-            for participant in conversation.participants.exclude(id=request.user.id):
-                if conversation.is_deleted_for_user(participant):
-                    conversation.deleted_by.remove(participant)
-            
-            conversation.updated_at = message.created_at
-            conversation.save()
+            send_message(conversation, request.user, content, attachment)
             
             # Clear any Django messages before redirect to prevent notification display
             storage = django_messages.get_messages(request)
@@ -75,22 +64,64 @@ def conversation_detail(request, conversation_id):
             return redirect('conversation_detail', conversation_id=conversation.id)
     
     # Mark messages as read
-    conversation.mark_as_read(request.user)
+    cleared = conversation.mark_as_read(request.user)
+    if cleared:
+        realtime.unread_changed(request.user.id, conversation.id, -cleared)
 
     # Clear any system-wide notifications, as they are redundant on this page
     storage = django_messages.get_messages(request)
     storage.used = True
     
-    messages = conversation.messages.select_related('sender').all()
-    other_participant = conversation.get_other_participant(request.user)
+    messages, older_cursor = message_page(conversation)
     
     context = {
         'conversation': conversation,
         'messages': messages,
-        'other_participant': other_participant,
+        'older_cursor': older_cursor,
     }
+    if conversation.is_group:
+        # Name a few members in the header, groups may be large
+        members = list(conversation.participants.exclude(id=request.user.id).order_by('username')[:5])
+        context['members'] = members
+        context['more_members'] = conversation.memberships.count() - 1 - len(members)
+    else:
+        context['other_participant'] = conversation.get_other_participant(request.user)
     return render(request, 'messaging/conversation.html', context)
 
+@login_required
+def conversation_messages(request, conversation_id):
+    """API endpoint returning the page of messages older than ?cursor=
+    
+    Each page is one index range scan over (conversation, created_at, id), so
+    loading history costs the same however far back it goes. The messages
+    come both as data and rendered, oldest first, ready to prepend.
+    """
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    
+    cursor = request.GET.get('cursor')
+    if cursor and not decode_cursor(cursor):
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+    
+    messages, older_cursor = message_page(conversation, cursor)
+    
+    return JsonResponse({
+        'success': True,
+        'messages': [
+            {
+                'id': message.id,
+                'sender': message.sender.username,
+                'content': message.content,
+                'attachment_name': message.get_attachment_name(),
+                'attachment_url': message.attachment.url if message.attachment else None,
+                'is_read': message.is_read,
+                'created_at': message.created_at,
+            }
+            for message in reversed(messages)
+        ],
+        'html': render_to_string('messaging/message_list.html', {'messages': messages}, request=request),
+        'next_cursor': older_cursor,
+    })
+
 @login_required
 def delete_conversation(request, conversation_id):
     """Soft delete a conversation for the current user"""
@@ -114,6 +145,7 @@ def start_conversation_with_user(request, user_id):
     
     # Check if a conversation already exists between these two users
     existing_conversation = Conversation.objects.filter(
+        is_group=False,
         participants=request.user
     ).filter(
         participants=other_user
@@ -121,8 +153,7 @@ def start_conversation_with_user(request, user_id):
     
     if existing_conversation:
         # If conversation was deleted by current user, restore it
-        if existing_conversation.is_deleted_for_user(request.user):
-            existing_conversation.deleted_by.remove(request.user)
+        existing_conversation.restore_for_user(request.user)
         
         # Redirect to existing conversation
         return redirect('conversation_detail', conversation_id=existing_conversation.id)
@@ -134,17 +165,66 @@ def start_conversation_with_user(request, user_id):
     # Redirect to the new conversation
     return redirect('conversation_detail', conversation_id=conversation.id)
 
+
+def _users_from_usernames(request, exclude):
+    """Users named in the comma-separated usernames field, or None after flashing an error"""
+    usernames = {name.strip() for name in request.POST.get('usernames', '').split(',') if name.strip()}
+    users = list(User.objects.filter(username__in=usernames).exclude(id__in=exclude))
+    
+    unknown = usernames - {user.username for user in users} - {request.user.username}
+    if unknown:
+        django_messages.error(request, f"Unknown users: {', '.join(sorted(unknown))}")
+        return None
+    if not users:
+        django_messages.error(request, 'Add at least one other person.')
+        return None
+    return users
+
+
+@login_required
+def start_group_conversation(request):
+    """Start a named conversation with several users, e.g. a client and their freelancers"""
+    if request.method != 'POST':
+        return redirect('inbox')
+    
+    subject = request.POST.get('subject', '').strip()
+    if not subject:
+        django_messages.error(request, 'Give the group a name.')
+        return redirect('inbox')
+    
+    members = _users_from_usernames(request, exclude=[request.user.id])
+    if members is None:
+        return redirect('inbox')
+    
+    with transaction.atomic():
+        conversation = Conversation.objects.create(subject=subject, is_group=True)
+        conversation.add_members([request.user, *members])
+    
+    return redirect('conversation_detail', conversation_id=conversation.id)
+
+
+@login_required
+def add_group_members(request, conversation_id):
+    """Add users to a group conversation the current user belongs to"""
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user, is_group=True)
+    
+    if request.method == 'POST':
+        members = _users_from_usernames(
+            request, exclude=conversation.memberships.values_list('user_id', flat=True),
+        )
+        if members is not None:
+            conversation.add_members(members)
+            django_messages.success(request, f'Added {len(members)} to the group.')
+    
+    return redirect('conversation_detail', conversation_id=conversation.id)
+
 @login_required
 def unread_count(request):
     """API endpoint to get unread message count"""
-    count = Message.objects.filter(
-        conversation__participants=request.user,
-        is_read=False
-    ).exclude(
-        sender=request.user
-    ).exclude(
-        conversation__deleted_by=request.user  # Exclude messages from deleted conversations
-    ).count()
+    count = ConversationMembership.objects.filter(
+        user=request.user,
+        deleted=False,  # Exclude messages from deleted conversations
+    ).annotate(unread=membership_unread()).aggregate(total=Sum('unread'))['total'] or 0
     
     return JsonResponse({'unread_count': count})
 
@@ -155,7 +235,35 @@ def mark_as_read(request, message_id):
     message = get_object_or_404(Message, id=message_id, conversation__participants=request.user)
     
     if message.sender != request.user:
-        message.is_read = True
-        message.save()
+        with transaction.atomic():
+            # Only the request that flips the flag takes it off the unread count
+            if Message.objects.filter(pk=message.pk, is_read=False).update(is_read=True):
+                if ConversationMembership.objects.filter(
+                    conversation_id=message.conversation_id, user=request.user, unread_count__gt=0,
+                ).update(unread_count=F('unread_count') - 1):
+                    realtime.unread_changed(request.user.id, message.conversation_id, -1)
+    
+    return JsonResponse({'success': True})
+
+
+@login_required
+async def events(request):
+    """Server-Sent Events stream of the user's messaging events.
+    
+    Pages keep this open instead of polling api/unread-count/, see
+    messaging.realtime. Streams are only served over ASGI: under WSGI one
+    would hold a worker for as long as the page is open, so it is refused
+    with 204, which stops EventSource reconnecting, and the page polls.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    user = await request.auser()
+    subscription = realtime.hub.subscribe(realtime.user_channel(user.id), asyncio.get_running_loop())
+    content = realtime.stream(subscription, getattr(settings, 'MESSAGING_EVENTS_KEEPALIVE', 15))
     
-    return JsonResponse({'success': True})
\ No newline at end of file
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
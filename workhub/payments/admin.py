@@ -1,25 +1,101 @@
 from django.contrib import admin
-from .models import Wallet, Payment, Transaction
+from . import escrow
+from .models import Wallet, Payment, Transaction, WalletSnapshot, PaymentDailyRollup, PayoutBatch, WalletReconciliation, ExchangeRate, OutboxEvent
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ['user', 'balance', 'created_at', 'updated_at']
+    list_display = ['user', 'balance', 'currency', 'last_sequence', 'created_at', 'updated_at']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['balance', 'last_sequence', 'created_at', 'updated_at']
+    
+    def get_readonly_fields(self, request, obj=None):
+        # The balance and every ledger entry are in the wallet's currency
+        if obj is not None:
+            return self.readonly_fields + ['currency']
+        return self.readonly_fields
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ['id', 'from_user', 'to_user', 'amount', 'status', 'payment_type', 'created_at']
-    list_filter = ['status', 'payment_type', 'created_at']
+    list_display = ['id', 'from_user', 'to_user', 'amount', 'currency', 'status', 'payment_type', 'release_after', 'created_at']
+    list_filter = ['status', 'payment_type', 'currency', 'created_at']
     search_fields = ['from_user__username', 'to_user__username', 'job__title']
     readonly_fields = ['created_at', 'updated_at']
-    raw_id_fields = ['job', 'from_user', 'to_user']
+    raw_id_fields = ['job', 'from_user', 'to_user', 'payout_batch']
+    actions = ['release_to_freelancer', 'refund_to_client']
+    
+    def _resolve(self, request, queryset, move, verb):
+        # Held and disputed payments are settled through escrow so the wallets move too
+        done = 0
+        for payment in queryset.filter(payment_type='job_payment', status__in=['on_hold', 'disputed']):
+            try:
+                move(payment, resolve=True)
+                done += 1
+            except escrow.InvalidTransition:
+                pass
+        self.message_user(request, f'{verb} {done} payments')
+    
+    @admin.action(description='Release selected held or disputed payments to the freelancer')
+    def release_to_freelancer(self, request, queryset):
+        self._resolve(request, queryset, escrow.release, 'Released')
+    
+    @admin.action(description='Refund selected held or disputed payments to the client')
+    def refund_to_client(self, request, queryset):
+        self._resolve(request, queryset, escrow.refund, 'Refunded')
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ['wallet', 'amount', 'transaction_type', 'balance_after', 'created_at']
+    list_display = ['wallet', 'sequence', 'amount', 'transaction_type', 'balance_after', 'created_at']
     list_filter = ['transaction_type', 'created_at']
     search_fields = ['wallet__user__username', 'description']
     readonly_fields = ['created_at']
-    raw_id_fields = ['wallet', 'payment']
\ No newline at end of file
+    raw_id_fields = ['wallet', 'payment']
+    
+    # The ledger is append-only, entries are written by payments.ledger
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(WalletSnapshot)
+class WalletSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['wallet', 'sequence', 'balance', 'created_at']
+    search_fields = ['wallet__user__username']
+    readonly_fields = ['wallet', 'sequence', 'balance', 'created_at']
+
+@admin.register(PaymentDailyRollup)
+class PaymentDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'direction', 'payment_type', 'status', 'currency', 'total', 'count']
+    list_filter = ['direction', 'payment_type', 'status', 'day']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'currency', 'payments_count', 'rejected_count', 'total', 'created_at', 'completed_at']
+    list_filter = ['status', 'currency', 'created_at']
+    readonly_fields = ['status', 'currency', 'total', 'payments_count', 'rejected_count', 'csv_file', 'xml_file', 'created_at', 'completed_at']
+
+
+@admin.register(WalletReconciliation)
+class WalletReconciliationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'started_at', 'wallets_checked', 'transactions_checked', 'discrepancies', 'duration_seconds', 'workers']
+    readonly_fields = ['started_at', 'finished_at', 'shards', 'workers', 'wallets_checked', 'transactions_checked', 'discrepancies', 'duration_seconds', 'report']
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ['base', 'quote', 'day', 'rate', 'created_at']
+    list_filter = ['base', 'quote', 'day']
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'created_at', 'processed_at', 'attempts', 'available_at']
+    list_filter = ['topic', 'processed_at']
+    readonly_fields = ['topic', 'payload', 'created_at', 'processed_at', 'attempts', 'last_error']
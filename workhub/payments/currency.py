@@ -0,0 +1,39 @@
+"""Currencies amounts can be held in, and how to show them.
+
+Kept free of model imports so any app's models can use the choices.
+"""
+from decimal import Decimal
+
+DEFAULT_CURRENCY = 'USD'
+
+CURRENCY_CHOICES = [
+    ('USD', 'US Dollar'),
+    ('EUR', 'Euro'),
+    ('GBP', 'British Pound'),
+    ('CAD', 'Canadian Dollar'),
+    ('AUD', 'Australian Dollar'),
+    ('AED', 'UAE Dirham'),
+    ('INR', 'Indian Rupee'),
+    ('PKR', 'Pakistani Rupee'),
+]
+
+CURRENCY_CODES = {code for code, name in CURRENCY_CHOICES}
+
+SYMBOLS = {
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'CAD': 'CA$',
+    'AUD': 'A$',
+    'INR': '₹',
+}
+
+
+def format_money(amount, currency=DEFAULT_CURRENCY):
+    """Amount with its currency symbol, e.g. $12.50 or 12.50 PKR"""
+    amount = Decimal(amount or 0).quantize(Decimal('0.01'))
+    sign = '-' if amount < 0 else ''
+    symbol = SYMBOLS.get(currency)
+    if symbol:
+        return f'{sign}{symbol}{abs(amount)}'
+    return f'{sign}{abs(amount)} {currency}'
@@ -0,0 +1,209 @@
+"""Escrow for job payments.
+
+When a client accepts an application, the amount leaves their wallet and is
+held on a job Payment with status on_hold. From there it moves on as follows:
+
+    on_hold  -> completed   release(): paid to the freelancer
+    on_hold  -> refunded    refund(): returned to the client
+    on_hold  -> disputed    dispute(): frozen until staff resolve it
+    disputed -> completed / refunded   release() / refund() with resolve=True
+
+Every move is one conditional UPDATE on the payment's current status, so two
+requests racing to release and refund the same payment cannot both pay out.
+
+The auto-release clock starts when the freelancer delivers the work, not
+when the hold is placed: deliver() gives the hold a release_after time and
+the job waits under_review for the client to approve it or dispute it. The
+release_due_payments command finds holds past their time through the
+(status, release_after) index, releases them in batches and completes their
+jobs. Holds whose job is not under review are never released automatically.
+
+A payment is in its job's currency. Each wallet moves in its own currency:
+the hold debits the client the converted amount, a release credits the
+freelancer at that day's rate, and a refund returns exactly what was debited.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from . import fx, ledger
+from jobs.models import Job, WorkSubmission, job_detail_cache_key
+from .currency import DEFAULT_CURRENCY
+from .models import Payment, Wallet
+from .signals import payments_changed
+
+HELD = 'on_hold'
+DISPUTED = 'disputed'
+
+
+class InvalidTransition(Exception):
+    """Raised when a payment is not in a state the requested move starts from"""
+
+
+def release_deadline(now=None):
+    """When a hold whose work is delivered now is released automatically, None if never"""
+    days = getattr(settings, 'ESCROW_AUTO_RELEASE_DAYS', 14)
+    if days is None:
+        return None
+    return (now or timezone.now()) + timedelta(days=days)
+
+
+def hold(job, client, freelancer, amount):
+    """Take amount from the client's wallet and hold it for the freelancer.
+
+    Raises ledger.InsufficientFunds, creating nothing, if the client cannot
+    cover it.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.create(
+            job=job,
+            from_user=client,
+            to_user=freelancer,
+            amount=amount,
+            currency=job.currency,
+            status=HELD,
+            payment_type='job_payment',
+            description=f'Payment for job: {job.title}',
+        )
+        debit = fx.convert(amount, job.currency, ledger.wallet_currency(client))
+        ledger.transfer(client, None, debit, payment, f'Payment on hold for job: {job.title}')
+    return payment
+
+
+def deliver(job, now=None):
+    """Start the auto-release clock on a job's held payment, returning it or None.
+
+    Called when the freelancer submits the work. Restarts the clock if work
+    is delivered again.
+    """
+    payment = Payment.objects.filter(job=job, status=HELD, to_user_id=job.freelancer_id).first()
+    if payment is None:
+        return None
+
+    payment.release_after = release_deadline(now)
+    Payment.objects.filter(pk=payment.pk, status=HELD).update(release_after=payment.release_after, updated_at=timezone.now())
+    return payment
+
+
+def complete_jobs(job_ids, now=None):
+    """Mark delivered jobs completed and their submissions approved, once paid out"""
+    now = now or timezone.now()
+    Job.objects.filter(id__in=job_ids, status='under_review').update(status='completed', updated_at=now)
+    WorkSubmission.objects.filter(job_id__in=job_ids, status='pending_review').update(status='approved', reviewed_at=now)
+    # Bulk updates skip the post_save receiver that drops cached job details
+    cache.delete_many([job_detail_cache_key(job_id) for job_id in job_ids])
+
+
+def _move(payment, sources, target):
+    now = timezone.now()
+    changes = {'status': target, 'updated_at': now}
+    if target != DISPUTED:
+        changes.update(completed_at=now, release_after=None)
+    else:
+        # A disputed payment waits for staff, not the scheduler
+        changes.update(release_after=None)
+
+    if not Payment.objects.filter(pk=payment.pk, status__in=sources).update(**changes):
+        current = Payment.objects.filter(pk=payment.pk).values_list('status', flat=True).first()
+        raise InvalidTransition(f'Payment cannot move from {current} to {target}')
+
+    for field, value in changes.items():
+        setattr(payment, field, value)
+
+
+def _job_title(payment):
+    return payment.job.title if payment.job_id else 'N/A'
+
+
+def _held_amount(payment):
+    # What the hold took from the client's wallet, in that wallet's currency
+    held = payment.transactions.filter(
+        transaction_type='debit', wallet__user_id=payment.from_user_id,
+    ).aggregate(total=Sum('amount'))['total']
+    if held is not None:
+        return held
+    return fx.convert(payment.amount, payment.currency, ledger.wallet_currency(payment.from_user_id))
+
+
+def release(payment, resolve=False):
+    """Pay a held payment out to the freelancer.
+
+    resolve=True also releases a disputed payment, for staff settling the
+    dispute. Raises InvalidTransition if the payment is in any other state.
+    """
+    with transaction.atomic():
+        _move(payment, (HELD, DISPUTED) if resolve else (HELD,), 'completed')
+        credit = fx.convert(payment.amount, payment.currency, ledger.wallet_currency(payment.to_user_id))
+        ledger.transfer(None, payment.to_user_id, credit, payment, f'Payment received for job: {_job_title(payment)}')
+        payments_changed.send(sender=Payment, payments=[payment])
+    return payment
+
+
+def refund(payment, resolve=False):
+    """Return a held payment to the client, see release() for resolve"""
+    with transaction.atomic():
+        _move(payment, (HELD, DISPUTED) if resolve else (HELD,), 'refunded')
+        ledger.transfer(None, payment.from_user_id, _held_amount(payment), payment, f'Refund for job: {_job_title(payment)}')
+        payments_changed.send(sender=Payment, payments=[payment])
+    return payment
+
+
+def dispute(payment):
+    """Freeze a held payment until staff release or refund it"""
+    with transaction.atomic():
+        _move(payment, (HELD,), DISPUTED)
+        payments_changed.send(sender=Payment, payments=[payment])
+    return payment
+
+
+def release_due(batch_size=500, now=None):
+    """Release up to batch_size holds past their release_after, returning them.
+
+    Only holds whose job is under review, i.e. whose work was delivered, are
+    due; their jobs are completed with them. The due holds are read through
+    the (status, release_after) index, claimed with one conditional UPDATE and
+    credited with one ledger.bulk_credit, so a batch costs a fixed number of
+    queries whatever its size. The claim only decides which holds this run
+    pays; bulk_credit locks the wallets it writes to itself. A hold disputed
+    or released by a request or another run in the meantime is left alone.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            Payment.objects.select_for_update(skip_locked=True)
+            .filter(status=HELD, release_after__lte=now, job__status='under_review')
+            .select_related('job')
+            .order_by('release_after', 'id')[:batch_size]
+        )
+        if not due:
+            return []
+
+        ids = [payment.id for payment in due]
+        Payment.objects.filter(id__in=ids, status=HELD).update(
+            status='completed', completed_at=now, release_after=None, updated_at=now,
+        )
+        # completed_at marks the rows this batch claimed
+        claimed = set(Payment.objects.filter(id__in=ids, status='completed', completed_at=now).values_list('id', flat=True))
+        released = [payment for payment in due if payment.id in claimed]
+
+        currencies = dict(Wallet.objects.filter(
+            user_id__in={payment.to_user_id for payment in released},
+        ).values_list('user_id', 'currency'))
+        ledger.bulk_credit([
+            (
+                payment.to_user_id,
+                fx.convert(payment.amount, payment.currency, currencies.get(payment.to_user_id, DEFAULT_CURRENCY), now),
+                payment,
+                f'Payment received for job: {_job_title(payment)}',
+            )
+            for payment in released
+        ])
+
+        for payment in released:
+            payment.status, payment.completed_at, payment.release_after, payment.updated_at = 'completed', now, None, now
+        complete_jobs([payment.job_id for payment in released], now)
+        payments_changed.send(sender=Payment, payments=released)
+
+    return released
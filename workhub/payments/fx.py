@@ -0,0 +1,76 @@
+"""Exchange rates and conversion between currencies.
+
+Rates come from the local ExchangeRate table, one row per pair and day. A
+lookup takes the latest rate on or before the day asked for, falling back
+to the inverse pair and then to a cross rate through DEFAULT_CURRENCY.
+Lookups are cached in process by (base, quote, day). Saving a rate clears
+this process's cache; other processes see a rate for a day they already
+looked up after they restart, so rates for a day should be loaded before
+it starts.
+
+Totals in several currencies are summed per currency in the database and
+converted once per currency with convert_totals(), never row by row.
+"""
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from .currency import DEFAULT_CURRENCY
+from .models import ExchangeRate
+
+CENT = Decimal('0.01')
+
+
+class RateUnavailable(Exception):
+    """Raised when no rate is known for a pair on or before a day"""
+
+
+def _stored_rate(base, quote, day):
+    return ExchangeRate.objects.filter(
+        base=base, quote=quote, day__lte=day,
+    ).order_by('-day').values_list('rate', flat=True).first()
+
+
+@lru_cache(maxsize=getattr(settings, 'FX_RATE_CACHE_SIZE', 4096))
+def _rate(base, quote, day):
+    if base == quote:
+        return Decimal('1')
+    
+    rate = _stored_rate(base, quote, day)
+    if rate is not None:
+        return rate
+    inverse = _stored_rate(quote, base, day)
+    if inverse:
+        return Decimal('1') / inverse
+    if DEFAULT_CURRENCY not in (base, quote):
+        return _rate(base, DEFAULT_CURRENCY, day) * _rate(DEFAULT_CURRENCY, quote, day)
+    raise RateUnavailable(f'No {base}/{quote} exchange rate for {day}')
+
+
+def rate(base, quote, day=None):
+    """How many units of quote one unit of base buys on day (default today)"""
+    if day is None:
+        day = timezone.localdate()
+    elif isinstance(day, datetime):
+        day = timezone.localdate(day)
+    return _rate(base, quote, day)
+
+
+def convert(amount, base, quote, day=None):
+    """amount in base converted to quote, rounded to cents"""
+    if base == quote:
+        return Decimal(amount)
+    return (Decimal(amount) * rate(base, quote, day)).quantize(CENT)
+
+
+def convert_totals(totals, quote, day=None):
+    """Sum {currency: amount} totals into one amount in quote"""
+    return sum(
+        (convert(amount, currency, quote, day) for currency, amount in totals.items() if amount),
+        Decimal('0.00'),
+    )
+
+
+def clear_cache():
+    _rate.cache_clear()
@@ -0,0 +1,22 @@
+"""Which payments a user's history lists.
+
+Shared by the history page, its CSV export and the index_advisor command.
+"""
+from .models import Payment
+
+
+def payments_for(user, is_freelancer):
+    """Payments shown in a user's history and the timestamp they are ordered by"""
+    if is_freelancer:
+        # Freelancer only sees received payments
+        payments = Payment.objects.filter(to_user=user, status='completed', completed_at__isnull=False)
+        return payments, 'completed_at'
+
+    # Client sees sent payments
+    payments = Payment.objects.filter(from_user=user).exclude(payment_type='wallet_topup')
+    return payments, 'created_at'
+
+
+def is_freelancer(user):
+    user_role = getattr(user.profile, 'role', None) if hasattr(user, 'profile') else None
+    return user_role == 'freelancer'
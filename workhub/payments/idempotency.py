@@ -0,0 +1,130 @@
+"""Idempotency keys for endpoints that move money.
+
+A client sends an ``Idempotency-Key`` header (or an ``idempotency_key`` form
+field) with a POST. The first request with a key runs the view and stores its
+response. Later requests with the same key get the stored response back
+without running the view again, so a retry after a timeout cannot charge
+twice. Requests without a key run as before.
+
+A view that fails with one of RETRYABLE_ERRORS must let it propagate rather
+than turn it into an error response, so the key is freed for the retry
+instead of replaying the failure until it expires. A request that dies
+without freeing its key, a killed worker say, holds it only for
+IDEMPOTENCY_LEASE_SECONDS; a retry after that runs the view again.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, InterfaceError, OperationalError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from .models import IdempotencyKey
+
+# Response headers kept for replay
+REPLAYED_HEADERS = ['Content-Type', 'Location']
+
+# Failures that say nothing about the request, such as a dropped connection
+# or a lock timeout, so a retry with the same key may well succeed
+RETRYABLE_ERRORS = (OperationalError, InterfaceError)
+
+
+def _request_key(request):
+    return request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+
+
+def _request_hash(request):
+    """Fingerprint of the request, so a key cannot be reused for a different one"""
+    hasher = hashlib.sha256()
+    if request.content_type == 'multipart/form-data':
+        # The body has already been streamed to upload handlers
+        for name, value in sorted(request.POST.items()):
+            hasher.update(f'{name}={value}\n'.encode())
+        for name, upload in sorted(request.FILES.items()):
+            hasher.update(f'{name}:{upload.name}:{upload.size}\n'.encode())
+    else:
+        hasher.update(request.body)
+    return hasher.hexdigest()
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.response_body), status=record.response_status)
+    for header, value in record.response_headers.items():
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(request, key, request_hash):
+    """Reserve a key for this request, or return the record already holding it"""
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    lease = getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 60)
+    lookup = {'user': request.user, 'endpoint': request.path, 'key': key}
+    now = timezone.now()
+    
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                request_hash=request_hash,
+                expires_at=now + timedelta(seconds=ttl),
+                lease_expires_at=now + timedelta(seconds=lease),
+                **lookup
+            )
+        return None
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(**lookup)
+        if record.expires_at <= now:
+            # An expired key is free to use again
+            IdempotencyKey.objects.filter(id=record.id).delete()
+            return _claim(request, key, request_hash)
+        if record.status == 'in_progress' and record.request_hash == request_hash:
+            # The request holding it died, the first retry to get here takes over
+            taken = IdempotencyKey.objects.filter(
+                Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now),
+                id=record.id, status='in_progress',
+            ).update(lease_expires_at=now + timedelta(seconds=lease))
+            if taken:
+                return None
+        return record
+
+
+def idempotent(view_func):
+    """Replay the first response for a repeated Idempotency-Key"""
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = _request_key(request) if request.method == 'POST' else None
+        if not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        
+        key = key[:100]
+        request_hash = _request_hash(request)
+        record = _claim(request, key, request_hash)
+        
+        if record is not None:
+            if record.request_hash != request_hash:
+                return JsonResponse({'success': False, 'error': 'Idempotency key was already used for a different request'}, status=422)
+            if record.status == 'in_progress':
+                return JsonResponse({'success': False, 'error': 'A request with this idempotency key is still being processed'}, status=409)
+            return _replay(record)
+        
+        lookup = {'user': request.user, 'endpoint': request.path, 'key': key}
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            # Nothing was committed, let the client retry with the same key
+            IdempotencyKey.objects.filter(**lookup).delete()
+            raise
+        
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            IdempotencyKey.objects.filter(**lookup).delete()
+            return response
+        
+        IdempotencyKey.objects.filter(**lookup).update(
+            status='done',
+            response_status=response.status_code,
+            response_headers={header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)},
+            response_body=response.content,
+        )
+        return response
+    return wrapper
@@ -0,0 +1,262 @@
+"""Wallet ledger.
+
+Every balance change goes through here. Balances are changed with a single
+conditional UPDATE (``balance = balance - x WHERE balance >= x``), so two
+requests spending from the same wallet can never both succeed on the same
+funds. Reading the row first and saving it back would allow that. Each change
+writes its Transaction row in the same database transaction.
+
+Transactions are the source of truth: the same UPDATE hands out the wallet's
+next sequence number, and every WALLET_SNAPSHOT_INTERVAL entries a
+WalletSnapshot records the running balance. reconstruct_balance() rebuilds a
+balance from the latest snapshot and the entries after it.
+
+bulk_debit() and bulk_credit() decide each entry from the balances they read,
+so they lock the wallets before reading them.
+"""
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, PositiveBigIntegerField, Sum, Value, When
+from django.utils import timezone
+from .currency import DEFAULT_CURRENCY, format_money
+from .models import Wallet, Payment, Transaction, WalletSnapshot
+
+
+class InsufficientFunds(Exception):
+    """Raised when a wallet does not hold enough to cover a debit"""
+
+    def __init__(self, user, amount, balance, currency=DEFAULT_CURRENCY):
+        self.user = user
+        self.amount = amount
+        self.balance = balance
+        self.currency = currency
+        super().__init__(
+            f'Insufficient balance. You need {format_money(amount, currency)} '
+            f'but only have {format_money(balance, currency)}'
+        )
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def get_balance(user):
+    """Current balance of a user's wallet, 0 if they have none"""
+    balance = Wallet.objects.filter(user_id=_user_id(user)).values_list('balance', flat=True).first()
+    return balance if balance is not None else Decimal('0.00')
+
+
+def wallet_currency(user):
+    """Currency a user's wallet and its ledger are kept in"""
+    currency = Wallet.objects.filter(user_id=_user_id(user)).values_list('currency', flat=True).first()
+    return currency or DEFAULT_CURRENCY
+
+
+def pending_withdrawals(user):
+    """Total of a user's withdrawals still waiting for a payout batch"""
+    total = Payment.objects.filter(
+        from_user_id=_user_id(user), payment_type='withdrawal', status='pending',
+    ).aggregate(total=Sum('amount'))['total']
+    return total or Decimal('0.00')
+
+
+def available_balance(user):
+    """Balance minus withdrawals that are queued but not yet paid out"""
+    return get_balance(user) - pending_withdrawals(user)
+
+
+def _apply(user_id, amount, require_funds):
+    wallets = Wallet.objects.filter(user_id=user_id)
+    if require_funds:
+        wallets = wallets.filter(balance__gte=-amount)
+
+    changes = {
+        'balance': F('balance') + amount,
+        'last_sequence': F('last_sequence') + 1,
+        'updated_at': timezone.now(),
+    }
+
+    with transaction.atomic():
+        updated = wallets.update(**changes)
+        if not updated:
+            if require_funds:
+                raise InsufficientFunds(user_id, -amount, get_balance(user_id), wallet_currency(user_id))
+            Wallet.objects.get_or_create(user_id=user_id)
+            wallets.update(**changes)
+
+        # The row stays locked by this transaction until commit, so this
+        # reads our own write rather than someone else's
+        return Wallet.objects.filter(user_id=user_id).values_list('id', 'balance', 'last_sequence').get()
+
+
+def _record(user, amount, transaction_type, payment, description):
+    delta = amount if transaction_type == 'credit' else -amount
+    with transaction.atomic():
+        wallet_id, balance, sequence = _apply(_user_id(user), delta, transaction_type == 'debit')
+        record = Transaction.objects.create(
+            wallet_id=wallet_id,
+            payment=payment,
+            amount=amount,
+            transaction_type=transaction_type,
+            description=description,
+            balance_after=balance,
+            sequence=sequence,
+        )
+        if sequence % getattr(settings, 'WALLET_SNAPSHOT_INTERVAL', 100) == 0:
+            WalletSnapshot.objects.create(wallet_id=wallet_id, sequence=sequence, balance=balance)
+    return record
+
+
+def adjust_balance(user, amount, description='Balance adjustment'):
+    """Add amount (negative to subtract) to a wallet, record it and return the new balance.
+
+    A subtraction only applies while the balance covers it, otherwise
+    InsufficientFunds is raised and nothing changes.
+    """
+    amount = Decimal(amount)
+    transaction_type = 'credit' if amount >= 0 else 'debit'
+    return _record(user, abs(amount), transaction_type, None, description).balance_after
+
+
+def transfer(from_user, to_user, amount, payment=None, description=''):
+    """Move amount from one wallet to another and record both sides.
+
+    Either side may be None for money entering or leaving the platform: a
+    top-up or a release from hold has no from_user, a withdrawal or a payment
+    placed on hold has no to_user. Returns the (debit, credit) transactions,
+    with None for a missing side. Raises InsufficientFunds, leaving both
+    wallets untouched, when from_user cannot cover the amount.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError('Amount must be greater than 0')
+    if from_user is None and to_user is None:
+        raise ValueError('A transfer needs at least one wallet')
+
+    debit = credit = None
+    with transaction.atomic():
+        # Touch wallets in user id order so two opposite transfers cannot
+        # deadlock waiting on each other's row
+        sides = [(from_user, 'debit'), (to_user, 'credit')]
+        sides = sorted((side for side in sides if side[0] is not None), key=lambda side: _user_id(side[0]))
+        for user, transaction_type in sides:
+            record = _record(user, amount, transaction_type, payment, description)
+            if transaction_type == 'debit':
+                debit = record
+            else:
+                credit = record
+
+    return debit, credit
+
+
+def _signed_sum(transactions):
+    total = transactions.aggregate(total=Sum(Case(
+        When(transaction_type='credit', then=F('amount')),
+        default=-F('amount'),
+    )))['total']
+    return total or Decimal('0.00')
+
+
+def reconstruct_balance(wallet):
+    """Rebuild a wallet's balance from its ledger.
+
+    Reads the latest snapshot and sums only the transactions after it, so the
+    cost depends on recent activity rather than the wallet's whole history.
+    Returns (balance, last_sequence).
+    """
+    snapshot = WalletSnapshot.objects.filter(wallet=wallet).order_by('-sequence').first()
+    base_sequence = snapshot.sequence if snapshot else 0
+    base_balance = snapshot.balance if snapshot else Decimal('0.00')
+
+    tail = Transaction.objects.filter(wallet=wallet, sequence__gt=base_sequence)
+    last_sequence = tail.order_by('-sequence').values_list('sequence', flat=True).first() or base_sequence
+    return base_balance + _signed_sum(tail), last_sequence
+
+
+def _lock_wallets(user_ids):
+    """Read the wallets of user_ids, locked until the transaction ends.
+
+    select_for_update() does nothing on SQLite, where only a write takes the
+    lock, so there the rows are touched with an UPDATE before they are read.
+    """
+    wallets = Wallet.objects.filter(user_id__in=user_ids).order_by('user_id')
+    if connection.features.has_select_for_update:
+        wallets = wallets.select_for_update()
+    else:
+        wallets.update(updated_at=timezone.now())
+    return {wallet.user_id: wallet for wallet in wallets}
+
+
+def _bulk_record(entries, transaction_type):
+    with transaction.atomic():
+        user_ids = sorted({entry[0] for entry in entries})
+        wallets = _lock_wallets(user_ids)
+        missing = [Wallet(user_id=user_id) for user_id in user_ids if user_id not in wallets]
+        if missing and transaction_type == 'credit':
+            # Another request may create one of them first, read back whichever row won
+            Wallet.objects.bulk_create(missing, ignore_conflicts=True)
+            wallets.update(_lock_wallets([wallet.user_id for wallet in missing]))
+        interval = getattr(settings, 'WALLET_SNAPSHOT_INTERVAL', 100)
+
+        applied, rejected = [], []
+        records, snapshots = [], []
+        deltas, entry_counts = {}, {}
+        for entry in entries:
+            user_id, amount, payment, description = entry
+            wallet = wallets.get(user_id)
+            if transaction_type == 'debit' and (wallet is None or wallet.balance < amount):
+                rejected.append(entry)
+                continue
+
+            delta = amount if transaction_type == 'credit' else -amount
+            wallet.balance += delta
+            wallet.last_sequence += 1
+            deltas[user_id] = deltas.get(user_id, Decimal('0.00')) + delta
+            entry_counts[user_id] = entry_counts.get(user_id, 0) + 1
+            records.append(Transaction(
+                wallet_id=wallet.id,
+                payment=payment,
+                amount=amount,
+                transaction_type=transaction_type,
+                description=description,
+                balance_after=wallet.balance,
+                sequence=wallet.last_sequence,
+            ))
+            if wallet.last_sequence % interval == 0:
+                snapshots.append(WalletSnapshot(wallet_id=wallet.id, sequence=wallet.last_sequence, balance=wallet.balance))
+            applied.append(entry)
+
+        if deltas:
+            Wallet.objects.filter(user_id__in=deltas).update(
+                balance=F('balance') + Case(
+                    *[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                last_sequence=F('last_sequence') + Case(
+                    *[When(user_id=user_id, then=Value(count)) for user_id, count in entry_counts.items()],
+                    output_field=PositiveBigIntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            Transaction.objects.bulk_create(records, batch_size=500)
+            WalletSnapshot.objects.bulk_create(snapshots, batch_size=500)
+
+        return applied, rejected
+
+
+def bulk_debit(entries):
+    """Apply many debits with one UPDATE and one INSERT per table.
+
+    entries is a list of (user_id, amount, payment, description), applied in
+    order. A debit the wallet cannot cover at that point is skipped. Returns
+    (applied, rejected) lists of entries. The wallets stay locked from the
+    moment their balances are read until the caller's transaction ends.
+    """
+    return _bulk_record(entries, 'debit')
+
+
+def bulk_credit(entries):
+    """Apply many credits the same way as bulk_debit, returning the entries"""
+    applied, rejected = _bulk_record(entries, 'credit')
+    return applied
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from payments.outbox import drain, purge_processed
+
+
+class Command(BaseCommand):
+    help = 'Run queued follow-up work from the payments outbox in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'OUTBOX_BATCH_SIZE', 100))
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        retention = timedelta(days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 7))
+        purge_every = getattr(settings, 'OUTBOX_PURGE_INTERVAL', 60 * 60)
+        batches = handled = purged = 0
+        last_purge = time.monotonic()
+        while options['max_batches'] is None or batches < options['max_batches']:
+            # A --loop worker never reaches the purge after the loop
+            if time.monotonic() - last_purge >= purge_every:
+                purged += purge_processed(timezone.now() - retention)
+                last_purge = time.monotonic()
+            
+            taken = drain(options['batch_size'])
+            if not taken:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            
+            batches += 1
+            handled += taken
+        
+        purged += purge_processed(timezone.now() - retention)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Handled {handled} events in {batches} batches in {time.monotonic() - started:.2f}s, '
+            f'purged {purged} old events'
+        ))
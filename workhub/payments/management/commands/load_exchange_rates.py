@@ -0,0 +1,38 @@
+import csv
+from decimal import Decimal, InvalidOperation
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from payments import fx
+from payments.currency import CURRENCY_CODES
+from payments.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a CSV file with day, base, quote and rate columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, e.g. 2025-01-31,USD,EUR,0.9612')
+
+    def handle(self, *args, **options):
+        rates = {}
+        with open(options['path'], newline='') as rates_file:
+            for line, row in enumerate(csv.reader(rates_file), start=1):
+                if not row or row[0].strip().lower() == 'day':
+                    continue
+                try:
+                    day, base, quote, rate = [value.strip() for value in row]
+                    day, rate = date.fromisoformat(day), Decimal(rate)
+                except (ValueError, InvalidOperation):
+                    raise CommandError(f'Line {line}: expected day,base,quote,rate')
+                if base not in CURRENCY_CODES or quote not in CURRENCY_CODES or rate <= 0:
+                    raise CommandError(f'Line {line}: unknown currency or invalid rate')
+                rates[(base, quote, day)] = rate
+        
+        with transaction.atomic():
+            # Replace rates already stored for the same pair and day
+            for (base, quote, day), rate in rates.items():
+                ExchangeRate.objects.update_or_create(base=base, quote=quote, day=day, defaults={'rate': rate})
+        fx.clear_cache()
+        
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rates)} exchange rates'))
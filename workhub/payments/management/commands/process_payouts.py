@@ -0,0 +1,35 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments.currency import format_money
+from payments.payouts import run_batch
+
+
+class Command(BaseCommand):
+    help = 'Pay out queued withdrawals in batches and write payout files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'PAYOUT_BATCH_SIZE', 500))
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new withdrawals')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while options['max_batches'] is None or processed < options['max_batches']:
+            started = time.monotonic()
+            batch = run_batch(options['batch_size'])
+            
+            if batch is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            
+            processed += 1
+            self.stdout.write(
+                f'Batch {batch.id}: paid {batch.payments_count} withdrawals ({format_money(batch.total, batch.currency)}), '
+                f'rejected {batch.rejected_count} in {time.monotonic() - started:.2f}s'
+            )
+        
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} payout batches'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from payments.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys whose replay window has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        removed = 0
+        
+        # Delete in batches so a large backlog does not hold one long write lock
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(expires_at__lte=now)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+        
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
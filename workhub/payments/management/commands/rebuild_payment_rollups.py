@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from payments import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily payment rollups from the payments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, action='append', dest='user_ids',
+                            help='Only rebuild these users (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild(user_ids=options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup rows'))
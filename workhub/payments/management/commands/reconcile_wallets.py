@@ -0,0 +1,33 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from payments.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Check every wallet balance against the sum of its ledger transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard-size', type=int, default=getattr(settings, 'RECONCILE_SHARD_SIZE', 10000), help='Wallet ids per shard')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes checking shards in parallel')
+        parser.add_argument('--fail-on-discrepancy', action='store_true', help='Exit with an error if any wallet is off')
+
+    def handle(self, *args, **options):
+        def progress(bounds, wallets, transactions, discrepancies):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Wallets {bounds[0]}-{bounds[1] - 1}: {wallets} wallets, {transactions} transactions, {len(discrepancies)} off')
+        
+        run = reconcile(options['shard_size'], options['workers'], progress)
+        
+        self.stdout.write(
+            f'Checked {run.wallets_checked} wallets and {run.transactions_checked} transactions '
+            f'in {run.shards} shards with {run.workers} workers in {run.duration_seconds:.2f}s '
+            f'({run.transactions_per_second:.0f} transactions/s)'
+        )
+        if run.discrepancies:
+            message = f'{run.discrepancies} wallets do not match their ledger, see {run.report.name}'
+            if options['fail_on_discrepancy']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('All wallets match their ledger'))
@@ -0,0 +1,40 @@
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments.currency import format_money
+from payments.escrow import release_due
+
+
+class Command(BaseCommand):
+    help = 'Release held job payments whose release_after has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ESCROW_RELEASE_BATCH_SIZE', 500))
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batches = released = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            batch_started = time.monotonic()
+            payments = release_due(options['batch_size'])
+            if not payments:
+                break
+            
+            batches += 1
+            released += len(payments)
+            totals = {}
+            for payment in payments:
+                totals[payment.currency] = totals.get(payment.currency, Decimal('0.00')) + payment.amount
+            amounts = ', '.join(format_money(total, currency) for currency, total in sorted(totals.items()))
+            self.stdout.write(
+                f'Batch {batches}: released {len(payments)} payments '
+                f'({amounts}) in {time.monotonic() - batch_started:.2f}s'
+            )
+        
+        elapsed = time.monotonic() - started
+        rate = released / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} payments in {batches} batches ({rate:.0f} payments/s)'
+        ))
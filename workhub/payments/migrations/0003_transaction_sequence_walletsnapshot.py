@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def number_transactions(apps, schema_editor):
+    """Number existing transactions per wallet in the order they were written.
+    
+    Older balances were not always backed by transactions, so each wallet
+    gets a snapshot of its current balance at its last sequence number to
+    anchor later reconstruction.
+    """
+    Wallet = apps.get_model('payments', 'Wallet')
+    Transaction = apps.get_model('payments', 'Transaction')
+    WalletSnapshot = apps.get_model('payments', 'WalletSnapshot')
+    
+    for wallet in Wallet.objects.all().iterator(chunk_size=500):
+        transactions = list(Transaction.objects.filter(wallet=wallet).order_by('created_at', 'id'))
+        for sequence, record in enumerate(transactions, start=1):
+            record.sequence = sequence
+        Transaction.objects.bulk_update(transactions, ['sequence'], batch_size=500)
+        
+        wallet.last_sequence = len(transactions)
+        wallet.save(update_fields=['last_sequence'])
+        if transactions or wallet.balance:
+            WalletSnapshot.objects.create(wallet=wallet, sequence=wallet.last_sequence, balance=wallet.balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='last_sequence',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='sequence',
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='payments.wallet')),
+            ],
+            options={
+                'ordering': ['-sequence'],
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'sequence'), name='snapshot_wallet_sequence_uniq')],
+            },
+        ),
+        migrations.RunPython(number_transactions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='sequence',
+            field=models.PositiveBigIntegerField(help_text="Position in the wallet's ledger, starting at 1"),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('wallet', 'sequence'), name='transaction_wallet_sequence_uniq'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentDailyRollup = apps.get_model('payments', 'PaymentDailyRollup')
+    
+    rows = []
+    payments = Payment.objects.annotate(day=TruncDate('created_at'))
+    for direction, user_field in (('sent', 'from_user_id'), ('received', 'to_user_id')):
+        grouped = payments.exclude(**{f'{user_field}__isnull': True}).values(
+            user_field, 'day', 'payment_type', 'status',
+        ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+        for group in grouped:
+            rows.append(PaymentDailyRollup(
+                user_id=group[user_field], day=group['day'], direction=direction,
+                payment_type=group['payment_type'], status=group['status'],
+                total=group['total'], count=group['count'],
+            ))
+    PaymentDailyRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('direction', models.CharField(choices=[('sent', 'Sent'), ('received', 'Received')], max_length=10)),
+                ('payment_type', models.CharField(choices=[('job_payment', 'Job Payment'), ('wallet_topup', 'Wallet Top-up'), ('withdrawal', 'Withdrawal'), ('refund', 'Refund')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'direction', 'payment_type', 'status'), name='payment_rollup_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0007_worksubmission_file_totals'),
+        ('payments', '0005_paymentdailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['to_user', 'status', '-completed_at', '-id'], name='payment_to_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['from_user', '-created_at', '-id'], name='payment_from_created_idx'),
+        ),
+    ]
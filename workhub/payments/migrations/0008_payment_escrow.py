@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0007_worksubmission_file_totals'),
+        ('payments', '0007_payoutbatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='payment',
+            name='payment_one_active_per_job',
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='release_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded'), ('disputed', 'Disputed')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='paymentdailyrollup',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('on_hold', 'On Hold'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded'), ('disputed', 'Disputed')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'release_after'], name='payment_status_release_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_type', 'job_payment'), ('status__in', ['on_hold', 'disputed', 'completed'])), fields=('job',), name='payment_one_active_per_job'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_payment_escrow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('shards', models.PositiveIntegerField(default=0)),
+                ('workers', models.PositiveIntegerField(default=0)),
+                ('wallets_checked', models.PositiveIntegerField(default=0)),
+                ('transactions_checked', models.PositiveBigIntegerField(default=0)),
+                ('discrepancies', models.PositiveIntegerField(default=0)),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('report', models.FileField(blank=True, upload_to='reconciliations/')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_walletreconciliation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], max_length=3)),
+                ('quote', models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], max_length=3)),
+                ('day', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='paymentdailyrollup',
+            name='payment_rollup_bucket_uniq',
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], default='USD', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='paymentdailyrollup',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], default='USD', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], default='USD', max_length=3),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentdailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'direction', 'payment_type', 'status', 'currency'), name='payment_rollup_bucket_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('base', 'quote', 'day'), name='exchange_rate_pair_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='payments.payment'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:58
+
+from django.db import migrations, models
+from django.db.migrations.recorder import MigrationRecorder
+
+
+def mark_anchors(apps, schema_editor):
+    """Flag the snapshots 0003 wrote for wallets that existed before the ledger.
+    
+    They were all written while 0003 ran, so before it was recorded as
+    applied, and every periodic snapshot was written after.
+    """
+    WalletSnapshot = apps.get_model('payments', 'WalletSnapshot')
+    recorded = MigrationRecorder(schema_editor.connection).migration_qs.filter(
+        app='payments', name='0003_transaction_sequence_walletsnapshot',
+    ).first()
+    if recorded:
+        WalletSnapshot.objects.filter(created_at__lte=recorded.applied).update(is_anchor=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_transaction_payment_protect'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='walletsnapshot',
+            name='is_anchor',
+            field=models.BooleanField(default=False, help_text='Balance the wallet had when the ledger started, not derived from its transactions'),
+        ),
+        migrations.RunPython(mark_anchors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_walletsnapshot_anchor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='Until when an in-progress request holds the key; a retry may take it over after', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_idempotencykey_lease_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutbatch',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('CAD', 'Canadian Dollar'), ('AUD', 'Australian Dollar'), ('AED', 'UAE Dirham'), ('INR', 'Indian Rupee'), ('PKR', 'Pakistani Rupee')], default='USD', max_length=3),
+        ),
+    ]
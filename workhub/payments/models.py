@@ -1,34 +1,66 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from jobs.models import Job
 from decimal import Decimal
+from .currency import CURRENCY_CHOICES, DEFAULT_CURRENCY, format_money
 
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # The balance and every ledger entry of the wallet are in this currency
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    # Sequence number of the wallet's latest transaction
+    last_sequence = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"{self.user.username}'s Wallet - ${self.balance}"
+        return f"{self.user.username}'s Wallet - {format_money(self.balance, self.currency)}"
     
     def can_withdraw(self, amount):
         """Check if user has sufficient balance for withdrawal"""
         return self.balance >= amount
     
     def add_funds(self, amount):
-        """Add funds to wallet"""
-        self.balance += amount
-        self.save()
+        """Add funds to wallet, see payments.ledger"""
+        from .ledger import adjust_balance
+        self.balance = adjust_balance(self.user_id, amount)
         return self.balance
     
     def deduct_funds(self, amount):
         """Deduct funds from wallet if sufficient balance exists"""
-        if self.can_withdraw(amount):
-            self.balance -= amount
-            self.save()
-            return True
-        return False
+        from .ledger import adjust_balance, InsufficientFunds
+        try:
+            self.balance = adjust_balance(self.user_id, -amount)
+        except InsufficientFunds as e:
+            self.balance = e.balance
+            return False
+        return True
+
+class PayoutBatch(models.Model):
+    """A group of withdrawals paid out together by the process_payouts command"""
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    # Every withdrawal in the batch, and so its total and payout files, is in this currency
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0, help_text="Withdrawals cancelled for insufficient funds")
+    csv_file = models.FileField(upload_to='payouts/', blank=True)
+    xml_file = models.FileField(upload_to='payouts/', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Payout batch {self.id}: {self.payments_count} payments, {format_money(self.total, self.currency)} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
 
 class Payment(models.Model):
     STATUS_CHOICES = [
@@ -37,6 +69,7 @@ class Payment(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
         ('refunded', 'Refunded'),
+        ('disputed', 'Disputed'),
     ]
     
     PAYMENT_TYPE_CHOICES = [
@@ -50,35 +83,241 @@ class Payment(models.Model):
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments_sent')
     to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments_received', null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     payment_type = models.CharField(max_length=20, choices=PAYMENT_TYPE_CHOICES, default='job_payment')
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Held job payments are released automatically after this, see payments.escrow
+    release_after = models.DateTimeField(null=True, blank=True)
+    # Set on withdrawals once a payout batch picks them up
+    payout_batch = models.ForeignKey(PayoutBatch, on_delete=models.SET_NULL, related_name='payments', null=True, blank=True)
     
     def __str__(self):
-        return f"Payment {self.id}: ${self.amount} - {self.status}"
+        return f"Payment {self.id}: {format_money(self.amount, self.currency)} - {self.status}"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['from_user', 'status', 'payment_type'], name='payment_from_status_type_idx'),
+            models.Index(fields=['to_user', 'status'], name='payment_to_status_idx'),
+            # Keyset pagination of payment history
+            models.Index(fields=['to_user', 'status', '-completed_at', '-id'], name='payment_to_completed_idx'),
+            models.Index(fields=['from_user', '-created_at', '-id'], name='payment_from_created_idx'),
+            # Scan for held payments that are due for automatic release
+            models.Index(fields=['status', 'release_after'], name='payment_status_release_idx'),
+            # Queue of withdrawals waiting for a payout batch
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(payment_type='withdrawal', status='pending'),
+                name='payment_pending_withdrawal_idx',
+            ),
+        ]
+        constraints = [
+            # A job can only have one job payment held, disputed or paid out
+            models.UniqueConstraint(
+                fields=['job'],
+                condition=models.Q(payment_type='job_payment', status__in=['on_hold', 'disputed', 'completed']),
+                name='payment_one_active_per_job',
+            ),
+        ]
 
 class Transaction(models.Model):
+    """One entry in a wallet's append-only ledger.
+    
+    Entries are numbered 1, 2, 3... per wallet and are never changed or
+    deleted once written. A wallet's balance is the sum of its entries.
+    """
     TRANSACTION_TYPE_CHOICES = [
         ('credit', 'Credit'),
         ('debit', 'Debit'),
     ]
     
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions')
-    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='transactions', null=True, blank=True)
+    # A payment with ledger entries cannot be deleted, the entries are permanent
+    payment = models.ForeignKey(Payment, on_delete=models.PROTECT, related_name='transactions', null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPE_CHOICES)
     description = models.CharField(max_length=255)
     balance_after = models.DecimalField(max_digits=10, decimal_places=2)
+    sequence = models.PositiveBigIntegerField(help_text="Position in the wallet's ledger, starting at 1")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.transaction_type.title()}: {format_money(self.amount, self.wallet.currency)} - {self.wallet.user.username}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Transactions are append-only and cannot be changed')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Transactions are append-only and cannot be deleted')
+    
+    @property
+    def signed_amount(self):
+        return self.amount if self.transaction_type == 'credit' else -self.amount
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'sequence'], name='transaction_wallet_sequence_uniq'),
+        ]
+
+class WalletSnapshot(models.Model):
+    """Balance of a wallet as of one of its transactions.
+    
+    Written every WALLET_SNAPSHOT_INTERVAL transactions so a balance can be
+    rebuilt from the latest snapshot plus the transactions after it.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    sequence = models.PositiveBigIntegerField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    # Balances from before the ledger were not always backed by transactions
+    is_anchor = models.BooleanField(
+        default=False,
+        help_text="Balance the wallet had when the ledger started, not derived from its transactions",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.wallet.user.username} @ {self.sequence}: {format_money(self.balance, self.wallet.currency)}"
+    
+    class Meta:
+        ordering = ['-sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'sequence'], name='snapshot_wallet_sequence_uniq'),
+        ]
+
+class PaymentDailyRollup(models.Model):
+    """Running totals of one user's payments per day, direction, type and status.
+    
+    Kept up to date by payments.rollups as payments are created and change
+    status, so wallet and history totals read a handful of rows instead of
+    summing every payment.
+    """
+    DIRECTION_CHOICES = [
+        ('sent', 'Sent'),
+        ('received', 'Received'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_rollups')
+    day = models.DateField()
+    direction = models.CharField(max_length=10, choices=DIRECTION_CHOICES)
+    payment_type = models.CharField(max_length=20, choices=Payment.PAYMENT_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user.username} {self.day} {self.direction} {self.payment_type}/{self.status}: {format_money(self.total, self.currency)}"
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'direction', 'payment_type', 'status', 'currency'],
+                name='payment_rollup_bucket_uniq',
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """First response to a request made with an Idempotency-Key, see payments.idempotency"""
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('done', 'Done'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    endpoint = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_headers = models.JSONField(default=dict, blank=True)
+    response_body = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text='Until when an in-progress request holds the key; a retry may take it over after',
+    )
+    
+    def __str__(self):
+        return f"{self.user.username} {self.endpoint} {self.key} ({self.status})"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='idempotency_user_endpoint_key_uniq'),
+        ]
+
+
+class WalletReconciliation(models.Model):
+    """One run of the reconcile_wallets command, see payments.reconciliation"""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    shards = models.PositiveIntegerField(default=0)
+    workers = models.PositiveIntegerField(default=0)
+    wallets_checked = models.PositiveIntegerField(default=0)
+    transactions_checked = models.PositiveBigIntegerField(default=0)
+    discrepancies = models.PositiveIntegerField(default=0)
+    duration_seconds = models.FloatField(default=0)
+    report = models.FileField(upload_to='reconciliations/', blank=True)
+    
+    def __str__(self):
+        return f"Reconciliation {self.id}: {self.wallets_checked} wallets, {self.discrepancies} discrepancies"
+    
+    @property
+    def transactions_per_second(self):
+        return self.transactions_checked / self.duration_seconds if self.duration_seconds else 0
+    
+    class Meta:
+        ordering = ['-started_at']
+
+
+class ExchangeRate(models.Model):
+    """Units of quote currency one unit of base currency bought on a day, see payments.fx"""
+    base = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    quote = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    day = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.base}/{self.quote} {self.day}: {self.rate}"
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['base', 'quote', 'day'], name='exchange_rate_pair_day_uniq'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """Follow-up work recorded in the transaction that caused it, see payments.outbox"""
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Not handled before this, pushed back after a failed attempt
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
     
     def __str__(self):
-        return f"{self.transaction_type.title()}: ${self.amount} - {self.wallet.user.username}"
+        return f"Outbox event {self.id}: {self.topic}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['id']
+        indexes = [
+            # Queue of events still waiting for the worker
+            models.Index(
+                fields=['available_at', 'id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='outbox_pending_idx',
+            ),
+        ]
@@ -0,0 +1,90 @@
+"""Transactional outbox for follow-up work.
+
+A request records follow-up work with emit(), which inserts an OutboxEvent
+in the request's own transaction. The event exists exactly when the change
+that caused it was committed, and the request releases its write lock
+without doing the work itself. The drain_outbox command takes pending events
+in batches and hands each topic's payloads to its handler in one call, so a
+handler can do a batch's work in a few statements.
+
+Handlers register with @handler(topic) in a module imported at startup. A
+batch whose handler fails is retried later with a growing delay; the other
+topics in the batch are still marked done.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(topic):
+    """Register a function taking a list of payloads for topic"""
+    def register(function):
+        _handlers[topic] = function
+        return function
+    return register
+
+
+def emit(topic, **payload):
+    """Record follow-up work in the current transaction"""
+    event = OutboxEvent.objects.create(topic=topic, payload=payload)
+    if getattr(settings, 'OUTBOX_DRAIN_ON_COMMIT', False):
+        # Without a drain_outbox worker, e.g. in development
+        transaction.on_commit(drain)
+    return event
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def drain(batch_size=100):
+    """Handle up to batch_size pending events, returning how many were taken"""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, available_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        by_topic = {}
+        for event in events:
+            by_topic.setdefault(event.topic, []).append(event)
+
+        done, failed = [], []
+        for topic, batch in by_topic.items():
+            try:
+                function = _handlers.get(topic)
+                if function is None:
+                    raise LookupError(f'No outbox handler for {topic}')
+                # A savepoint, so a failing handler leaves no partial work behind
+                with transaction.atomic():
+                    function([event.payload for event in batch])
+                done += batch
+            except Exception as error:
+                logger.exception('Outbox handler for %s failed', topic)
+                for event in batch:
+                    event.attempts += 1
+                    event.last_error = f'{type(error).__name__}: {error}'
+                    event.available_at = now + _retry_delay(event.attempts)
+                failed += batch
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in done]).update(processed_at=now)
+        OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error', 'available_at'])
+
+    return len(events)
+
+
+def purge_processed(older_than):
+    """Delete events handled before older_than, returning how many"""
+    deleted, _ = OutboxEvent.objects.filter(processed_at__lt=older_than).delete()
+    return deleted
@@ -0,0 +1,151 @@
+"""Batched payouts for withdrawals.
+
+A withdrawal request only queues a pending withdrawal Payment. The
+process_payouts command then takes queued withdrawals in batches. A batch
+holds withdrawals in a single currency, so its total and control sums add
+up; each currency with withdrawals queued gets batches of its own. For each
+batch it debits every wallet in one transaction using ledger.bulk_debit and
+writes a CSV and an ISO 20022 pain.001 style XML file for the payment
+processor.
+"""
+import csv
+import io
+from decimal import Decimal
+from xml.etree import ElementTree
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from . import ledger
+from .currency import format_money
+from .models import Payment, PayoutBatch
+from .signals import payments_changed
+
+PAIN_NAMESPACE = 'urn:iso:std:iso:20022:tech:xsd:pain.001.001.03'
+
+
+def queue_withdrawal(user, amount):
+    """Queue a withdrawal for the next payout batch.
+
+    Raises ledger.InsufficientFunds if the balance left after already queued
+    withdrawals does not cover it. The worker checks again when it debits.
+    """
+    currency = ledger.wallet_currency(user)
+    available = ledger.available_balance(user)
+    if available < amount:
+        raise ledger.InsufficientFunds(user, amount, available, currency)
+
+    return Payment.objects.create(
+        from_user=user,
+        amount=amount,
+        currency=currency,
+        status='pending',
+        payment_type='withdrawal',
+        description=f'Withdrawal of {format_money(amount, currency)}',
+    )
+
+
+def _csv_file(batch, payments):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['end_to_end_id', 'payee', 'email', 'amount', 'currency', 'reference'])
+    for payment in payments:
+        writer.writerow([
+            f'WITHDRAWAL-{payment.id}',
+            payment.from_user.username,
+            payment.from_user.email,
+            payment.amount,
+            payment.currency,
+            f'Work Hub payout batch {batch.id}',
+        ])
+    return ContentFile(output.getvalue().encode())
+
+
+def _xml_file(batch, payments):
+    """Customer credit transfer initiation with one transfer per withdrawal"""
+    def add(parent, tag, text=None, **attributes):
+        element = ElementTree.SubElement(parent, tag, attributes)
+        if text is not None:
+            element.text = str(text)
+        return element
+
+    document = ElementTree.Element('Document', xmlns=PAIN_NAMESPACE)
+    initiation = add(document, 'CstmrCdtTrfInitn')
+
+    header = add(initiation, 'GrpHdr')
+    add(header, 'MsgId', f'WORKHUB-PAYOUT-{batch.id}')
+    add(header, 'CreDtTm', timezone.now().replace(microsecond=0).isoformat())
+    add(header, 'NbOfTxs', len(payments))
+    add(header, 'CtrlSum', batch.total)
+    add(add(header, 'InitgPty'), 'Nm', 'Work Hub')
+
+    info = add(initiation, 'PmtInf')
+    add(info, 'PmtInfId', f'PAYOUT-{batch.id}')
+    add(info, 'PmtMtd', 'TRF')
+    add(info, 'NbOfTxs', len(payments))
+    add(info, 'CtrlSum', batch.total)
+    add(info, 'ReqdExctnDt', timezone.localdate().isoformat())
+    add(add(info, 'Dbtr'), 'Nm', 'Work Hub')
+
+    for payment in payments:
+        transfer = add(info, 'CdtTrfTxInf')
+        add(add(transfer, 'PmtId'), 'EndToEndId', f'WITHDRAWAL-{payment.id}')
+        add(add(transfer, 'Amt'), 'InstdAmt', payment.amount, Ccy=payment.currency)
+        add(add(transfer, 'Cdtr'), 'Nm', payment.from_user.get_full_name() or payment.from_user.username)
+        add(add(transfer, 'RmtInf'), 'Ustrd', f'Work Hub payout batch {batch.id}')
+
+    return ContentFile(ElementTree.tostring(document, encoding='utf-8', xml_declaration=True))
+
+
+def run_batch(batch_size=500):
+    """Pay out up to batch_size queued withdrawals, returning the batch or None.
+
+    The batch takes the currency of the oldest queued withdrawal and only
+    withdrawals in that currency.
+    """
+    with transaction.atomic():
+        queued = Payment.objects.filter(
+            payment_type='withdrawal', status='pending', payout_batch__isnull=True,
+        ).order_by('created_at', 'id')
+        currency = queued.values_list('currency', flat=True).first()
+        if currency is None:
+            return None
+        batch = PayoutBatch.objects.create(currency=currency)
+
+        queued = queued.filter(currency=currency).values_list('id', flat=True)[:batch_size]
+        claimed = Payment.objects.filter(id__in=list(queued), status='pending', payout_batch__isnull=True).update(payout_batch=batch)
+        if not claimed:
+            batch.delete()
+            return None
+
+        payments = list(batch.payments.select_related('from_user').order_by('created_at', 'id'))
+
+        applied, rejected = ledger.bulk_debit([
+            (payment.from_user_id, payment.amount, payment, 'Funds withdrawal')
+            for payment in payments
+        ])
+        paid = [entry[2] for entry in applied]
+        cancelled = [entry[2] for entry in rejected]
+
+        now = timezone.now()
+        Payment.objects.filter(id__in=[payment.id for payment in paid]).update(status='completed', completed_at=now)
+        # Rejected withdrawals leave the batch so the payout files only list real transfers
+        Payment.objects.filter(id__in=[payment.id for payment in cancelled]).update(status='cancelled', payout_batch=None)
+
+        # Bulk updates skip post_save, so announce the changes
+        for payment in paid:
+            payment.status, payment.completed_at = 'completed', now
+        for payment in cancelled:
+            payment.status = 'cancelled'
+        payments_changed.send(sender=Payment, payments=payments)
+
+        batch.total = sum((payment.amount for payment in paid), Decimal('0.00'))
+        batch.payments_count = len(paid)
+        batch.rejected_count = len(cancelled)
+        if paid:
+            batch.csv_file.save(f'payout-{batch.id}.csv', _csv_file(batch, paid), save=False)
+            batch.xml_file.save(f'payout-{batch.id}.xml', _xml_file(batch, paid), save=False)
+        batch.status = 'completed'
+        batch.completed_at = now
+        batch.save()
+
+    return batch
@@ -0,0 +1,145 @@
+"""Check every wallet's balance against its ledger.
+
+Wallets are split into ranges of ids (shards). Each shard is checked with one
+GROUP BY query that joins the wallets to their transactions and streams back
+one row per wallet: its ledger balance, how many entries there are and the
+highest sequence. A wallet is reported when its balance differs from the
+ledger balance, or when its last_sequence does not match the entries (a gap
+or a lost entry).
+
+Balances from before the ledger were not always backed by transactions, so
+migration 0003 anchored every wallet that existed then with a snapshot of its
+balance (is_anchor). An anchored wallet's ledger balance is the anchor plus
+the entries after it. Every other wallet starts from zero at sequence 0, and
+its periodic snapshots are ignored: they copy the running balance, so
+starting from one would hide drift in the entries before it. Being one statement, the query sees a single consistent state of
+both tables, so wallets changing while the check runs are not reported.
+
+Shards are independent, so reconcile() checks them in a process pool. Each
+worker opens its own database connection.
+"""
+import csv
+import io
+import multiprocessing
+import time
+from decimal import Decimal
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.db.models import Case, Count, DecimalField, F, Max, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Wallet, WalletReconciliation, WalletSnapshot
+
+REPORT_COLUMNS = [
+    'wallet_id', 'user_id', 'balance', 'ledger_balance', 'difference',
+    'last_sequence', 'ledger_last_sequence', 'ledger_entries', 'anchor_sequence',
+]
+
+
+def shard_ranges(shard_size):
+    """Split the wallet ids into [start, end) ranges of shard_size ids"""
+    bounds = Wallet.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [
+        (start, min(start + shard_size, bounds['high'] + 1))
+        for start in range(bounds['low'], bounds['high'] + 1, shard_size)
+    ]
+
+
+def check_shard(bounds):
+    """Check the wallets with ids in [start, end).
+
+    Returns (wallets, transactions, discrepancies) where discrepancies is a
+    list of report rows.
+    """
+    start, end = bounds
+    anchor = WalletSnapshot.objects.filter(wallet=OuterRef('pk'), is_anchor=True).order_by('sequence')
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    rows = Wallet.objects.filter(id__gte=start, id__lt=end).order_by().values_list('id').annotate(
+        anchor_sequence=Coalesce(Subquery(anchor.values('sequence')[:1]), 0),
+        anchor_balance=Coalesce(Subquery(anchor.values('balance')[:1]), Value(Decimal('0.00')), output_field=amount),
+    ).annotate(
+        tail_balance=Sum(Case(
+            When(transactions__sequence__lte=F('anchor_sequence'), then=Value(Decimal('0.00'))),
+            When(transactions__transaction_type='credit', then=F('transactions__amount')),
+            default=-F('transactions__amount'),
+            output_field=amount,
+        )),
+        ledger_entries=Count('transactions'),
+        ledger_last_sequence=Max('transactions__sequence'),
+    ).values_list(
+        'id', 'user_id', 'balance', 'last_sequence', 'anchor_sequence', 'anchor_balance',
+        'tail_balance', 'ledger_entries', 'ledger_last_sequence',
+    )
+
+    wallets = transactions = 0
+    discrepancies = []
+    for row in rows.iterator(chunk_size=2000):
+        wallet_id, user_id, balance, last_sequence, anchor_sequence, anchor_balance, tail_balance, entries, ledger_last = row
+        wallets += 1
+        transactions += entries
+        ledger_balance = (Decimal(anchor_balance) + Decimal(tail_balance or 0)).quantize(Decimal('0.01'))
+        ledger_last = ledger_last or 0
+        if balance != ledger_balance or last_sequence != ledger_last or entries != ledger_last:
+            discrepancies.append([
+                wallet_id, user_id, balance, ledger_balance, balance - ledger_balance,
+                last_sequence, ledger_last, entries, anchor_sequence,
+            ])
+    return wallets, transactions, discrepancies
+
+
+def _start_worker():
+    # Spawned workers start without Django loaded, forked ones already have it
+    import django
+    django.setup()
+
+
+def _report_file(discrepancies):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(REPORT_COLUMNS)
+    writer.writerows(sorted(discrepancies))
+    return ContentFile(output.getvalue().encode())
+
+
+def reconcile(shard_size=10000, workers=1, progress=None):
+    """Check every wallet and record the run as a WalletReconciliation.
+
+    With workers > 1 the shards are checked in that many processes. progress
+    is called with (bounds, wallets, transactions, discrepancies) after each
+    shard.
+    """
+    started = time.monotonic()
+    shards = shard_ranges(shard_size)
+    workers = max(1, min(workers, len(shards)))
+    run = WalletReconciliation.objects.create(workers=workers)
+
+    if workers > 1:
+        # Each worker opens its own connection, a forked one must not inherit ours
+        connections.close_all()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with context.Pool(workers, initializer=_start_worker) as pool:
+            results = list(_collect(zip(shards, pool.imap(check_shard, shards)), progress))
+    else:
+        results = list(_collect(((bounds, check_shard(bounds)) for bounds in shards), progress))
+
+    discrepancies = [row for result in results for row in result[2]]
+    run.shards = len(shards)
+    run.wallets_checked = sum(result[0] for result in results)
+    run.transactions_checked = sum(result[1] for result in results)
+    run.discrepancies = len(discrepancies)
+    run.duration_seconds = time.monotonic() - started
+    run.finished_at = timezone.now()
+    if discrepancies:
+        run.report.save(f'reconciliation-{run.id}.csv', _report_file(discrepancies), save=False)
+    run.save()
+    return run
+
+
+def _collect(results, progress):
+    for bounds, result in results:
+        if progress:
+            progress(bounds, *result)
+        yield result
@@ -0,0 +1,148 @@
+"""Per-user daily payment rollups.
+
+Every payment counts towards one bucket for its sender and one for its
+recipient. A bucket is the user, the day the payment was created, the
+direction (sent or received), its payment_type, its status and its currency. When a payment
+is saved, its previous contribution is taken out of the old buckets and its
+new one added. Changing status moves the amount from one bucket to another.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from . import fx, ledger
+from .models import Payment, PaymentDailyRollup
+
+TOTAL_KEYS = [
+    'received_completed', 'received_completed_count', 'received_on_hold', 'sent_completed',
+    'sent_on_hold', 'sent_on_hold_count', 'sent_count', 'refunded',
+]
+
+# Payment fields that decide its buckets
+BUCKET_FIELDS = {'from_user_id', 'to_user_id', 'payment_type', 'status', 'currency', 'amount', 'created_at'}
+
+
+def contributions(payment):
+    """Buckets a payment counts towards, as {bucket: amount}.
+    
+    Returns None for a payment loaded without some of the fields involved,
+    rather than loading them one query per row.
+    """
+    if BUCKET_FIELDS & payment.get_deferred_fields():
+        return None
+    if payment.pk is None or payment.created_at is None:
+        return {}
+    
+    day = timezone.localdate(payment.created_at)
+    buckets = {}
+    for direction, user_id in (('sent', payment.from_user_id), ('received', payment.to_user_id)):
+        if user_id:
+            buckets[(user_id, day, direction, payment.payment_type, payment.status, payment.currency)] = payment.amount
+    return buckets
+
+
+def _add(bucket, amount, count):
+    user_id, day, direction, payment_type, status, currency = bucket
+    rows = PaymentDailyRollup.objects.filter(
+        user_id=user_id, day=day, direction=direction, payment_type=payment_type, status=status, currency=currency,
+    )
+    if rows.update(total=F('total') + amount, count=F('count') + count) or count <= 0:
+        return
+    try:
+        with transaction.atomic():
+            rows.create(user_id=user_id, day=day, direction=direction, payment_type=payment_type,
+                        status=status, currency=currency, total=amount, count=count)
+    except IntegrityError:
+        # Another request created the bucket first
+        rows.update(total=F('total') + amount, count=F('count') + count)
+
+
+def apply_change(old, new):
+    """Move a payment's contribution from its old buckets to its new ones"""
+    apply_changes([(old, new)])
+
+
+def apply_changes(changes):
+    """Apply many (old, new) contribution changes, one upsert per bucket touched"""
+    amounts = Counter()
+    counts = Counter()
+    for old, new in changes:
+        for bucket, amount in old.items():
+            amounts[bucket] -= amount
+            counts[bucket] -= 1
+        for bucket, amount in new.items():
+            amounts[bucket] += amount
+            counts[bucket] += 1
+    
+    # Sorted so concurrent updates touch rows in the same order
+    for bucket in sorted(set(amounts) | set(counts), key=str):
+        if amounts[bucket] or counts[bucket]:
+            _add(bucket, amounts[bucket], counts[bucket])
+
+
+def rebuild(user_ids=None):
+    """Recompute rollups from the payments table, for some users or everyone"""
+    payments = Payment.objects.annotate(day=TruncDate('created_at'))
+    rollups = PaymentDailyRollup.objects.all()
+    if user_ids is not None:
+        payments = payments.filter(Q(from_user_id__in=user_ids) | Q(to_user_id__in=user_ids))
+        rollups = rollups.filter(user_id__in=user_ids)
+    
+    rows = []
+    for direction, user_field in (('sent', 'from_user_id'), ('received', 'to_user_id')):
+        grouped = payments.exclude(**{f'{user_field}__isnull': True})
+        if user_ids is not None:
+            grouped = grouped.filter(**{f'{user_field}__in': user_ids})
+        grouped = grouped.values(user_field, 'day', 'payment_type', 'status', 'currency').annotate(
+            total=Sum('amount'), count=Count('id'),
+        ).order_by()
+        for group in grouped.iterator(chunk_size=2000):
+            rows.append(PaymentDailyRollup(
+                user_id=group[user_field], day=group['day'], direction=direction,
+                payment_type=group['payment_type'], status=group['status'],
+                currency=group['currency'], total=group['total'], count=group['count'],
+            ))
+    
+    with transaction.atomic():
+        rollups.delete()
+        PaymentDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def payment_totals(user, currency=None):
+    """Every wallet and history total for a user, read from the rollups in one query.
+    
+    Amounts are summed per currency in the query and each currency's sums
+    converted once into currency, by default the user's wallet currency.
+    """
+    if currency is None:
+        currency = ledger.wallet_currency(user)
+    
+    sent = Q(direction='sent') & ~Q(payment_type='wallet_topup')
+    received = Q(direction='received')
+    groups = PaymentDailyRollup.objects.filter(user=user).values('currency').annotate(
+        received_completed=Sum('total', filter=received & Q(status='completed')),
+        received_completed_count=Sum('count', filter=received & Q(status='completed')),
+        received_on_hold=Sum('total', filter=received & Q(status__in=['on_hold', 'disputed'])),
+        sent_completed=Sum('total', filter=sent & Q(status='completed')),
+        sent_on_hold=Sum('total', filter=sent & Q(status__in=['on_hold', 'disputed'])),
+        sent_on_hold_count=Sum('count', filter=sent & Q(status__in=['on_hold', 'disputed'])),
+        sent_count=Sum('count', filter=sent),
+        refunded=Sum('total', filter=Q(direction='sent', status='refunded')),
+    ).order_by()
+    
+    by_key = {}
+    for group in groups:
+        group_currency = group.pop('currency')
+        for key, value in group.items():
+            by_key.setdefault(key, {})[group_currency] = value
+    
+    totals = {'currency': currency}
+    for key in TOTAL_KEYS:
+        values = by_key.get(key, {})
+        if key.endswith('_count'):
+            totals[key] = sum(value or 0 for value in values.values())
+        else:
+            totals[key] = fx.convert_totals(values, currency)
+    return totals
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
 from django.contrib.auth.models import User
-from .models import Wallet
+from .models import Wallet, Payment, ExchangeRate
+from . import fx, rollups
+
+# Sent with payments=[...] after payments change through bulk or conditional
+# updates, which skip post_save
+payments_changed = Signal()
 
 @receiver(post_save, sender=User)
 def create_user_wallet(sender, instance, created, **kwargs):
@@ -13,4 +18,51 @@ def create_user_wallet(sender, instance, created, **kwargs):
 def save_user_wallet(sender, instance, **kwargs):
     """Ensure wallet exists for existing users"""
     if not hasattr(instance, 'wallet'):
-        Wallet.objects.create(user=instance)
\ No newline at end of file
+        Wallet.objects.create(user=instance)
+
+@receiver(post_init, sender=Payment)
+def remember_payment_buckets(sender, instance, **kwargs):
+    """Note which rollup buckets a loaded payment counts towards"""
+    instance._rollup_buckets = rollups.contributions(instance)
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollups(sender, instance, **kwargs):
+    """Move the payment's amount between rollup buckets when it changes"""
+    buckets = rollups.contributions(instance)
+    if instance._rollup_buckets is None or buckets is None:
+        # Loaded with deferred fields, so the old buckets are unknown
+        rollups.rebuild(user_ids=[user_id for user_id in (instance.from_user_id, instance.to_user_id) if user_id])
+    elif buckets != instance._rollup_buckets:
+        rollups.apply_change(instance._rollup_buckets, buckets)
+    instance._rollup_buckets = rollups.contributions(instance)
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_from_rollups(sender, instance, **kwargs):
+    """Take a deleted payment out of its rollup buckets"""
+    if instance._rollup_buckets is None:
+        rollups.rebuild(user_ids=[user_id for user_id in (instance.from_user_id, instance.to_user_id) if user_id])
+    else:
+        rollups.apply_change(instance._rollup_buckets, {})
+
+
+@receiver(payments_changed)
+def update_changed_payment_rollups(sender, payments, **kwargs):
+    """Move rollup totals for payments changed without save()"""
+    changes, unknown = [], set()
+    for payment in payments:
+        buckets = rollups.contributions(payment)
+        if payment._rollup_buckets is None or buckets is None:
+            unknown.update(user_id for user_id in (payment.from_user_id, payment.to_user_id) if user_id)
+        else:
+            changes.append((payment._rollup_buckets, buckets))
+        payment._rollup_buckets = buckets
+    rollups.apply_changes(changes)
+    if unknown:
+        rollups.rebuild(user_ids=sorted(unknown))
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def forget_cached_rates(sender, **kwargs):
+    """A new or corrected rate may change lookups already cached"""
+    fx.clear_cache()
@@ -0,0 +1,30 @@
+// Idempotency keys for requests that move money.
+//
+// One key stands for one user action, such as accepting an application or
+// claiming a payment. The first send of the action makes the key and every
+// retry of it reuses that key, so the server replays its first response
+// instead of running the action twice. The key is forgotten once the server
+// has given its final answer.
+const Idempotency = (function() {
+    const keys = new Map();
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // Key for an action, e.g. `release-payment:${jobId}`
+    function keyFor(action) {
+        if (!keys.has(action)) keys.set(action, newKey());
+        return keys.get(action);
+    }
+
+    // Call with the server's answer to the action, so the next one is new.
+    // A 409 means the first send is still running and a 5xx that nothing
+    // was kept, so the key stays for the retry in both cases.
+    function settle(action, response) {
+        if (response.status !== 409 && response.status < 500) keys.delete(action);
+    }
+
+    return {keyFor, settle};
+})();
@@ -0,0 +1,12 @@
+from django import template
+from payments.currency import DEFAULT_CURRENCY, format_money
+
+register = template.Library()
+
+
+@register.filter
+def money(amount, currency=DEFAULT_CURRENCY):
+    """Format an amount in its currency, e.g. {{ payment.amount|money:payment.currency }}"""
+    if amount in (None, ''):
+        amount = 0
+    return format_money(amount, currency or DEFAULT_CURRENCY)
@@ -1,3 +1,478 @@
-from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.models import ProtectedError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from jobs.models import Job
+from . import escrow, ledger, payouts, reconciliation, rollups
+from .models import IdempotencyKey, Payment, PaymentDailyRollup, Transaction, Wallet, WalletSnapshot
 
-# Create your tests here.
+
+def make_job(client, freelancer=None, status='in_progress', budget='100.00'):
+    return Job.objects.create(
+        title='Landing page', description='Build a landing page', category='web_dev',
+        budget=Decimal(budget), deadline=date.today() + timedelta(days=30),
+        client=client, freelancer=freelancer, status=status,
+    )
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def test_transfer_moves_money_and_records_both_sides(self):
+        ledger.adjust_balance(self.alice, '50.00')
+        debit, credit = ledger.transfer(self.alice, self.bob, '20.00', description='Test')
+
+        self.assertEqual(ledger.get_balance(self.alice), Decimal('30.00'))
+        self.assertEqual(ledger.get_balance(self.bob), Decimal('20.00'))
+        self.assertEqual((debit.sequence, debit.balance_after), (2, Decimal('30.00')))
+        self.assertEqual((credit.sequence, credit.balance_after), (1, Decimal('20.00')))
+
+    def test_insufficient_funds_changes_nothing(self):
+        ledger.adjust_balance(self.alice, '10.00')
+
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.transfer(self.alice, self.bob, '10.01')
+
+        self.assertEqual(ledger.get_balance(self.alice), Decimal('10.00'))
+        self.assertEqual(ledger.get_balance(self.bob), Decimal('0.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_transfer_rejects_bad_amounts(self):
+        with self.assertRaises(ValueError):
+            ledger.transfer(self.alice, self.bob, '0')
+        with self.assertRaises(ValueError):
+            ledger.transfer(None, None, '5')
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=3)
+    def test_reconstruct_balance_matches_wallet(self):
+        for amount in ['10.00', '5.50', '-3.25', '7.00', '-1.00']:
+            ledger.adjust_balance(self.alice, amount)
+
+        wallet = Wallet.objects.get(user=self.alice)
+        self.assertEqual(WalletSnapshot.objects.filter(wallet=wallet).count(), 1)
+        self.assertEqual(ledger.reconstruct_balance(wallet), (wallet.balance, wallet.last_sequence))
+        self.assertEqual(wallet.balance, Decimal('18.25'))
+
+    def test_bulk_debit_skips_what_a_wallet_cannot_cover(self):
+        ledger.adjust_balance(self.alice, '30.00')
+        entries = [
+            (self.alice.id, Decimal('20.00'), None, 'First'),
+            (self.alice.id, Decimal('20.00'), None, 'Second'),
+            (self.bob.id, Decimal('1.00'), None, 'No wallet'),
+        ]
+
+        applied, rejected = ledger.bulk_debit(entries)
+
+        self.assertEqual(applied, entries[:1])
+        self.assertEqual(rejected, entries[1:])
+        wallet = Wallet.objects.get(user=self.alice)
+        self.assertEqual((wallet.balance, wallet.last_sequence), (Decimal('10.00'), 2))
+        self.assertEqual(ledger.reconstruct_balance(wallet), (Decimal('10.00'), 2))
+
+    def test_bulk_debit_locks_the_wallets_before_reading_them(self):
+        ledger.adjust_balance(self.alice, '30.00')
+
+        with CaptureQueriesContext(connection) as queries:
+            ledger.bulk_debit([(self.alice.id, Decimal('20.00'), None, 'Payout')])
+
+        wallet_queries = [query['sql'] for query in queries if '"payments_wallet"' in query['sql']]
+        self.assertTrue(wallet_queries[0].startswith('UPDATE') or 'FOR UPDATE' in wallet_queries[0])
+
+    def test_bulk_credit_reads_missing_wallets_in_one_query(self):
+        users = [User.objects.create_user(f'new{i}') for i in range(4)]
+
+        def credit_without_wallets(recipients):
+            Wallet.objects.filter(user__in=recipients).delete()
+            with CaptureQueriesContext(connection) as queries:
+                ledger.bulk_credit([(user.id, Decimal('5.00'), None, 'Release') for user in recipients])
+            return len(queries)
+
+        self.assertEqual(credit_without_wallets(users[:1]), credit_without_wallets(users[1:]))
+        self.assertEqual([ledger.get_balance(user) for user in users], [Decimal('5.00')] * 4)
+
+    def test_payment_with_ledger_entries_cannot_be_deleted(self):
+        payment = Payment.objects.create(from_user=self.alice, amount=Decimal('5.00'), payment_type='wallet_topup')
+        ledger.transfer(None, self.alice, '5.00', payment, 'Top-up')
+
+        with self.assertRaises(ProtectedError):
+            payment.delete()
+        self.assertEqual(Transaction.objects.filter(payment=payment).count(), 1)
+
+    def test_transactions_are_append_only(self):
+        ledger.adjust_balance(self.alice, '5.00')
+        record = Transaction.objects.get()
+
+        with self.assertRaises(ValueError):
+            record.save()
+        with self.assertRaises(ValueError):
+            record.delete()
+
+
+class EscrowTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+        ledger.adjust_balance(self.client_user, '500.00')
+        self.job = make_job(self.client_user, self.freelancer)
+        self.payment = escrow.hold(self.job, self.client_user, self.freelancer, Decimal('200.00'))
+
+    def test_hold_takes_the_amount_from_the_client(self):
+        self.assertEqual(self.payment.status, 'on_hold')
+        self.assertIsNone(self.payment.release_after)
+        self.assertEqual(ledger.get_balance(self.client_user), Decimal('300.00'))
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('0.00'))
+
+    def test_hold_without_funds_creates_nothing(self):
+        job = make_job(self.client_user, self.freelancer)
+
+        with self.assertRaises(ledger.InsufficientFunds):
+            escrow.hold(job, self.client_user, self.freelancer, Decimal('1000.00'))
+
+        self.assertFalse(Payment.objects.filter(job=job).exists())
+        self.assertEqual(ledger.get_balance(self.client_user), Decimal('300.00'))
+
+    def test_release_pays_the_freelancer_once(self):
+        escrow.release(self.payment)
+
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('200.00'))
+        with self.assertRaises(escrow.InvalidTransition):
+            escrow.release(self.payment)
+        with self.assertRaises(escrow.InvalidTransition):
+            escrow.refund(self.payment)
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('200.00'))
+
+    def test_refund_returns_the_hold(self):
+        escrow.refund(self.payment)
+
+        self.assertEqual(ledger.get_balance(self.client_user), Decimal('500.00'))
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'refunded')
+
+    def test_disputed_payment_only_moves_when_resolved(self):
+        escrow.dispute(self.payment)
+
+        with self.assertRaises(escrow.InvalidTransition):
+            escrow.release(self.payment)
+        escrow.refund(self.payment, resolve=True)
+        self.assertEqual(ledger.get_balance(self.client_user), Decimal('500.00'))
+
+    def test_release_due_waits_for_delivery_and_the_deadline(self):
+        now = timezone.now()
+        self.assertEqual(escrow.release_due(now=now + timedelta(days=365)), [])
+
+        Job.objects.filter(pk=self.job.pk).update(status='under_review')
+        escrow.deliver(self.job, now=now)
+        days = escrow.release_deadline(now) - now
+
+        self.assertEqual(escrow.release_due(now=now + days - timedelta(minutes=1)), [])
+        released = escrow.release_due(now=now + days)
+        self.assertEqual([payment.id for payment in released], [self.payment.id])
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('200.00'))
+        self.assertEqual(Job.objects.get(pk=self.job.pk).status, 'completed')
+        self.assertEqual(escrow.release_due(now=now + days), [])
+
+    def test_release_due_skips_disputed_payments(self):
+        now = timezone.now()
+        Job.objects.filter(pk=self.job.pk).update(status='under_review')
+        escrow.deliver(self.job, now=now)
+        escrow.dispute(self.payment)
+
+        self.assertEqual(escrow.release_due(now=now + timedelta(days=365)), [])
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('0.00'))
+
+
+class ConcurrentReleaseTests(TransactionTestCase):
+    def test_two_release_runs_pay_each_hold_once(self):
+        client_user = User.objects.create_user('client')
+        freelancer = User.objects.create_user('freelancer')
+        ledger.adjust_balance(client_user, '500.00')
+        now = timezone.now()
+        for amount in ('100.00', '50.00'):
+            job = make_job(client_user, freelancer, status='under_review')
+            escrow.hold(job, client_user, freelancer, Decimal(amount))
+            escrow.deliver(job, now=now)
+
+        barrier = threading.Barrier(2)
+        released, errors = [], []
+
+        def run():
+            try:
+                barrier.wait()
+                released.extend(escrow.release_due(now=escrow.release_deadline(now)))
+            except OperationalError as e:
+                # SQLite turns the second writer away rather than queueing it
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        released.extend(escrow.release_due(now=escrow.release_deadline(now)))
+
+        wallet = Wallet.objects.get(user=freelancer)
+        self.assertEqual(sorted(payment.amount for payment in released), [Decimal('50.00'), Decimal('100.00')])
+        self.assertEqual(wallet.balance, Decimal('150.00'))
+        self.assertEqual(ledger.reconstruct_balance(wallet), (Decimal('150.00'), 2))
+
+
+class PayoutTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.freelancer = User.objects.create_user('freelancer', email='f@example.com')
+        ledger.adjust_balance(self.freelancer, '100.00')
+
+    def test_queue_withdrawal_counts_queued_withdrawals(self):
+        payouts.queue_withdrawal(self.freelancer, Decimal('60.00'))
+
+        with self.assertRaises(ledger.InsufficientFunds):
+            payouts.queue_withdrawal(self.freelancer, Decimal('50.00'))
+        self.assertEqual(ledger.available_balance(self.freelancer), Decimal('40.00'))
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('100.00'))
+
+    def test_run_batch_pays_what_the_wallet_covers(self):
+        paid = payouts.queue_withdrawal(self.freelancer, Decimal('70.00'))
+        short = payouts.queue_withdrawal(self.freelancer, Decimal('30.00'))
+        # Spent elsewhere after the withdrawals were queued
+        ledger.adjust_balance(self.freelancer, '-10.00')
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            batch = payouts.run_batch()
+            with batch.csv_file.open('rb') as csv_file:
+                self.assertIn(f'WITHDRAWAL-{paid.id}', csv_file.read().decode())
+
+        self.assertEqual((batch.payments_count, batch.rejected_count, batch.total), (1, 1, Decimal('70.00')))
+        self.assertEqual(Payment.objects.get(pk=paid.pk).status, 'completed')
+        self.assertEqual(Payment.objects.get(pk=short.pk).status, 'cancelled')
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('20.00'))
+        self.assertIsNone(payouts.run_batch())
+
+    def test_each_batch_pays_one_currency(self):
+        euro_user = User.objects.create_user('euro')
+        Wallet.objects.filter(user=euro_user).update(currency='EUR')
+        ledger.adjust_balance(euro_user, '100.00')
+        payouts.queue_withdrawal(self.freelancer, Decimal('40.00'))
+        payouts.queue_withdrawal(euro_user, Decimal('25.00'))
+        payouts.queue_withdrawal(self.freelancer, Decimal('10.00'))
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dollars, euros = payouts.run_batch(), payouts.run_batch()
+
+        self.assertEqual((dollars.currency, dollars.payments_count, dollars.total), ('USD', 2, Decimal('50.00')))
+        self.assertEqual((euros.currency, euros.payments_count, euros.total), ('EUR', 1, Decimal('25.00')))
+        self.assertIn('€25.00', str(euros))
+        self.assertIsNone(payouts.run_batch())
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def reconcile(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            run = reconciliation.reconcile()
+            if not run.report:
+                return []
+            with run.report.open('rb') as report:
+                return list(csv.DictReader(report.read().decode().splitlines()))
+
+    def test_legacy_wallet_is_checked_from_its_anchor(self):
+        # A balance from before the ledger, anchored the way migration 0003 does
+        legacy = User.objects.create_user('legacy')
+        Wallet.objects.filter(user=legacy).update(balance=Decimal('500.00'))
+        wallet = Wallet.objects.get(user=legacy)
+        WalletSnapshot.objects.create(wallet=wallet, sequence=0, balance=wallet.balance, is_anchor=True)
+        ledger.adjust_balance(legacy, '25.00')
+        ledger.adjust_balance(User.objects.create_user('current'), '40.00')
+
+        self.assertEqual(self.reconcile(), [])
+
+    @override_settings(WALLET_SNAPSHOT_INTERVAL=2)
+    def test_drift_before_a_periodic_snapshot_is_reported(self):
+        user = User.objects.create_user('user')
+        for amount in ['40.00', '10.00', '5.00']:
+            ledger.adjust_balance(user, amount)
+        # The first entry no longer adds up to the balance the snapshot at 2 copied
+        Transaction.objects.filter(wallet__user=user, sequence=1).update(amount=Decimal('30.00'))
+
+        [row] = self.reconcile()
+        self.assertEqual((row['ledger_balance'], row['difference'], row['anchor_sequence']), ('45.00', '10.00', '0'))
+
+    def test_balance_off_its_ledger_is_reported(self):
+        user = User.objects.create_user('user')
+        ledger.adjust_balance(user, '40.00')
+        Wallet.objects.filter(user=user).update(balance=Decimal('45.00'))
+
+        [row] = self.reconcile()
+        self.assertEqual((row['ledger_balance'], row['difference']), ('40.00', '5.00'))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret')
+        self.client.force_login(self.user)
+
+    def top_up(self, amount, key):
+        return self.client.post(reverse('payments:top_up_wallet'), {'amount': amount}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeated_key_replays_the_first_response(self):
+        first = self.top_up('25.00', 'key-1')
+        second = self.top_up('25.00', 'key-1')
+
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual((second.status_code, second['Location']), (302, first['Location']))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.filter(payment_type='wallet_topup').count(), 1)
+        self.assertEqual(ledger.get_balance(self.user), Decimal('25.00'))
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.top_up('25.00', 'key-1')
+        response = self.top_up('30.00', 'key-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(ledger.get_balance(self.user), Decimal('25.00'))
+
+    def test_key_still_in_progress_conflicts(self):
+        self.top_up('25.00', 'key-1')
+        IdempotencyKey.objects.update(status='in_progress')
+
+        self.assertEqual(self.top_up('25.00', 'key-1').status_code, 409)
+
+    def test_in_progress_key_is_taken_over_once_its_lease_runs_out(self):
+        # The worker dies mid-request, before the key is freed or filled in
+        with mock.patch('payments.ledger.transfer', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self.top_up('25.00', 'key-1')
+        self.assertEqual(self.top_up('25.00', 'key-1').status_code, 409)
+
+        IdempotencyKey.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.top_up('25.00', 'key-1')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.top_up('25.00', 'key-1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(ledger.get_balance(self.user), Decimal('25.00'))
+
+    def test_keys_are_per_user(self):
+        self.top_up('25.00', 'key-1')
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.top_up('25.00', 'key-1')
+
+        self.assertEqual(ledger.get_balance(other), Decimal('25.00'))
+
+    def test_expired_key_runs_again(self):
+        self.top_up('25.00', 'key-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.top_up('25.00', 'key-1')
+
+        self.assertEqual(ledger.get_balance(self.user), Decimal('50.00'))
+
+    def test_transient_database_error_frees_the_key(self):
+        with mock.patch('payments.ledger.transfer', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.top_up('25.00', 'key-1')
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.top_up('25.00', 'key-1')
+        self.assertEqual(ledger.get_balance(self.user), Decimal('25.00'))
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post(reverse('payments:top_up_wallet'), {'amount': '5.00'})
+        self.client.post(reverse('payments:top_up_wallet'), {'amount': '5.00'})
+
+        self.assertEqual(ledger.get_balance(self.user), Decimal('10.00'))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client')
+        self.freelancer = User.objects.create_user('freelancer')
+
+    def rollup_rows(self):
+        return sorted(
+            PaymentDailyRollup.objects.exclude(total=0, count=0).values_list(
+                'user_id', 'day', 'direction', 'payment_type', 'status', 'currency', 'total', 'count',
+            )
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_incremental_rollups_match_rebuild(self):
+        ledger.adjust_balance(self.client_user, '1000.00')
+        Payment.objects.create(
+            from_user=self.client_user, amount=Decimal('1000.00'), status='completed',
+            payment_type='wallet_topup', completed_at=timezone.now(),
+        )
+        released = escrow.hold(make_job(self.client_user, self.freelancer), self.client_user, self.freelancer, Decimal('300.00'))
+        escrow.release(released)
+        refunded = escrow.hold(make_job(self.client_user, self.freelancer), self.client_user, self.freelancer, Decimal('150.00'))
+        escrow.refund(refunded)
+        escrow.hold(make_job(self.client_user, self.freelancer), self.client_user, self.freelancer, Decimal('75.00'))
+        payouts.queue_withdrawal(self.freelancer, Decimal('100.00'))
+
+        self.assertMatchesRebuild()
+
+    def test_deleted_payment_leaves_its_buckets(self):
+        payment = Payment.objects.create(
+            from_user=self.client_user, to_user=self.freelancer, amount=Decimal('40.00'), status='pending',
+        )
+        payment.status = 'cancelled'
+        payment.save()
+        payment.delete()
+
+        self.assertEqual(self.rollup_rows(), [])
+        self.assertMatchesRebuild()
+
+    def test_payment_totals_read_the_rollups(self):
+        ledger.adjust_balance(self.client_user, '500.00')
+        escrow.release(escrow.hold(make_job(self.client_user, self.freelancer), self.client_user, self.freelancer, Decimal('120.00')))
+        escrow.hold(make_job(self.client_user, self.freelancer), self.client_user, self.freelancer, Decimal('80.00'))
+
+        client_totals = rollups.payment_totals(self.client_user)
+        freelancer_totals = rollups.payment_totals(self.freelancer)
+
+        self.assertEqual(client_totals['sent_completed'], Decimal('120.00'))
+        self.assertEqual((client_totals['sent_on_hold'], client_totals['sent_on_hold_count']), (Decimal('80.00'), 1))
+        self.assertEqual(freelancer_totals['received_completed'], Decimal('120.00'))
+        self.assertEqual(freelancer_totals['received_on_hold'], Decimal('80.00'))
+
+
+class ViewTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user('client', password='secret')
+        self.freelancer = User.objects.create_user('freelancer', password='secret')
+        ledger.adjust_balance(self.client_user, '100.00')
+        self.job = make_job(self.client_user, self.freelancer, status='completed')
+        self.payment = escrow.hold(self.job, self.client_user, self.freelancer, Decimal('60.00'))
+
+    def test_release_payment_is_idempotent(self):
+        self.client.force_login(self.freelancer)
+        body = json.dumps({'job_id': self.job.id})
+        responses = [
+            self.client.post(reverse('payments:release_payment'), body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='release-1')
+            for _ in range(2)
+        ]
+
+        self.assertEqual([response.json()['success'] for response in responses], [True, True])
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(ledger.get_balance(self.freelancer), Decimal('60.00'))
@@ -11,5 +11,7 @@ urlpatterns = [
     path('make-payment/', views.make_payment, name='make_payment'),
     path('release-payment/', views.release_payment, name='release_payment'),
     path('cancel-payment/', views.cancel_payment, name='cancel_payment'),
+    path('dispute-payment/', views.dispute_payment, name='dispute_payment'),
     path('history/', views.payment_history, name='payment_history'),
+    path('history/export/', views.export_payment_history, name='export_payment_history'),
 ]
\ No newline at end of file
@@ -1,12 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.db import transaction, models
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from decimal import Decimal
+from datetime import date
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from .models import Wallet, Payment, Transaction
+from . import escrow, history, ledger, payouts, rollups
+from .currency import format_money
+from .idempotency import RETRYABLE_ERRORS, idempotent
+import uuid
 from jobs.models import Job, Application
+from jobs.pagination import paginate_keyset
+import csv
+import itertools
 import json
 
 @login_required
@@ -18,46 +28,30 @@ def wallet_view(request):
     # Get pending payments (money on hold)
     pending_payments_sent = Payment.objects.filter(
         from_user=request.user, 
-        status='on_hold'
+        status__in=['on_hold', 'disputed']
     )
     
     pending_payments_received = Payment.objects.filter(
         to_user=request.user, 
-        status='on_hold'
+        status__in=['on_hold', 'disputed']
     )
     
+    # Totals come from the daily rollups rather than summing every payment
+    totals = rollups.payment_totals(request.user)
+    pending_withdrawals = ledger.pending_withdrawals(request.user)
+    
     # Calculate stats based on user role
     if hasattr(request.user, 'profile') and request.user.profile.role == 'freelancer':
         # For freelancers: total earned (completed payments) and pending earnings
-        total_earnings = Payment.objects.filter(
-            to_user=request.user, 
-            status='completed'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
-        
-        pending_earnings = pending_payments_received.aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        
         stats = {
-            'total_earnings': total_earnings,
-            'pending_earnings': pending_earnings,
+            'total_earnings': totals['received_completed'],
+            'pending_earnings': totals['received_on_hold'],
         }
     else:
         # For clients: total spent (completed payments) and payments on hold
-        total_spent = Payment.objects.filter(
-            from_user=request.user,
-            status='completed'
-        ).exclude(payment_type='wallet_topup').aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        
-        pending_payments = pending_payments_sent.aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        
         stats = {
-            'total_spent': total_spent,
-            'pending_payments': pending_payments,
+            'total_spent': totals['sent_completed'],
+            'pending_payments': totals['sent_on_hold'],
         }
     
     context = {
@@ -65,12 +59,17 @@ def wallet_view(request):
         'transactions': transactions,
         'pending_payments_sent': pending_payments_sent,
         'pending_payments_received': pending_payments_received,
+        'idempotency_key': uuid.uuid4(),
+        'pending_withdrawals': pending_withdrawals,
+        'available_balance': wallet.balance - pending_withdrawals,
+        'currency': wallet.currency,
         **stats,  # Add the calculated stats to context
     }
     
     return render(request, 'payments/wallet.html', context)
 
 @login_required
+@idempotent
 def top_up_wallet(request):
     """Add funds to user's wallet (simulation) - Only for clients"""
     # Check if user is a client
@@ -86,49 +85,43 @@ def top_up_wallet(request):
             if amount <= 0:
                 messages.error(request, 'Amount must be greater than 0')
                 return redirect('payments:wallet')
-                
+            
+            # Top-ups are in the wallet's own currency
+            currency = ledger.wallet_currency(request.user)
             if amount > 10000:  # Set a reasonable limit
-                messages.error(request, 'Maximum top-up amount is $10,000')
+                messages.error(request, f'Maximum top-up amount is {format_money(10000, currency)}')
                 return redirect('payments:wallet')
             
             with transaction.atomic():
-                wallet, created = Wallet.objects.get_or_create(user=request.user)
-                
                 # Create payment record
                 payment = Payment.objects.create(
                     from_user=request.user,
                     amount=amount,
+                    currency=currency,
                     status='completed',
                     payment_type='wallet_topup',
-                    description=f'Wallet top-up of ${amount}',
+                    description=f'Wallet top-up of {format_money(amount, currency)}',
                     completed_at=timezone.now()
                 )
                 
                 # Add funds to wallet
-                old_balance = wallet.balance
-                wallet.add_funds(amount)
-                
-                # Create transaction record
-                Transaction.objects.create(
-                    wallet=wallet,
-                    payment=payment,
-                    amount=amount,
-                    transaction_type='credit',
-                    description=f'Wallet top-up',
-                    balance_after=wallet.balance
-                )
+                debit, credit = ledger.transfer(None, request.user, amount, payment, 'Wallet top-up')
                 
                 # Store success message in session for transaction success page
                 request.session['transaction_success'] = {
                     'type': 'top_up',
                     'amount': str(amount),
-                    'new_balance': str(wallet.balance)
+                    'new_balance': str(credit.balance_after),
+                    'currency': currency,
                 }
                 
                 return redirect('payments:transaction_success')
                 
         except (ValueError, TypeError):
             messages.error(request, 'Invalid amount entered')
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
         except Exception as e:
             messages.error(request, 'An error occurred while processing your request')
     
@@ -151,6 +144,7 @@ def transaction_success(request):
     return render(request, 'payments/transaction.html', context)
 
 @login_required
+@idempotent
 def make_payment(request):
     """Handle job payment when application is accepted"""
     if request.method == 'POST':
@@ -177,52 +171,29 @@ def make_payment(request):
             
             amount = application.proposed_budget
             
-            with transaction.atomic():
-                wallet, created = Wallet.objects.get_or_create(user=request.user)
-                
-                # Check if user has sufficient balance
-                if not wallet.can_withdraw(amount):
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Insufficient balance. You need ${amount} but only have ${wallet.balance}'
-                    })
-                
-                # Deduct from client's wallet
-                if not wallet.deduct_funds(amount):
-                    return JsonResponse({'success': False, 'error': 'Failed to deduct funds'})
-                
-                # Create payment on hold
-                payment = Payment.objects.create(
-                    job=job,
-                    from_user=request.user,
-                    to_user=application.freelancer,
-                    amount=amount,
-                    status='on_hold',
-                    payment_type='job_payment',
-                    description=f'Payment for job: {job.title}'
-                )
-                
-                # Create transaction record for client (debit)
-                Transaction.objects.create(
-                    wallet=wallet,
-                    payment=payment,
-                    amount=amount,
-                    transaction_type='debit',
-                    description=f'Payment on hold for job: {job.title}',
-                    balance_after=wallet.balance
-                )
-                
-                return JsonResponse({
-                    'success': True, 
-                    'message': f'Payment of ${amount} has been placed on hold'
-                })
+            # Hold the payment in escrow, nothing is created if the balance is short
+            escrow.hold(job, request.user, application.freelancer, amount)
+            
+            return JsonResponse({
+                'success': True, 
+                'message': f'Payment of {format_money(amount, job.currency)} has been placed on hold'
+            })
                 
+        except ledger.InsufficientFunds as e:
+            return JsonResponse({'success': False, 'error': str(e)})
+        except IntegrityError:
+            # Another request paid for this job between the check and the insert
+            return JsonResponse({'success': False, 'error': 'Payment already made for this job'})
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 @login_required
+@idempotent
 def release_payment(request):
     """Release payment when job is completed"""
     if request.method == 'POST':
@@ -250,33 +221,19 @@ def release_payment(request):
             if not payment:
                 return JsonResponse({'success': False, 'error': 'No payment found on hold for this job'})
             
-            with transaction.atomic():
-                # Create or get freelancer's wallet
-                freelancer_wallet, created = Wallet.objects.get_or_create(user=request.user)
-                
-                # Add funds to freelancer's wallet
-                freelancer_wallet.add_funds(payment.amount)
-                
-                # Update payment status
-                payment.status = 'completed'
-                payment.completed_at = timezone.now()
-                payment.save()
-                
-                # Create transaction record for freelancer (credit)
-                Transaction.objects.create(
-                    wallet=freelancer_wallet,
-                    payment=payment,
-                    amount=payment.amount,
-                    transaction_type='credit',
-                    description=f'Payment received for job: {job.title}',
-                    balance_after=freelancer_wallet.balance
-                )
-                
-                return JsonResponse({
-                    'success': True, 
-                    'message': f'Payment of ${payment.amount} has been released to your wallet'
-                })
+            # Release it from escrow to the freelancer's wallet
+            escrow.release(payment)
+            
+            return JsonResponse({
+                'success': True, 
+                'message': f'Payment of {format_money(payment.amount, payment.currency)} has been released to your wallet'
+            })
                 
+        except escrow.InvalidTransition:
+            return JsonResponse({'success': False, 'error': 'No payment found on hold for this job'})
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
@@ -284,42 +241,101 @@ def release_payment(request):
 
 @login_required
 def payment_history(request):
-    """Display user's payment history based on role"""
-    user_role = getattr(request.user.profile, 'role', None) if hasattr(request.user, 'profile') else None
+    """Display user's payment history based on role, one page at a time"""
+    is_freelancer = history.is_freelancer(request.user)
+    payments, field = history.payments_for(request.user, is_freelancer)
     
-    if user_role == 'freelancer':
-        # Freelancer only sees received payments with total amount
-        payments_received = Payment.objects.filter(
-            to_user=request.user, 
-            status='completed'
-        ).order_by('-completed_at')
-        
-        total_received = sum(payment.amount for payment in payments_received)
-        
+    page_size = getattr(settings, 'PAYMENT_HISTORY_PAGE_SIZE', 25)
+    page, next_cursor = paginate_keyset(
+        payments.select_related('job', 'from_user', 'to_user'),
+        request.GET.get('cursor'), page_size, field=field,
+    )
+    
+    next_page_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_page_query = params.urlencode()
+    
+    totals = rollups.payment_totals(request.user)
+    
+    if is_freelancer:
+        received_count = totals['received_completed_count']
         context = {
-            'payments_received': payments_received,
-            'total_received': total_received,
+            'payments_received': page,
+            'total_received': totals['received_completed'],
+            'received_count': received_count,
+            'average_received': totals['received_completed'] / received_count if received_count else 0,
             'is_freelancer': True,
         }
     else:
-        # Client sees sent payments with total amount
-        payments_sent = Payment.objects.filter(
-            from_user=request.user
-        ).exclude(payment_type='wallet_topup').order_by('-created_at')
-        
-        total_sent = sum(payment.amount for payment in payments_sent if payment.status in ['completed', 'on_hold'])
-        on_hold_count = payments_sent.filter(status='on_hold').count()
-        
         context = {
-            'payments_sent': payments_sent,
-            'total_sent': total_sent,
-            'on_hold_count': on_hold_count,
+            'payments_sent': page,
+            'total_sent': totals['sent_completed'] + totals['sent_on_hold'],
+            'sent_count': totals['sent_count'],
+            'on_hold_count': totals['sent_on_hold_count'],
             'is_freelancer': False,
         }
     
+    context['currency'] = totals['currency']
+    context['next_page_query'] = next_page_query
+    context['is_first_page'] = not request.GET.get('cursor')
     return render(request, 'payments/payment_history.html', context)
 
+class _Echo:
+    """File-like object whose write() hands the line back to the caller"""
+    def write(self, value):
+        return value
+
+EXPORT_FIELDS = [
+    'id', 'created_at', 'completed_at', 'payment_type', 'status', 'amount', 'currency',
+    'from_user__username', 'to_user__username', 'job__title', 'description',
+]
+# Column names without the lookup path, e.g. from_user instead of from_user__username
+EXPORT_COLUMNS = [name.split('__')[0] for name in EXPORT_FIELDS]
+
+@login_required
+def export_payment_history(request):
+    """Stream the whole payment history as CSV or NDJSON with constant memory"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return JsonResponse({'success': False, 'error': 'Format must be csv or ndjson'}, status=400)
+    
+    payments, field = history.payments_for(request.user, history.is_freelancer(request.user))
+    
+    # Optional date range, e.g. ?since=2025-01-01&until=2026-01-01
+    try:
+        if request.GET.get('since'):
+            payments = payments.filter(**{f'{field}__date__gte': date.fromisoformat(request.GET['since'])})
+        if request.GET.get('until'):
+            payments = payments.filter(**{f'{field}__date__lt': date.fromisoformat(request.GET['until'])})
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Dates must look like YYYY-MM-DD'}, status=400)
+    
+    # values() skips building model instances, iterator() reads in chunks
+    rows = payments.order_by(field, 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=1000)
+    
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        lines = itertools.chain(
+            [writer.writerow(EXPORT_COLUMNS)],
+            (writer.writerow(row) for row in rows),
+        )
+        content_type = 'text/csv'
+    else:
+        lines = (
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in rows
+        )
+        content_type = 'application/x-ndjson'
+    
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    filename = f'payments-{timezone.localdate().isoformat()}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @login_required
+@idempotent
 def withdraw_funds(request):
     """Allow freelancer to withdraw funds from wallet"""
     # Check if user is a freelancer
@@ -336,54 +352,33 @@ def withdraw_funds(request):
                 messages.error(request, 'Amount must be greater than 0')
                 return redirect('payments:wallet')
             
-            wallet, created = Wallet.objects.get_or_create(user=request.user)
+            # Queue the withdrawal, process_payouts debits the wallet in a batch
+            payment = payouts.queue_withdrawal(request.user, amount)
             
-            if not wallet.can_withdraw(amount):
-                messages.error(request, f'Insufficient balance. You have ${wallet.balance}')
-                return redirect('payments:wallet')
+            # Store success message in session
+            request.session['transaction_success'] = {
+                'type': 'withdrawal',
+                'amount': str(amount),
+                'new_balance': str(ledger.available_balance(request.user)),
+                'currency': payment.currency,
+            }
             
-            with transaction.atomic():
-                # Deduct funds from wallet
-                if wallet.deduct_funds(amount):
-                    # Create payment record for withdrawal
-                    payment = Payment.objects.create(
-                        from_user=request.user,
-                        amount=amount,
-                        status='completed',
-                        payment_type='withdrawal',
-                        description=f'Withdrawal of ${amount}',
-                        completed_at=timezone.now()
-                    )
-                    
-                    # Create transaction record
-                    Transaction.objects.create(
-                        wallet=wallet,
-                        payment=payment,
-                        amount=amount,
-                        transaction_type='debit',
-                        description=f'Funds withdrawal',
-                        balance_after=wallet.balance
-                    )
-                    
-                    # Store success message in session
-                    request.session['transaction_success'] = {
-                        'type': 'withdrawal',
-                        'amount': str(amount),
-                        'new_balance': str(wallet.balance)
-                    }
-                    
-                    return redirect('payments:transaction_success')
-                else:
-                    messages.error(request, 'Failed to process withdrawal')
+            return redirect('payments:transaction_success')
                     
+        except ledger.InsufficientFunds as e:
+            messages.error(request, f'Insufficient balance. You have {format_money(e.balance, e.currency)}')
         except (ValueError, TypeError):
             messages.error(request, 'Invalid amount entered')
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
         except Exception as e:
             messages.error(request, 'An error occurred while processing your request')
     
     return redirect('payments:wallet')
 
 @login_required
+@idempotent
 def cancel_payment(request):
     """Cancel payment and refund to client (only if job is cancelled)"""
     if request.method == 'POST':
@@ -404,32 +399,52 @@ def cancel_payment(request):
             if payment.job and payment.job.status != 'cancelled':
                 return JsonResponse({'success': False, 'error': 'Job must be cancelled first'})
             
-            with transaction.atomic():
-                client_wallet = Wallet.objects.get(user=request.user)
-                
-                # Refund to client's wallet
-                client_wallet.add_funds(payment.amount)
-                
-                # Update payment status
-                payment.status = 'refunded'
-                payment.completed_at = timezone.now()
-                payment.save()
-                
-                # Create transaction record for client (credit/refund)
-                Transaction.objects.create(
-                    wallet=client_wallet,
-                    payment=payment,
-                    amount=payment.amount,
-                    transaction_type='credit',
-                    description=f'Refund for cancelled job: {payment.job.title if payment.job else "N/A"}',
-                    balance_after=client_wallet.balance
-                )
+            # Refund from escrow to the client's wallet
+            escrow.refund(payment)
+            
+            return JsonResponse({
+                'success': True, 
+                'message': f'Payment of {format_money(payment.amount, payment.currency)} has been refunded to your wallet'
+            })
                 
-                return JsonResponse({
-                    'success': True, 
-                    'message': f'Payment of ${payment.amount} has been refunded to your wallet'
-                })
+        except escrow.InvalidTransition:
+            return JsonResponse({'success': False, 'error': 'Payment cannot be cancelled'})
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': str(e)})
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+
+@login_required
+@idempotent
+def dispute_payment(request):
+    """Freeze a held payment until staff release or refund it"""
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        payment_id = data.get('payment_id')
+        
+        try:
+            payment = get_object_or_404(Payment, id=payment_id)
+            
+            # Only the client who made the payment can dispute it
+            if payment.from_user != request.user:
+                return JsonResponse({'success': False, 'error': 'Unauthorized'})
+            
+            escrow.dispute(payment)
+            
+            return JsonResponse({
+                'success': True, 
+                'message': f'Payment of {format_money(payment.amount, payment.currency)} is disputed and will be reviewed by our team'
+            })
                 
+        except escrow.InvalidTransition:
+            return JsonResponse({'success': False, 'error': 'Only payments on hold can be disputed'})
+        except RETRYABLE_ERRORS:
+            # Free the idempotency key so the client can retry
+            raise
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
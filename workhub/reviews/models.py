@@ -24,6 +24,9 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['job', 'reviewer'] 
+        indexes = [
+            models.Index(fields=['reviewee', 'is_public'], name='review_reviewee_public_idx'),
+        ]
     
     def __str__(self):
         return f"Review for {self.reviewee.username} by {self.reviewer.username} - {self.rating} stars"
@@ -32,67 +32,9 @@ function showNotification(type, title, message) {
     }
 }
 
-/**
- * Update navbar notification dot
- */
-function updateNavbarBadge(count) {
-    const navLinks = document.querySelectorAll('.navbar a[href*="inbox"]');
-    
-    navLinks.forEach(link => {
-        let dot = link.querySelector('.unread-dot');
-        
-        if (count > 0) {
-            if (!dot) {
-                dot = document.createElement('span');
-                dot.className = 'unread-dot';
-                link.appendChild(dot);
-            }
-        } else {
-            if (dot) {
-                dot.remove();
-            }
-        }
-    });
-}
-
-/**
- * Check unread message count
- */
-function checkUnreadMessages() {
-    const inboxLink = document.querySelector('.navbar a[href*="inbox"]');
-    if (!inboxLink) return;
-    
-    fetch('/api/unread-count/', {
-        method: 'GET',
-        headers: {
-            'X-Requested-With': 'XMLHttpRequest',
-            'X-CSRFToken': csrftoken
-        }
-    })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error('Network response was not ok');
-        }
-        return response.json();
-    })
-    .then(data => {
-        updateNavbarBadge(data.unread_count);
-    })
-    .catch(error => {
-        // Silently fail
-    });
-}
-
 document.addEventListener('DOMContentLoaded', function() {
     csrftoken = getCookie('csrftoken');
     
-    // Only start checking for authenticated users
-    const inboxLink = document.querySelector('.navbar a[href*="inbox"]');
-    if (inboxLink) {
-        checkUnreadMessages();
-        setInterval(checkUnreadMessages, 5000);
-    }
-    
     const registerForm = document.getElementById('registerForm');
     if (registerForm) {
         registerForm.addEventListener('submit', async function(e) {
@@ -9,14 +9,18 @@ const MessagingApp = (function() {
     let config = {
         unreadCountUrl: null,
         checkNewMessagesUrl: null,
+        olderMessagesUrl: null,
+        eventsUrl: null,
         conversationId: null,
         currentPage: null,
         refreshInterval: 2000, // 2 seconds
         lastMessageId: null,
-        isActive: true
+        isActive: true,
+        pendingRefresh: false
     };
 
     let intervals = [];
+    let unreadCount = 0;
 
     /**
      * Initialize the messaging app
@@ -38,8 +42,8 @@ const MessagingApp = (function() {
             initInboxPage();
         }
 
-        // Always check for unread count
-        startUnreadCountPolling();
+        // Have updates pushed, or poll for them where that is not possible
+        connectEvents();
 
         // Handle page visibility
         handlePageVisibility();
@@ -65,31 +69,32 @@ const MessagingApp = (function() {
         // Scroll to bottom on load
         scrollToBottom();
 
-        // Start polling for new messages
-        startNewMessagesPolling();
-
         // Handle form submission with AJAX
         setupAjaxMessageSubmit();
-    }
 
-    /**
-     * Initialize inbox page functionality
-     */
-    function initInboxPage() {
-        // Start polling for conversation updates
-        startInboxPolling();
+        // Load older messages on demand
+        setupLoadOlder();
     }
 
     /**
-     * Poll for unread message count
+     * Load the page of messages before the oldest one shown, from the
+     * button at the top of the thread or by scrolling up to it
      */
-    function startUnreadCountPolling() {
-        if (!config.unreadCountUrl) return;
+    function setupLoadOlder() {
+        const button = document.getElementById('load-older-btn');
+        const container = document.getElementById('messages-container');
+        if (!button || !container || !config.olderMessagesUrl) return;
+
+        let loading = false;
+
+        const loadOlder = () => {
+            const cursor = button.getAttribute('data-cursor');
+            if (loading || !cursor) return;
 
-        const checkUnreadCount = () => {
-            if (!config.isActive) return;
+            loading = true;
+            button.disabled = true;
 
-            fetch(config.unreadCountUrl, {
+            fetch(`${config.olderMessagesUrl}?cursor=${encodeURIComponent(cursor)}`, {
                 method: 'GET',
                 headers: {
                     'X-Requested-With': 'XMLHttpRequest',
@@ -98,114 +103,263 @@ const MessagingApp = (function() {
             })
             .then(response => response.json())
             .then(data => {
-                updateUnreadBadge(data.unread_count);
+                if (!data.success) throw new Error(data.error);
+
+                // Keep the messages the user is looking at in place
+                const previousHeight = container.scrollHeight;
+                const holder = document.getElementById('load-older');
+                holder.insertAdjacentHTML('afterend', data.html);
+                container.scrollTop += container.scrollHeight - previousHeight;
+
+                button.setAttribute('data-cursor', data.next_cursor || '');
+                if (!data.next_cursor) {
+                    holder.remove();
+                }
             })
-            .catch(error => console.error('Error checking unread count:', error));
+            .catch(error => console.error('Error loading older messages:', error))
+            .finally(() => {
+                loading = false;
+                button.disabled = false;
+            });
+        };
+
+        button.addEventListener('click', loadOlder);
+
+        container.addEventListener('scroll', function() {
+            if (container.scrollTop < 50) loadOlder();
+        });
+    }
+
+    /**
+     * Initialize inbox page functionality
+     */
+    function initInboxPage() {
+        // Conversation updates arrive through connectEvents()
+    }
+
+    /**
+     * Listen to the server's event stream for new messages and unread
+     * count changes, falling back to polling without one
+     */
+    function connectEvents() {
+        if (!config.eventsUrl || typeof window.EventSource === 'undefined') {
+            startPolling();
+            return;
+        }
+
+        const source = new EventSource(config.eventsUrl);
+
+        // Events sent while the stream was down are lost, so re-read the
+        // count every time it (re)connects
+        source.addEventListener('open', checkUnreadCount);
+
+        source.addEventListener('message', event => {
+            const data = JSON.parse(event.data);
+            refreshPage(data.conversation_id);
+        });
+
+        source.addEventListener('unread', event => {
+            const data = JSON.parse(event.data);
+            updateUnreadBadge(Math.max(0, unreadCount + data.delta));
+        });
+
+        source.addEventListener('resync', () => {
+            checkUnreadCount();
+            refreshPage(null);
+        });
+
+        source.addEventListener('error', () => {
+            // EventSource reconnects by itself unless the server refused the stream
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();
+            }
+        });
+
+        window.addEventListener('beforeunload', () => source.close());
+    }
+
+    /**
+     * Bring the page up to date after a message in conversationId, or in
+     * any conversation when it is null
+     */
+    function refreshPage(conversationId) {
+        if (config.currentPage === 'conversation') {
+            if (conversationId !== null && String(conversationId) !== String(config.conversationId)) return;
+        } else if (config.currentPage !== 'inbox') {
+            return;
+        }
+
+        // Opening the conversation marks it read, so wait for the user
+        if (!config.isActive) {
+            config.pendingRefresh = true;
+            return;
+        }
+
+        if (config.currentPage === 'conversation') {
+            checkNewMessages();
+        } else {
+            checkInboxUpdates();
+        }
+    }
+
+    /**
+     * Poll for everything the event stream would have pushed
+     */
+    function startPolling() {
+        startUnreadCountPolling();
+
+        if (config.currentPage === 'conversation') {
+            startNewMessagesPolling();
+        } else if (config.currentPage === 'inbox') {
+            startInboxPolling();
+        }
+    }
+
+    /**
+     * Fetch the unread message count
+     */
+    function checkUnreadCount() {
+        if (!config.unreadCountUrl) return;
+
+        fetch(config.unreadCountUrl, {
+            method: 'GET',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': getCSRFToken()
+            }
+        })
+        .then(response => response.json())
+        .then(data => {
+            updateUnreadBadge(data.unread_count);
+        })
+        .catch(error => console.error('Error checking unread count:', error));
+    }
+
+    /**
+     * Poll for unread message count
+     */
+    function startUnreadCountPolling() {
+        if (!config.unreadCountUrl) return;
+
+        const poll = () => {
+            if (config.isActive) checkUnreadCount();
         };
 
         // Check immediately
         checkUnreadCount();
 
         // Then poll every 2 seconds
-        const intervalId = setInterval(checkUnreadCount, config.refreshInterval);
+        const intervalId = setInterval(poll, config.refreshInterval);
         intervals.push(intervalId);
     }
 
     /**
-     * Poll for new messages in conversation
+     * Fetch the conversation and append messages not shown yet
      */
-    function startNewMessagesPolling() {
+    function checkNewMessages() {
         if (!config.checkNewMessagesUrl) return;
 
-        const checkNewMessages = () => {
-            if (!config.isActive) return;
-
-            fetch(config.checkNewMessagesUrl, {
-                method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'X-CSRFToken': getCSRFToken()
-                }
-            })
-            .then(response => response.text())
-            .then(html => {
-                // Parse the HTML response
-                const parser = new DOMParser();
-                const doc = parser.parseFromString(html, 'text/html');
-                const newMessages = doc.querySelectorAll('[data-message-id]');
+        fetch(config.checkNewMessagesUrl, {
+            method: 'GET',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': getCSRFToken()
+            }
+        })
+        .then(response => response.text())
+        .then(html => {
+            // Parse the HTML response
+            const parser = new DOMParser();
+            const doc = parser.parseFromString(html, 'text/html');
+            const newMessages = doc.querySelectorAll('[data-message-id]');
+            
+            if (newMessages.length > 0) {
+                const lastNewMessage = newMessages[newMessages.length - 1];
+                const lastNewMessageId = lastNewMessage.getAttribute('data-message-id');
                 
-                if (newMessages.length > 0) {
-                    const lastNewMessage = newMessages[newMessages.length - 1];
-                    const lastNewMessageId = lastNewMessage.getAttribute('data-message-id');
+                // Check if there are new messages
+                if (config.lastMessageId !== lastNewMessageId) {
+                    // Find messages newer than our last message
+                    let foundNew = false;
+                    const container = document.getElementById('messages-container');
                     
-                    // Check if there are new messages
-                    if (config.lastMessageId !== lastNewMessageId) {
-                        // Find messages newer than our last message
-                        let foundNew = false;
-                        const container = document.getElementById('messages-container');
+                    Array.from(newMessages).forEach(messageEl => {
+                        const messageId = messageEl.getAttribute('data-message-id');
                         
-                        Array.from(newMessages).forEach(messageEl => {
-                            const messageId = messageEl.getAttribute('data-message-id');
+                        if (foundNew || Number(messageId) > Number(config.lastMessageId)) {
+                            foundNew = true;
                             
-                            if (foundNew || messageId > config.lastMessageId) {
-                                foundNew = true;
-                                
-                                // Check if message already exists
-                                if (!document.querySelector(`[data-message-id="${messageId}"]`)) {
-                                    // Clone and append the message
-                                    const clonedMessage = messageEl.cloneNode(true);
-                                    container.appendChild(clonedMessage);
-                                }
+                            // Check if message already exists
+                            if (!document.querySelector(`[data-message-id="${messageId}"]`)) {
+                                // Clone and append the message
+                                const clonedMessage = messageEl.cloneNode(true);
+                                container.appendChild(clonedMessage);
                             }
-                        });
-                        
-                        config.lastMessageId = lastNewMessageId;
-                        scrollToBottom(true);
-                    }
+                        }
+                    });
+                    
+                    config.lastMessageId = lastNewMessageId;
+                    scrollToBottom(true);
                 }
-            })
-            .catch(error => console.error('Error checking new messages:', error));
+            }
+        })
+        .catch(error => console.error('Error checking new messages:', error));
+    }
+
+    /**
+     * Poll for new messages in conversation
+     */
+    function startNewMessagesPolling() {
+        if (!config.checkNewMessagesUrl) return;
+
+        const poll = () => {
+            if (config.isActive) checkNewMessages();
         };
 
-        const intervalId = setInterval(checkNewMessages, config.refreshInterval);
+        const intervalId = setInterval(poll, config.refreshInterval);
         intervals.push(intervalId);
     }
 
     /**
-     * Poll for inbox updates
+     * Fetch the inbox and swap in the conversation list if it changed
      */
-    function startInboxPolling() {
-        const checkInboxUpdates = () => {
-            if (!config.isActive) return;
-
-            // Reload the page content to update conversations
-            const currentUrl = window.location.href;
+    function checkInboxUpdates() {
+        // Reload the page content to update conversations
+        const currentUrl = window.location.href;
+        
+        fetch(currentUrl, {
+            method: 'GET',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': getCSRFToken()
+            }
+        })
+        .then(response => response.text())
+        .then(html => {
+            const parser = new DOMParser();
+            const doc = parser.parseFromString(html, 'text/html');
+            const newConversationsList = doc.getElementById('conversations-list');
+            const currentConversationsList = document.getElementById('conversations-list');
             
-            fetch(currentUrl, {
-                method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'X-CSRFToken': getCSRFToken()
+            if (newConversationsList && currentConversationsList) {
+                // Only update if content has changed
+                if (newConversationsList.innerHTML !== currentConversationsList.innerHTML) {
+                    currentConversationsList.innerHTML = newConversationsList.innerHTML;
                 }
-            })
-            .then(response => response.text())
-            .then(html => {
-                const parser = new DOMParser();
-                const doc = parser.parseFromString(html, 'text/html');
-                const newConversationsList = doc.getElementById('conversations-list');
-                const currentConversationsList = document.getElementById('conversations-list');
-                
-                if (newConversationsList && currentConversationsList) {
-                    // Only update if content has changed
-                    if (newConversationsList.innerHTML !== currentConversationsList.innerHTML) {
-                        currentConversationsList.innerHTML = newConversationsList.innerHTML;
-                    }
-                }
-            })
-            .catch(error => console.error('Error updating inbox:', error));
+            }
+        })
+        .catch(error => console.error('Error updating inbox:', error));
+    }
+
+    /**
+     * Poll for inbox updates
+     */
+    function startInboxPolling() {
+        const poll = () => {
+            if (config.isActive) checkInboxUpdates();
         };
 
-        const intervalId = setInterval(checkInboxUpdates, config.refreshInterval);
+        const intervalId = setInterval(poll, config.refreshInterval);
         intervals.push(intervalId);
     }
 
@@ -213,6 +367,8 @@ const MessagingApp = (function() {
      * Update unread badge in navbar and inbox
      */
     function updateUnreadBadge(count) {
+        unreadCount = count;
+
         // Update inbox badge
         const inboxBadge = document.getElementById('unread-badge');
         if (inboxBadge) {
@@ -416,10 +572,12 @@ const MessagingApp = (function() {
     function handlePageVisibility() {
         document.addEventListener('visibilitychange', function() {
             config.isActive = !document.hidden;
+            if (config.isActive) refreshPending();
         });
 
         window.addEventListener('focus', function() {
             config.isActive = true;
+            refreshPending();
         });
 
         window.addEventListener('blur', function() {
@@ -427,6 +585,16 @@ const MessagingApp = (function() {
         });
     }
 
+    /**
+     * Apply a refresh that arrived while the page was in the background
+     */
+    function refreshPending() {
+        if (!config.pendingRefresh) return;
+
+        config.pendingRefresh = false;
+        refreshPage(null);
+    }
+
     /**
      * Get CSRF token
      */
@@ -0,0 +1,49 @@
+import functools
+import logging
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than it declared"""
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the queries passing through it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """Declare how many database queries a view may run.
+    
+    Going over budget raises QueryBudgetExceeded when QUERY_BUDGET_STRICT is
+    on (use it in tests) and logs a warning otherwise. Queries run while the
+    response is rendered count too.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view_func(request, *args, **kwargs)
+                # Render lazy responses here so their queries are counted
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+            
+            if counter.count > max_queries:
+                message = f'{view_func.__name__} ran {counter.count} queries, its budget is {max_queries}'
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            
+            return response
+        return wrapper
+    return decorator
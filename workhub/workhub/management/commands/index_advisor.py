@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from accounts.stats import compute_user_stats
+from jobs.models import Job
+from jobs.pagination import paginate_keyset
+from jobs.search import job_facets, job_filters, matching_jobs, search_job_ids
+from messaging.models import ConversationMembership
+from messaging.pages import inbox_page, message_page
+from payments import history, rollups
+
+
+def hot_paths(user, query):
+    """The busiest pages, each calling the same functions its view calls"""
+    job_page_size = getattr(settings, 'JOB_BOARD_PAGE_SIZE', 20)
+    open_jobs = Job.objects.filter(status='open')
+    payments, field = history.payments_for(user, history.is_freelancer(user))
+
+    paths = {
+        'job_list: browse': lambda: paginate_keyset(open_jobs.select_related('client'), None, job_page_size),
+        'job_list: search': lambda: search_job_ids(query, jobs=open_jobs, limit=job_page_size),
+        'job_list: facets': lambda: job_facets(matching_jobs(query), job_filters()),
+        'inbox': lambda: inbox_page(user, None),
+        'wallet: totals': lambda: rollups.payment_totals(user),
+        'payment_history: page': lambda: paginate_keyset(
+            payments.select_related('job', 'from_user', 'to_user'), None,
+            getattr(settings, 'PAYMENT_HISTORY_PAGE_SIZE', 25), field=field,
+        ),
+        'dashboard: stats': lambda: compute_user_stats(user),
+    }
+
+    membership = ConversationMembership.objects.filter(user=user).order_by('-last_activity_at').first()
+    if membership:
+        paths['conversation_detail: messages'] = lambda: message_page(membership.conversation)
+    return paths
+
+
+class StatementRecorder:
+    """Database execute wrapper that keeps the SELECTs passing through it"""
+
+    def __init__(self):
+        # The first parameters seen for each statement, repeats share a plan
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.setdefault(sql, params)
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def full_scans(plan):
+    """Return the plan lines that read a whole table"""
+    lines = []
+    for line in plan.splitlines():
+        # SQLite reports "SCAN <table>" for full scans and "SCAN <table> USING INDEX" otherwise
+        if ' SCAN ' in f' {line} ' and 'USING' not in line and 'CONSTANT ROW' not in line:
+            lines.append(line.strip())
+        # PostgreSQL
+        elif 'Seq Scan' in line:
+            lines.append(line.strip())
+    return lines
+
+
+class Command(BaseCommand):
+    help = 'Run the queries behind the busiest pages through EXPLAIN and flag full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='User whose pages are explained, the first user by default')
+        parser.add_argument('--query', default='website', help='Search text for the job board paths')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full query plan for every statement')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error if any full scan is found')
+
+    def handle(self, *args, **options):
+        if options['user_id'] is None:
+            user = User.objects.order_by('id').first()
+            if user is None:
+                raise CommandError('There are no users to explain pages for, create one first')
+        else:
+            user = User.objects.filter(id=options['user_id']).first()
+            if user is None:
+                raise CommandError(f"User {options['user_id']} does not exist")
+
+        flagged = 0
+        for name, run in hot_paths(user, options['query']).items():
+            recorder = StatementRecorder()
+            # Some paths write (a missing wallet, say), none of it is kept
+            with transaction.atomic():
+                with connection.execute_wrapper(recorder):
+                    run()
+                plans = [explain(sql, params) for sql, params in recorder.statements.items()]
+                transaction.set_rollback(True)
+
+            scans = [line for plan in plans for line in full_scans(plan)]
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'FULL SCAN  {name}'))
+                for line in scans:
+                    self.stdout.write(f'           {line}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK         {name}'))
+
+            if options['verbose_plans']:
+                for (sql, params), plan in zip(recorder.statements.items(), plans):
+                    self.stdout.write(sql)
+                    self.stdout.write(plan)
+                    self.stdout.write('')
+
+        if flagged and options['strict']:
+            raise CommandError(f'{flagged} path(s) do full table scans')
+
+        self.stdout.write(f'{flagged} path(s) flagged')
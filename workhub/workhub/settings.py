@@ -37,6 +37,8 @@ INSTALLED_APPS = [
     'payments',
     'reviews',
     'messaging',
+    # Project-wide management commands
+    'workhub',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -67,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'messaging.context_processors.messaging_context',
             ],
         },
     },
@@ -128,7 +131,164 @@ STATICFILES_DIRS = []
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Work files and message attachments are stored once per distinct content
+# under media/cas/. See workhub/storage.py.
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'content': {
+        'BACKEND': 'workhub.storage.ContentAddressedStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Job board
+# Number of ranked results returned by the search API, and the number of
+# jobs per page when browsing or searching the board
+
+JOB_SEARCH_MAX_RESULTS = 50
+
+JOB_BOARD_PAGE_SIZE = 20
+
+# Dashboard
+# When enabled the dashboard reads a denormalized UserStats row that is
+# refreshed whenever a job, application or payment changes
+
+DASHBOARD_USE_USER_STATS = False
+
+# Query budgets
+# Views decorated with @query_budget raise instead of logging when they run
+# too many queries. Turn this on in tests.
+
+QUERY_BUDGET_STRICT = False
+
+# Seconds the public part of a job's detail payload stays cached. Saving the
+# job invalidates it immediately.
+
+JOB_DETAIL_CACHE_TIMEOUT = 300
+
+# Seconds the job board's facet counts for a search are reused by its later
+# pages. The first page always counts them afresh.
+
+JOB_FACETS_CACHE_TIMEOUT = 60
+
+# How many job ids one batch lookup of applied jobs may ask about
+
+APPLIED_JOBS_MAX_IDS = 200
+
+# Work submission uploads
+# Largest single work file, the largest chunk the resumable upload API
+# accepts in one request, and how many uploads in progress each process keeps
+# a running hash for
+
+WORK_FILE_MAX_SIZE = 50 * 1024 * 1024
+
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+UPLOAD_HASH_CACHE_SIZE = 256
+
+# Hours a stored file must be unreferenced before collect_media_garbage
+# removes it, so uploads whose rows are not yet committed are kept
+
+MEDIA_GC_GRACE_HOURS = 24
+
+# Wallet ledger
+# A balance snapshot is written every this many transactions per wallet, so
+# rebuilding a balance reads at most this many ledger entries
+
+WALLET_SNAPSHOT_INTERVAL = 100
+
+# Seconds a payment request's Idempotency-Key is remembered and its first
+# response replayed. Expired keys are removed by purge_idempotency_keys.
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Seconds a request holds its Idempotency-Key while it runs. A retry that
+# finds the key still in progress after this takes it over, so a request that
+# crashed does not block its key until it expires. Keep it above the longest
+# a request may run, or a slow request's retry would run it a second time.
+
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+# Payments per page of payment history. The export endpoint streams the
+# whole history regardless.
+
+PAYMENT_HISTORY_PAGE_SIZE = 25
+
+# Most withdrawals paid out in one batch by process_payouts
+
+PAYOUT_BATCH_SIZE = 500
+
+# Days a held job payment waits before release_due_payments pays it to the
+# freelancer, unless it is released, refunded or disputed first. None turns
+# automatic release off for new holds.
+
+ESCROW_AUTO_RELEASE_DAYS = 14
+
+# Most held payments released in one batch by release_due_payments
+
+ESCROW_RELEASE_BATCH_SIZE = 500
+
+# Wallet ids checked together by one reconcile_wallets worker
+
+RECONCILE_SHARD_SIZE = 10000
+
+# Exchange rate lookups kept in memory per process, keyed by currency pair
+# and day, see payments.fx
+
+FX_RATE_CACHE_SIZE = 4096
+
+# Payments outbox
+# Events handled per batch by drain_outbox, days handled events are kept, and
+# seconds between purges of them while drain_outbox --loop runs.
+# Draining on commit runs the handlers in the request right after it commits,
+# for development without a drain_outbox worker.
+
+OUTBOX_BATCH_SIZE = 100
+
+OUTBOX_RETENTION_DAYS = 7
+
+OUTBOX_PURGE_INTERVAL = 60 * 60
+
+OUTBOX_DRAIN_ON_COMMIT = DEBUG
+
+# Conversations per page of the messaging inbox
+
+INBOX_PAGE_SIZE = 50
+
+# Real-time messaging, see messaging.realtime
+# Events are streamed to pages served over ASGI (workhub.asgi). Under WSGI
+# (workhub.wsgi) pages poll the unread count instead, since an open stream
+# would hold a worker. The broker carries events between processes. InMemoryBroker only reaches
+# streams served by the same process, so use a shared broker with more than
+# one worker. Streams send a keepalive comment after this many idle seconds
+# and drop events beyond the queue size for a client that falls behind.
+
+MESSAGING_BROKER = 'messaging.realtime.InMemoryBroker'
+
+MESSAGING_EVENTS_KEEPALIVE = 15
+
+MESSAGING_EVENTS_QUEUE_SIZE = 100
+
+# Messages shown when a conversation opens and per "load older" request
+
+CONVERSATION_PAGE_SIZE = 50
+
+# Group conversations
+# A message updates its members' inbox rows this many at a time. Groups with
+# more members than the maximum are read on demand instead, see
+# messaging.delivery.
+
+MESSAGING_FANOUT_BATCH_SIZE = 200
+
+MESSAGING_FANOUT_MAX_MEMBERS = 1000
@@ -0,0 +1,97 @@
+"""Content-addressed file storage.
+
+Files are stored under the SHA-256 of their bytes, so the same content
+uploaded as a chat attachment and again as a work file is only written
+once. The name passed in is only used for its extension; callers keep the
+original file name on their own model.
+
+Several rows may point at one stored file, so delete() never removes
+content. Unreferenced files are swept by the collect_media_garbage command,
+which spares files modified within its grace window. Saving content that is
+already stored refreshes the file's mtime, so an old unreferenced file that
+a new row is about to reuse is not swept before that row commits.
+"""
+import hashlib
+import os
+from django.core.files.storage import FileSystemStorage, storages
+
+CAS_PREFIX = 'cas'
+
+
+def content_name(digest, extension=''):
+    """Storage name for content with the given hex digest"""
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+
+def hash_content(content):
+    """SHA-256 of a Django File, read in chunks and rewound afterwards"""
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their content hash"""
+
+    def get_available_name(self, name, max_length=None):
+        # Identical names mean identical content, so never add a suffix. If
+        # another request wrote the same content first, stop and reuse it.
+        if name.startswith(f'{CAS_PREFIX}/') and self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None) or hash_content(content)
+        name = content_name(digest, os.path.splitext(name)[1])
+        if self._touch(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            self._touch(name)
+            return name
+
+    def _touch(self, name):
+        """Refresh the mtime of stored content, False if it is not stored"""
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, name):
+        # Other rows may still reference this content
+        if name and name.startswith(f'{CAS_PREFIX}/'):
+            return
+        super().delete(name)
+
+
+def content_storage():
+    """Storage used by file fields that hold user uploads"""
+    return storages['content']
+
+
+def content_fields():
+    """Every (model, field) pair whose files live in content storage"""
+    from django.apps import apps
+    from django.db.models import FileField
+
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field
+
+
+def reference_counts():
+    """Map each stored name to the number of rows that reference it"""
+    counts = {}
+    for model, field in content_fields():
+        names = model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+        for name in names.values_list(field.name, flat=True).iterator(chunk_size=2000):
+            counts[name] = counts.get(name, 0) + 1
+    return counts
@@ -0,0 +1,26 @@
+import io
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+
+class IndexAdvisorTests(TestCase):
+    def advise(self, *args):
+        output = io.StringIO()
+        call_command('index_advisor', *args, stdout=output)
+        return output.getvalue()
+
+    def test_explains_the_first_user_by_default(self):
+        User.objects.create_user('someone')
+
+        output = self.advise()
+
+        self.assertIn('inbox', output)
+        self.assertIn('path(s) flagged', output)
+
+    def test_missing_users_are_reported(self):
+        with self.assertRaisesMessage(CommandError, 'There are no users'):
+            self.advise()
+        User.objects.create_user('someone')
+        with self.assertRaisesMessage(CommandError, 'User 999 does not exist'):
+            self.advise('--user-id', '999')